@@ -385,6 +385,21 @@ $$ LANGUAGE plpgsql;
 -- SPEAKER VERIFICATION FUNCTIONS
 -- ============================================================================
 
+-- Update voice profile timestamp trigger (drives incremental worker profile syncs)
+CREATE OR REPLACE FUNCTION update_voice_profile_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_update_voice_profile_updated_at ON voice_profiles;
+CREATE TRIGGER trigger_update_voice_profile_updated_at
+    BEFORE UPDATE ON voice_profiles
+    FOR EACH ROW
+    EXECUTE FUNCTION update_voice_profile_updated_at();
+
 -- Auto-assign workout based on voice match
 CREATE OR REPLACE FUNCTION auto_assign_workout_to_user(
     p_audio_file_id UUID,
@@ -74,9 +74,13 @@ CREATE TABLE IF NOT EXISTS voice_profiles (
     confidence_score DECIMAL(5,4) NOT NULL,
     created_from_workout_id UUID,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     is_active BOOLEAN DEFAULT true
 );
 
+-- Change tracking for worker-side profile caches (added after 006)
+ALTER TABLE voice_profiles ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
 CREATE TABLE IF NOT EXISTS speaker_verifications (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     audio_file_id UUID NOT NULL,
@@ -130,18 +134,42 @@ CREATE TABLE IF NOT EXISTS audio_files (
     session_id UUID,
     voice_embedding FLOAT8[],
     voice_extracted BOOLEAN DEFAULT false,
-    voice_quality_score DECIMAL(5,4)
+    voice_quality_score DECIMAL(5,4),
+    lease_owner VARCHAR(255),
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    attempt_count INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    processing_stage VARCHAR(20),
+    extracted_workout JSONB
 );
 
+-- Worker backlog leases (added after 009)
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(255);
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+-- Retry budget and dead-lettering (added after 010)
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS attempt_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Stage checkpoints for resuming retries (added after 011)
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS processing_stage VARCHAR(20);
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS extracted_workout JSONB;
+
 CREATE TABLE IF NOT EXISTS transcriptions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     audio_file_id UUID NOT NULL REFERENCES audio_files(id) ON DELETE CASCADE,
     raw_text TEXT NOT NULL,
     confidence_score DECIMAL(5,4),
     processing_time_ms INTEGER,
+    decoding_strategy VARCHAR(20),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Decoding policy used per transcription (added after 007)
+ALTER TABLE transcriptions ADD COLUMN IF NOT EXISTS decoding_strategy VARCHAR(20);
+
 -- ============================================================================
 -- WORKOUT SESSIONS
 -- ============================================================================
@@ -158,10 +186,20 @@ CREATE TABLE IF NOT EXISTS workout_sessions (
     session_status VARCHAR(50) DEFAULT 'pending',
     claim_status VARCHAR(50) DEFAULT 'unclaimed',
     notes TEXT,
+    partial_workout JSONB,
+    lease_owner VARCHAR(255),
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Incremental session state (added after 008)
+ALTER TABLE workout_sessions ADD COLUMN IF NOT EXISTS partial_workout JSONB;
+
+-- Worker backlog leases (added after 009)
+ALTER TABLE workout_sessions ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(255);
+ALTER TABLE workout_sessions ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
 CREATE TABLE IF NOT EXISTS session_audio_files (
     session_id UUID NOT NULL REFERENCES workout_sessions(id) ON DELETE CASCADE,
     audio_file_id UUID NOT NULL REFERENCES audio_files(id) ON DELETE CASCADE,
@@ -337,6 +375,7 @@ CREATE INDEX IF NOT EXISTS idx_app_users_active ON app_users(is_active) WHERE is
 -- Voice profiles indexes
 CREATE INDEX IF NOT EXISTS idx_voice_profiles_user_id ON voice_profiles(user_id);
 CREATE INDEX IF NOT EXISTS idx_voice_profiles_active ON voice_profiles(is_active) WHERE is_active = true;
+CREATE INDEX IF NOT EXISTS idx_voice_profiles_updated_at ON voice_profiles(updated_at);
 
 -- Device indexes
 CREATE INDEX IF NOT EXISTS idx_user_devices_user_id ON user_devices(user_id);
@@ -355,6 +394,7 @@ CREATE INDEX IF NOT EXISTS idx_audio_files_upload_timestamp ON audio_files(uploa
 CREATE INDEX IF NOT EXISTS idx_audio_files_transcription_status ON audio_files(transcription_status);
 CREATE INDEX IF NOT EXISTS idx_audio_files_session_id ON audio_files(session_id);
 CREATE INDEX IF NOT EXISTS idx_audio_files_voice_extracted ON audio_files(voice_extracted);
+CREATE INDEX IF NOT EXISTS idx_audio_files_lease_owner ON audio_files(lease_owner) WHERE lease_owner IS NOT NULL;
 
 -- Transcriptions indexes
 CREATE INDEX IF NOT EXISTS idx_transcriptions_audio_file_id ON transcriptions(audio_file_id);
@@ -364,6 +404,7 @@ CREATE INDEX IF NOT EXISTS idx_workout_sessions_user_id ON workout_sessions(user
 CREATE INDEX IF NOT EXISTS idx_workout_sessions_date ON workout_sessions(session_date);
 CREATE INDEX IF NOT EXISTS idx_workout_sessions_status ON workout_sessions(session_status);
 CREATE INDEX IF NOT EXISTS idx_workout_sessions_claim_status ON workout_sessions(claim_status);
+CREATE INDEX IF NOT EXISTS idx_workout_sessions_lease_owner ON workout_sessions(lease_owner) WHERE lease_owner IS NOT NULL;
 CREATE INDEX IF NOT EXISTS idx_session_audio_files_session_id ON session_audio_files(session_id);
 CREATE INDEX IF NOT EXISTS idx_session_audio_files_audio_file_id ON session_audio_files(audio_file_id);
 
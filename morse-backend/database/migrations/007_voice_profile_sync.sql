@@ -0,0 +1,24 @@
+-- Voice profile change tracking
+-- Lets workers keep an in-memory profile cache and sync only rows that changed
+
+ALTER TABLE voice_profiles ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+
+-- Existing rows were last changed when they were created
+UPDATE voice_profiles SET updated_at = created_at WHERE created_at IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_voice_profiles_updated_at ON voice_profiles(updated_at);
+
+-- Bump updated_at on every change (e.g. deactivation) so incremental syncs see it
+CREATE OR REPLACE FUNCTION update_voice_profile_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_update_voice_profile_updated_at ON voice_profiles;
+CREATE TRIGGER trigger_update_voice_profile_updated_at
+    BEFORE UPDATE ON voice_profiles
+    FOR EACH ROW
+    EXECUTE FUNCTION update_voice_profile_updated_at();
@@ -0,0 +1,5 @@
+-- Record how each transcription was decoded
+-- 'beam' (beam search throughout), 'greedy' or 'greedy+beam' (adaptive decoding
+-- that re-ran beam search on low-confidence segments)
+
+ALTER TABLE transcriptions ADD COLUMN IF NOT EXISTS decoding_strategy VARCHAR(20);
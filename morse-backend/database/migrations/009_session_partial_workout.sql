@@ -0,0 +1,5 @@
+-- Incremental session processing
+-- Each recording's extracted exercises are merged into this JSON state as the
+-- recording is processed; finishing the session only has to read it back
+
+ALTER TABLE workout_sessions ADD COLUMN IF NOT EXISTS partial_workout JSONB;
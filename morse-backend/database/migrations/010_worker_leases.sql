@@ -0,0 +1,13 @@
+-- Backlog leases for running several worker replicas
+-- Workers claim pending audio files and sessions with FOR UPDATE SKIP LOCKED and
+-- stamp them with their worker id and a lease expiry. A live worker keeps renewing
+-- its leases; rows whose lease lapsed (the worker died) can be claimed again
+
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(255);
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+ALTER TABLE workout_sessions ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(255);
+ALTER TABLE workout_sessions ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_audio_files_lease_owner ON audio_files(lease_owner) WHERE lease_owner IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_workout_sessions_lease_owner ON workout_sessions(lease_owner) WHERE lease_owner IS NOT NULL;
@@ -0,0 +1,9 @@
+-- Retry budget for failed audio files
+-- Every claim of a file counts as an attempt. A failed attempt schedules the next
+-- one with exponential backoff (next_attempt_at); once a file has used up its
+-- attempts it is moved to transcription_status = 'dead_letter' and no longer
+-- picked up by the backlog
+
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS attempt_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS last_error TEXT;
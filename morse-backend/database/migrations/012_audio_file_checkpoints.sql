@@ -0,0 +1,9 @@
+-- Per-file stage checkpoints
+-- processing_stage is the last pipeline stage a file got through
+-- ('transcribed', 'extracted', 'saved', 'voice_embedded'). A retry resumes after
+-- it, reusing the stored transcription, workout and voice embedding;
+-- extracted_workout keeps an LLM extraction whose save failed so it is not
+-- requested again
+
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS processing_stage VARCHAR(20);
+ALTER TABLE audio_files ADD COLUMN IF NOT EXISTS extracted_workout JSONB;
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Latency/WER benchmark for the transcription engines.
+
+Runs every engine over the "Sample Recording" clips with the worker's
+TRANSCRIBE_OPTIONS and reports load time, per-clip latency, real-time
+factor and word error rate. Each clip is decoded once up front, so only
+model time is measured.
+
+WER is computed against --references, a JSON file mapping clip file name
+to its reference transcript. Without it the first engine's output is the
+reference, which makes the other rows an agreement rate with that engine.
+
+Usage:
+    python benchmarks/transcription_benchmark.py
+    python benchmarks/transcription_benchmark.py --engines whisper faster-whisper --model small
+    python benchmarks/transcription_benchmark.py --engines whisper --decoding beam adaptive
+    WHISPER_COMPUTE_TYPE=int8 python benchmarks/transcription_benchmark.py --references refs.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from audio_loader import load_audio
+from transcription_engine import create_transcription_engine
+
+DEFAULT_CLIPS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', '..', 'Sample Recording')
+AUDIO_EXTENSIONS = ('.m4a', '.mp3', '.wav', '.webm', '.ogg', '.flac')
+
+def normalize_words(text: str):
+    return re.sub(r"[^a-z0-9' ]+", ' ', text.lower()).split()
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+def confidence(result) -> float:
+    """The confidence score WhisperTranscriber stores, from mean segment avg_logprob"""
+    logprobs = [segment['avg_logprob'] for segment in result.get('segments', []) if 'avg_logprob' in segment]
+    if not logprobs:
+        return 0.0
+    return max(0.0, min(1.0, (sum(logprobs) / len(logprobs) + 1.0) / 2.0))
+
+def load_clips(directory: str):
+    clips = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(AUDIO_EXTENSIONS):
+            clips.append((name, load_audio(os.path.join(directory, name))))
+    return clips
+
+def run_engine(engine, decoding: str, clips, repeats: int):
+    transcribe = engine.transcribe_adaptive if decoding == 'adaptive' else engine.transcribe
+
+    # Warm-up so one-off allocations are not charged to the first clip
+    transcribe(clips[0][1].samples)
+
+    results = {}
+    for name, audio in clips:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = transcribe(audio.samples)
+            times.append(time.perf_counter() - start)
+        results[name] = {
+            'text': result['text'].strip(),
+            'seconds': float(np.median(times)),
+            'confidence': confidence(result),
+            'strategy': result.get('decoding_strategy', 'beam')
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--engines', nargs='+', default=['whisper', 'faster-whisper'])
+    parser.add_argument('--model', default=os.getenv('WHISPER_MODEL', 'base'))
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--threads', type=int, default=int(os.getenv('WHISPER_TORCH_THREADS', 0)))
+    parser.add_argument('--clips', default=DEFAULT_CLIPS)
+    parser.add_argument('--references', help='JSON file mapping clip file name to reference transcript')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--decoding', nargs='+', default=['beam'], choices=['beam', 'adaptive'])
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    if not clips:
+        sys.exit(f"No audio clips found in {args.clips}")
+    total_audio = sum(audio.duration_seconds for _, audio in clips)
+    print(f"{len(clips)} clips, {total_audio:.1f}s of audio, model '{args.model}' on {args.device}")
+
+    references = None
+    if args.references:
+        with open(args.references) as f:
+            references = json.load(f)
+
+    for engine_name in args.engines:
+        start = time.perf_counter()
+        engine = create_transcription_engine(engine_name, args.model, args.device, args.threads)
+        load_seconds = time.perf_counter() - start
+
+        for decoding in args.decoding:
+            label = f"{engine_name}/{decoding}"
+            results = run_engine(engine, decoding, clips, args.repeats)
+            if references is None:
+                references = {name: result['text'] for name, result in results.items()}
+                print(f"(no --references given: WER is measured against {label})")
+
+            print(f"\n{label} (load {load_seconds:.1f}s)")
+            print(f"  {'clip':<28}{'audio s':>9}{'latency s':>11}{'RTF':>7}{'WER':>7}{'conf':>7}  strategy")
+            latencies, total_errors, total_words = [], 0.0, 0
+            for name, audio in clips:
+                result = results[name]
+                reference = references.get(name, '')
+                wer = word_error_rate(reference, result['text'])
+                words = len(normalize_words(reference))
+                latencies.append(result['seconds'])
+                total_errors += wer * words
+                total_words += words
+                print(f"  {name:<28}{audio.duration_seconds:>9.1f}{result['seconds']:>11.2f}"
+                      f"{result['seconds'] / max(audio.duration_seconds, 1e-6):>7.2f}{wer:>7.3f}"
+                      f"{result['confidence']:>7.3f}  {result['strategy']}")
+            print(f"  {'total':<28}{total_audio:>9.1f}{sum(latencies):>11.2f}"
+                  f"{sum(latencies) / max(total_audio, 1e-6):>7.2f}{total_errors / max(total_words, 1):>7.3f}"
+                  f"{'':>7}  median latency {float(np.median(latencies)):.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Recall/latency benchmark for the voice profile IVF index.
+
+Compares VoiceProfileIndex against the brute-force matrix scan used by
+SpeakerVerifier.verify_speaker on synthetic 192-dim ECAPA-like embeddings:
+every simulated user has a voice centroid, profiles and probes are noisy
+samples around it. Half of the probes are close repeats of an enrolled
+voice, so "link recall" measures recall on the probes whose brute-force best
+match clears the 0.95 auto-link threshold.
+
+Usage:
+    python benchmarks/voice_index_benchmark.py
+    python benchmarks/voice_index_benchmark.py --sizes 10000 100000 --nprobe 4 8 16
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from voice_index import VoiceProfileIndex
+
+DIM = 192
+LINK_THRESHOLD = 0.95
+
+def make_embeddings(num_profiles: int, num_queries: int, rng: np.random.Generator):
+    """Profiles clustered by user, plus probes drawn from enrolled users"""
+    num_users = max(1, num_profiles // 2)
+    centroids = rng.standard_normal((num_users, DIM), dtype=np.float32)
+    owners = rng.integers(0, num_users, num_profiles)
+    profiles = centroids[owners] + 0.6 * rng.standard_normal((num_profiles, DIM), dtype=np.float32)
+    # Ordinary probes: another utterance by an enrolled user
+    query_owners = owners[rng.integers(0, num_profiles, num_queries)]
+    queries = centroids[query_owners] + 0.6 * rng.standard_normal((num_queries, DIM), dtype=np.float32)
+    # Close repeats: near-copies of an enrolled profile, the auto-link case
+    repeats = rng.integers(0, num_profiles, num_queries // 2)
+    queries[:len(repeats)] = profiles[repeats] + 0.15 * rng.standard_normal((len(repeats), DIM), dtype=np.float32)
+    return profiles, queries
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000.0)
+
+def run(num_profiles: int, num_queries: int, nprobes, seed: int):
+    rng = np.random.default_rng(seed)
+    profiles, queries = make_embeddings(num_profiles, num_queries, rng)
+    ids = [str(i) for i in range(num_profiles)]
+
+    # Brute force: the normalized matrix scan verify_speaker performs
+    matrix = profiles / np.linalg.norm(profiles, axis=1, keepdims=True)
+    brute_best, brute_links, brute_times = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        probe = query / np.linalg.norm(query)
+        scores = matrix @ probe
+        best = int(np.argmax(scores))
+        brute_times.append(time.perf_counter() - start)
+        brute_best.append(best)
+        brute_links.append((scores[best] + 1.0) / 2.0 >= LINK_THRESHOLD)
+    link_count = max(1, sum(brute_links))
+
+    start = time.perf_counter()
+    index = VoiceProfileIndex(dim=DIM)
+    index.build(ids, profiles)
+    build_seconds = time.perf_counter() - start
+
+    print(f"\n{num_profiles:,} profiles, {num_queries} queries "
+          f"(index build {build_seconds:.1f}s, {index.get_index_info()['lists']} lists)")
+    print(f"  {sum(brute_links)} queries clear the {LINK_THRESHOLD} auto-link threshold")
+    print(f"  {'method':<16}{'recall@1':>10}{'link recall':>13}{'p50 ms':>10}{'p95 ms':>10}")
+    print(f"  {'brute force':<16}{1.0:>10.3f}{1.0:>13.3f}{percentile_ms(brute_times, 50):>10.3f}"
+          f"{percentile_ms(brute_times, 95):>10.3f}")
+
+    for nprobe in nprobes:
+        hits, link_hits, times = 0, 0, []
+        for query, expected, links in zip(queries, brute_best, brute_links):
+            start = time.perf_counter()
+            matches = index.search(query, top_k=1, n_probe=nprobe)
+            times.append(time.perf_counter() - start)
+            hit = bool(matches) and matches[0][0] == ids[expected]
+            hits += hit
+            link_hits += hit and links
+        print(f"  {'ivf nprobe=' + str(nprobe):<16}{hits / num_queries:>10.3f}{link_hits / link_count:>13.3f}"
+              f"{percentile_ms(times, 50):>10.3f}{percentile_ms(times, 95):>10.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, args.queries, args.nprobe, args.seed)
+
+if __name__ == '__main__':
+    main()
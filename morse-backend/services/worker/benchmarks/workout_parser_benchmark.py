@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Coverage/agreement benchmark for the rule-based fast-path workout parser.
+
+Coverage is the share of transcripts the parser is confident enough about
+to skip the LLM (confidence >= --min-confidence). Agreement is, over the
+covered transcripts, the share whose exercises match the reference
+extraction exactly: same exercises in the same order with the same sets,
+per-set reps and weights, duration and distance. A covered transcript that
+disagrees is a wrong answer the LLM would not have given, so agreement is
+the number to watch when lowering the threshold.
+
+References come from, in order of preference:
+  - the "expected" workout stored with each transcript in --transcripts
+  - a live LLM extraction (--llm, needs ANTHROPIC_API_KEY or GOOGLE_API_KEY)
+  - the built-in samples below, which carry hand-written expectations
+
+--transcripts is a JSON list of {"text": ..., "expected": {...}} objects
+(expected optional), or of plain strings.
+
+Usage:
+    python benchmarks/workout_parser_benchmark.py
+    python benchmarks/workout_parser_benchmark.py --min-confidence 0.7 --verbose
+    python benchmarks/workout_parser_benchmark.py --transcripts transcripts.json --llm
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from workout_parser import parse_workout
+from session_merge import exercise_key, per_set, set_count
+
+def strength(name, sets, reps, weight=None):
+    return {'exercise_name': name, 'sets': sets, 'reps': reps, 'weight_lbs': weight}
+
+def cardio(name, duration=None, distance=None):
+    return {'exercise_name': name, 'duration_minutes': duration, 'distance_miles': distance}
+
+SAMPLES = [
+    ("Bench press 185 pounds, 3 sets of 8 reps.", [strength('Bench Press', 3, [8, 8, 8], [185])]),
+    ("bench press 185 5 reps", [strength('Bench Press', 1, [5], [185])]),
+    ("bench press 185 5 reps then bench press 205 5 reps", [strength('Bench Press', 2, [5, 5], [185, 205])]),
+    ("Squats 225 for 5, 245 for 3.", [strength('Squats', 2, [5, 3], [225, 245])]),
+    ("Did three sets of ten squats at two twenty five.", [strength('Squats', 3, [10, 10, 10], [225])]),
+    ("Deadlift 315 for 5", [strength('Deadlifts', 1, [5], [315])]),
+    ("20 push-ups", [strength('Push-ups', 1, [20])]),
+    ("did some push-ups 3 sets 10 reps each", [strength('Push-ups', 3, [10, 10, 10])]),
+    ("squats with 185 pounds 4 sets", [strength('Squats', 4, None, [185])]),
+    ("5 sets 185lbs bench press 4 sets", [strength('Bench Press', 4, None, [185])]),
+    ("bench press 185 5 sets 8 reps", [strength('Bench Press', 5, [8] * 5, [185])]),
+    ("Overhead press 3x8 at 95 pounds.", [strength('Overhead Press', 3, [8, 8, 8], [95])]),
+    ("Pull-ups, 4 sets of 8.", [strength('Pull-ups', 4, [8] * 4)]),
+    ("Bicep curls 30 pounds 12 reps, then hammer curls 25 pounds 10 reps.",
+     [strength('Bicep Curls', 1, [12], [30]), strength('Hammer Curls', 1, [10], [25])]),
+    ("Ran 3 miles in 25 minutes.", [cardio('Running', 25, 3)]),
+    ("30 minutes on the bike", [cardio('Cycling', 30)]),
+    ("Rowing machine 2000 meters in about 8 minutes", [cardio('Rowing Machine', 8)]),
+    ("Lat pulldown 120 pounds 3 sets of 12, then seated cable rows 100 pounds 3 sets of 10",
+     [strength('Lat Pulldowns', 3, [12] * 3, [120]), strength('Seated Cable Rows', 3, [10] * 3, [100])]),
+    ("Leg day today. Started with squats, worked up to 275 for a triple, then leg press, "
+     "410 for 4 sets of 12, and finished with some calf raises.",
+     [strength('Squats', 1, [3], [275]), strength('Leg Press', 4, [12] * 4, [410]), strength('Calf Raises', None, None)]),
+    ("My shoulder was bugging me so I skipped overhead press and just did lateral raises with the 15s.",
+     [strength('Lateral Raises', None, None, [15])]),
+    ("Superset of dumbbell flyes and cable crossovers, three rounds, felt a good pump.",
+     [strength('Dumbbell Flyes', 3, None), strength('Cable Crossovers', 3, None)]),
+]
+
+def _number(value):
+    return round(float(value), 1) if value is not None else None
+
+def comparable(workout):
+    """Reduce a workout to what must agree, with [185] for 3 sets spread to [185, 185, 185]"""
+    exercises = []
+    for exercise in (workout or {}).get('exercises', []):
+        reps, weights = exercise.get('reps'), exercise.get('weight_lbs')
+        count = set_count(exercise) if (reps or weights or exercise.get('sets')) else 0
+        exercises.append((
+            exercise_key(exercise.get('exercise_name')),
+            count,
+            tuple(_number(rep) for rep in per_set(reps, count)) if reps else None,
+            tuple(_number(weight) for weight in per_set(weights, count)) if weights else None,
+            _number(exercise.get('duration_minutes')),
+            _number(exercise.get('distance_miles'))
+        ))
+    return exercises
+
+def load_transcripts(path):
+    if not path:
+        return [(text, {'exercises': expected}) for text, expected in SAMPLES]
+    with open(path) as f:
+        items = json.load(f)
+    return [(item, None) if isinstance(item, str) else (item['text'], item.get('expected')) for item in items]
+
+async def llm_references(transcripts):
+    from llm_processor import WorkoutLLMProcessor
+    os.environ['FAST_PARSER_ENABLED'] = 'false'
+    processor = WorkoutLLMProcessor()
+    references = []
+    for text, expected in transcripts:
+        if expected is None:
+            result = await processor.extract_workout_data(text, 'benchmark')
+            expected = result['workout'] if result.get('success') else None
+        references.append(expected)
+    return references
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transcripts', help='JSON list of transcripts, optionally with expected workouts')
+    parser.add_argument('--llm', action='store_true', help='extract missing references with the configured LLM')
+    parser.add_argument('--min-confidence', type=float,
+                        default=float(os.getenv('FAST_PARSER_MIN_CONFIDENCE', 0.8)))
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--verbose', action='store_true', help='print every transcript')
+    args = parser.parse_args()
+
+    transcripts = load_transcripts(args.transcripts)
+    if args.llm:
+        references = asyncio.run(llm_references(transcripts))
+    else:
+        references = [expected for _, expected in transcripts]
+
+    covered, compared, agreed = 0, 0, 0
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        for text, _ in transcripts:
+            parse_workout(text)
+    per_parse_ms = (time.perf_counter() - start) * 1000 / (args.repeats * len(transcripts))
+
+    for (text, _), reference in zip(transcripts, references):
+        workout, confidence = parse_workout(text)
+        is_covered = workout is not None and confidence >= args.min_confidence
+        verdict = 'llm'
+        if is_covered:
+            covered += 1
+            verdict = 'covered'
+            if reference is not None:
+                compared += 1
+                if comparable(workout) == comparable(reference):
+                    agreed += 1
+                    verdict = 'agree'
+                else:
+                    verdict = 'DISAGREE'
+        if args.verbose or verdict == 'DISAGREE':
+            print(f"{confidence:>5.2f}  {verdict:<9} {text}")
+            if verdict == 'DISAGREE':
+                print(f"{'':>16}parser:    {comparable(workout)}")
+                print(f"{'':>16}reference: {comparable(reference)}")
+
+    total = len(transcripts)
+    print(f"\n{total} transcripts, min confidence {args.min_confidence}")
+    print(f"  coverage   {covered}/{total} ({covered / max(total, 1):.0%}) skip the LLM")
+    if compared:
+        print(f"  agreement  {agreed}/{compared} ({agreed / compared:.0%}) of covered transcripts with a reference")
+    else:
+        print("  agreement  n/a (no references for covered transcripts)")
+    print(f"  latency    {per_parse_ms:.3f}ms per parse")
+
+if __name__ == '__main__':
+    main()
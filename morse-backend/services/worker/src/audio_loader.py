@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import logging
+import subprocess
+import numpy as np
+import soundfile as sf
+from typing import Dict, Any, Optional
+from whisper.audio import load_audio as ffmpeg_load_audio, SAMPLE_RATE
+from vad import detect_speech
+
+logger = logging.getLogger(__name__)
+
+class DecodedAudio:
+    """
+    A recording decoded once to 16 kHz mono float32.
+
+    Whisper and the ECAPA speaker model both expect 16 kHz mono input, so
+    one decode can be handed to every stage that needs the samples. The
+    buffer is shared and must be treated as read-only.
+    """
+
+    def __init__(self, file_path: str, samples: np.ndarray, sample_rate: int = SAMPLE_RATE):
+        self.file_path = file_path
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self._speech_segments = None
+
+    @property
+    def duration_seconds(self) -> float:
+        return round(len(self.samples) / self.sample_rate, 2) if self.sample_rate else 0.0
+
+    @property
+    def speech_segments(self):
+        """Voiced (start, end) sample ranges, detected once and shared by every stage"""
+        if self._speech_segments is None:
+            self._speech_segments = detect_speech(self.samples, self.sample_rate)
+        return self._speech_segments
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+def load_audio(file_path: str) -> DecodedAudio:
+    """Decode an audio file (any format ffmpeg reads) to 16 kHz mono float32"""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f'Audio file not found: {file_path}')
+
+    start_time = time.time()
+    samples = ffmpeg_load_audio(file_path, sr=SAMPLE_RATE)
+    audio = DecodedAudio(file_path, samples)
+    logger.info(f"Decoded {file_path} ({audio.duration_seconds:.2f}s) in {int((time.time() - start_time) * 1000)}ms")
+    return audio
+
+def probe_audio(file_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read duration, sample rate and channel count from the file headers
+
+    Nothing is decoded, so memory use does not depend on recording length.
+    libsndfile covers WAV/FLAC/OGG; compressed containers such as m4a and
+    mp3 fall back to ffprobe. Returns None if neither can read the file.
+    """
+    try:
+        info = sf.info(file_path)
+        if info.samplerate and info.frames > 0:
+            return {
+                'duration_seconds': round(info.frames / info.samplerate, 2),
+                'sample_rate': info.samplerate,
+                'channels': info.channels,
+                'format': info.format
+            }
+    except Exception:
+        pass  # Not a libsndfile format - ask ffprobe
+
+    try:
+        output = subprocess.run(
+            [
+                'ffprobe', '-v', 'error',
+                '-select_streams', 'a:0',
+                '-show_entries', 'format=duration,format_name:stream=sample_rate,channels',
+                '-of', 'json',
+                file_path
+            ],
+            capture_output=True, check=True, timeout=30
+        ).stdout
+        metadata = json.loads(output)
+        container = metadata.get('format', {})
+        stream = (metadata.get('streams') or [{}])[0]
+        return {
+            'duration_seconds': round(float(container.get('duration', 0.0)), 2),
+            'sample_rate': int(stream.get('sample_rate', 0)),
+            'channels': int(stream.get('channels', 0)),
+            'format': container.get('format_name', 'unknown')
+        }
+    except Exception as e:
+        logger.warning(f"Could not probe audio metadata for {file_path}: {e}")
+        return None
@@ -1,10 +1,12 @@
 import os
+import json
 import logging
 import asyncio
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import asyncpg
 from datetime import datetime, date
 from dateutil import parser
+from session_merge import merge_recording
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +14,11 @@ class DatabaseManager:
     def __init__(self):
         self.connection_pool = None
         self.database_url = os.getenv('DATABASE_URL', 'postgresql://localhost:5432/morse_db')
+        # Retry budget for failed audio files: attempts before dead-lettering, and the
+        # backoff before attempt n+1 (base * 2^(n-1) seconds, capped)
+        self.max_attempts = int(os.getenv('AUDIO_MAX_ATTEMPTS', 5))
+        self.retry_base_seconds = float(os.getenv('AUDIO_RETRY_BASE_SECONDS', 60))
+        self.retry_max_seconds = float(os.getenv('AUDIO_RETRY_MAX_SECONDS', 21600))
 
     async def get_connection(self):
         """Get a database connection from the pool"""
@@ -46,14 +53,48 @@ class DatabaseManager:
             await self.connection_pool.close()
             logger.info("Database connection pool closed")
 
+    def unit_of_work(self, audio_file_id: str) -> 'JobUnitOfWork':
+        """Start the unit of work for one audio file job"""
+        return JobUnitOfWork(self, audio_file_id)
+
     # Session-related database methods
     
-    async def get_pending_sessions(self) -> List[Dict[str, Any]]:
-        """Get sessions ready for processing"""
+    async def claim_pending_sessions(self, worker_id: str, limit: int, lease_seconds: float,
+                                     exclude: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Lease sessions ready for processing to this worker
+
+        Rows another worker holds are skipped (FOR UPDATE SKIP LOCKED plus an
+        unexpired lease), so replicas draining together split the backlog.
+        A session left 'processing' by a worker whose lease lapsed is claimable
+        again. `exclude` keeps one drain from picking up sessions it already
+        handled.
+        """
         conn = await self.get_connection()
         try:
             query = """
-                SELECT DISTINCT
+                WITH candidates AS (
+                    SELECT ws.id
+                    FROM workout_sessions ws
+                    WHERE (ws.session_status = 'pending'
+                           OR (ws.session_status = 'processing' AND ws.lease_expires_at < NOW()))
+                        AND (ws.lease_expires_at IS NULL OR ws.lease_expires_at < NOW())
+                        AND NOT (ws.id = ANY($4::uuid[]))
+                        AND EXISTS (
+                            SELECT 1 FROM session_audio_files saf
+                            JOIN audio_files af ON saf.audio_file_id = af.id
+                            WHERE saf.session_id = ws.id
+                                AND af.transcription_status = 'completed'
+                        )
+                    ORDER BY ws.created_at ASC
+                    LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE workout_sessions ws
+                SET lease_owner = $1, lease_expires_at = NOW() + make_interval(secs => $3)
+                FROM candidates c, users u
+                WHERE ws.id = c.id AND u.id = ws.user_id
+                RETURNING
                     ws.id,
                     ws.user_id,
                     ws.session_date,
@@ -61,19 +102,53 @@ class DatabaseManager:
                     ws.session_status,
                     ws.created_at,
                     u.device_uuid
-                FROM workout_sessions ws
-                JOIN users u ON ws.user_id = u.id
-                WHERE ws.session_status = 'pending'
-                    AND EXISTS (
-                        SELECT 1 FROM session_audio_files saf
-                        JOIN audio_files af ON saf.audio_file_id = af.id
-                        WHERE saf.session_id = ws.id
-                            AND af.transcription_status = 'completed'
-                    )
-                ORDER BY ws.created_at ASC
             """
-            rows = await conn.fetch(query)
-            return [dict(row) for row in rows]
+            rows = await conn.fetch(query, worker_id, limit, float(lease_seconds), exclude or [])
+            return sorted((dict(row) for row in rows), key=lambda row: row['created_at'])
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def claim_finished_session(self, session_id: str, worker_id: str,
+                                     lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Lease one session if every recording in it has been processed
+
+        Lets the job that processed a session's last recording finalize it
+        straight away. Returns None if the session is not ready, already
+        finished or leased by another worker.
+        """
+        conn = await self.get_connection()
+        try:
+            row = await conn.fetchrow(
+                """UPDATE workout_sessions ws
+                   SET lease_owner = $2, lease_expires_at = NOW() + make_interval(secs => $3)
+                   FROM users u
+                   WHERE ws.id = $1 AND u.id = ws.user_id
+                   AND (ws.session_status = 'pending'
+                        OR (ws.session_status = 'processing' AND ws.lease_expires_at < NOW()))
+                   AND (ws.lease_expires_at IS NULL OR ws.lease_expires_at < NOW())
+                   AND NOT EXISTS (
+                       SELECT 1 FROM session_audio_files saf
+                       JOIN audio_files af ON saf.audio_file_id = af.id
+                       WHERE saf.session_id = ws.id
+                           AND af.transcription_status <> 'completed'
+                   )
+                   RETURNING ws.id, u.device_uuid""",
+                session_id, worker_id, float(lease_seconds)
+            )
+            return dict(row) if row else None
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def release_session_lease(self, session_id: str, worker_id: str):
+        """Give up this worker's lease on a session"""
+        conn = await self.get_connection()
+        try:
+            await conn.execute(
+                """UPDATE workout_sessions SET lease_owner = NULL, lease_expires_at = NULL
+                   WHERE id = $1 AND lease_owner = $2""",
+                session_id, worker_id
+            )
         finally:
             await self.connection_pool.release(conn)
     
@@ -209,31 +284,7 @@ class DatabaseManager:
                 )
                 
                 # Save exercises
-                for exercise in exercises:
-                    exercise_query = """
-                        INSERT INTO exercises (
-                            workout_id, exercise_name, exercise_type, muscle_groups,
-                            sets, reps, weight_lbs, duration_minutes, distance_miles,
-                            effort_level, rest_seconds, notes, order_in_workout
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
-                    """
-                    
-                    await conn.execute(
-                        exercise_query,
-                        workout_id,
-                        exercise.get('exercise_name'),
-                        exercise.get('exercise_type'),
-                        exercise.get('muscle_groups', []),
-                        exercise.get('sets'),
-                        exercise.get('reps', []),
-                        exercise.get('weight_lbs', []),
-                        exercise.get('duration_minutes'),
-                        exercise.get('distance_miles'),
-                        exercise.get('effort_level'),
-                        exercise.get('rest_seconds'),
-                        exercise.get('notes'),
-                        exercise.get('order_in_workout', 1)
-                    )
+                await self._insert_exercises(conn, workout_id, exercises)
                 
                 # Update user's total workout count
                 await conn.execute(
@@ -257,6 +308,84 @@ class DatabaseManager:
         finally:
             await self.connection_pool.release(conn)
 
+    async def get_session_for_audio_file(self, audio_file_id: str) -> Optional[Dict[str, Any]]:
+        """Get the session an audio file belongs to and its position in it"""
+        conn = await self.get_connection()
+        try:
+            return await self._get_session_for_audio_file(conn, audio_file_id)
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def _get_session_for_audio_file(self, conn, audio_file_id: str) -> Optional[Dict[str, Any]]:
+        row = await conn.fetchrow(
+            """SELECT session_id, recording_order
+               FROM session_audio_files
+               WHERE audio_file_id = $1""",
+            audio_file_id
+        )
+        return dict(row) if row else None
+
+    async def merge_session_recording(self, session_id: str, audio_file_id: str, recording_order: int,
+                                      workout_data: Dict[str, Any]):
+        """Fold one recording's extracted workout into the session's stored partial state"""
+        conn = await self.get_connection()
+        try:
+            await self._merge_session_recording(conn, session_id, audio_file_id, recording_order, workout_data)
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def _merge_session_recording(self, conn, session_id: str, audio_file_id: str, recording_order: int,
+                                       workout_data: Dict[str, Any]):
+        async with conn.transaction():
+            # Row lock serializes recordings of the same session merged by concurrent jobs
+            partial = await conn.fetchval(
+                "SELECT partial_workout FROM workout_sessions WHERE id = $1 FOR UPDATE",
+                session_id
+            )
+            state = merge_recording(
+                json.loads(partial) if partial else None,
+                str(audio_file_id),
+                recording_order,
+                workout_data
+            )
+            await conn.execute(
+                "UPDATE workout_sessions SET partial_workout = $2::jsonb WHERE id = $1",
+                session_id, json.dumps(state)
+            )
+
+    async def get_session_partial_state(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Get a session's partial workout state and its transcribed recordings
+
+        Returns:
+            (partial state or None, [{audio_file_id, recording_order, transcription}]
+            for every recording with a completed transcription)
+        """
+        conn = await self.get_connection()
+        try:
+            partial = await conn.fetchval(
+                "SELECT partial_workout FROM workout_sessions WHERE id = $1",
+                session_id
+            )
+            rows = await conn.fetch(
+                """SELECT saf.audio_file_id, saf.recording_order, t.raw_text AS transcription
+                   FROM session_audio_files saf
+                   JOIN audio_files af ON saf.audio_file_id = af.id
+                   JOIN LATERAL (
+                       SELECT raw_text FROM transcriptions
+                       WHERE audio_file_id = af.id
+                       ORDER BY created_at DESC
+                       LIMIT 1
+                   ) t ON true
+                   WHERE saf.session_id = $1
+                       AND af.transcription_status = 'completed'
+                   ORDER BY saf.recording_order ASC""",
+                session_id
+            )
+            return (json.loads(partial) if partial else None), [dict(row) for row in rows]
+        finally:
+            await self.connection_pool.release(conn)
+
     async def update_audio_file_status(self, audio_file_id: str, status: str):
         """Update the transcription status of an audio file"""
         conn = await self.get_connection()
@@ -269,6 +398,42 @@ class DatabaseManager:
         finally:
             await self.connection_pool.release(conn)
 
+    async def record_audio_file_failure(self, audio_file_id: str, error: Optional[str] = None) -> str:
+        """Mark a failed attempt (see _record_failure); returns the new status"""
+        conn = await self.get_connection()
+        try:
+            return await self._record_failure(conn, audio_file_id, error)
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def _record_failure(self, conn, audio_file_id: str, error: Optional[str] = None,
+                              duration_seconds: Optional[float] = None) -> str:
+        """
+        Mark a failed attempt: 'failed' with the next attempt backed off
+        exponentially, or 'dead_letter' once the file is out of attempts.
+        Also gives up the worker's lease. Returns the new status.
+        """
+        status = await conn.fetchval(
+            """UPDATE audio_files
+               SET transcription_status = CASE WHEN attempt_count >= $2 THEN 'dead_letter' ELSE 'failed' END,
+                   next_attempt_at = NOW() + make_interval(
+                       secs => LEAST($4, $3 * power(2, GREATEST(attempt_count - 1, 0)))
+                   ),
+                   last_error = COALESCE($5, last_error),
+                   duration_seconds = COALESCE($6, duration_seconds),
+                   lease_owner = NULL,
+                   lease_expires_at = NULL
+               WHERE id = $1
+               RETURNING transcription_status""",
+            audio_file_id, self.max_attempts, self.retry_base_seconds, self.retry_max_seconds,
+            error[:1000] if error else None, duration_seconds
+        )
+        if status == 'dead_letter':
+            logger.warning(f"Audio file {audio_file_id} dead-lettered after {self.max_attempts} attempts: {error}")
+        else:
+            logger.info(f"Updated audio file {audio_file_id} status to {status}")
+        return status
+
     async def mark_audio_file_processed(self, audio_file_id: str):
         """Mark an audio file as processed"""
         conn = await self.get_connection()
@@ -292,164 +457,278 @@ class DatabaseManager:
         finally:
             await self.connection_pool.release(conn)
 
-    async def save_transcription(self, audio_file_id: str, text: str, confidence: float, processing_time: int) -> str:
+    async def save_transcription(self, audio_file_id: str, text: str, confidence: float, processing_time: int,
+                                 decoding_strategy: Optional[str] = None) -> str:
         """Save transcription data and return the transcription ID"""
         conn = await self.get_connection()
         try:
-            result = await conn.fetchrow(
-                """INSERT INTO transcriptions 
-                   (audio_file_id, raw_text, confidence_score, processing_time_ms) 
-                   VALUES ($1, $2, $3, $4) 
-                   RETURNING id""",
-                audio_file_id, text, confidence, processing_time
-            )
-            return result['id']
+            return await self._insert_transcription(conn, audio_file_id, text, confidence, processing_time,
+                                                    decoding_strategy)
         finally:
             await self.connection_pool.release(conn)
 
+    async def _insert_transcription(self, conn, audio_file_id: str, text: str, confidence: float,
+                                    processing_time: int, decoding_strategy: Optional[str]) -> str:
+        result = await conn.fetchrow(
+            """INSERT INTO transcriptions 
+               (audio_file_id, raw_text, confidence_score, processing_time_ms, decoding_strategy) 
+               VALUES ($1, $2, $3, $4, $5) 
+               RETURNING id""",
+            audio_file_id, text, confidence, processing_time, decoding_strategy
+        )
+        return result['id']
+
     async def save_workout_data(self, user_id: str, audio_file_id: str, transcription_id: str, workout_data: Dict[str, Any]) -> str:
         """Save workout and exercise data, return workout ID"""
         conn = await self.get_connection()
         try:
             async with conn.transaction():
-                # Save workout
-                # Parse workout_date if it's a string
-                workout_date = workout_data.get('workout_date')
-                if isinstance(workout_date, str):
-                    try:
-                        workout_date = parser.parse(workout_date).date()
-                    except (ValueError, TypeError):
-                        workout_date = date.today()
-                
-                # Parse workout_start_time if it's a string
-                workout_start_time = workout_data.get('workout_start_time')
-                if isinstance(workout_start_time, str):
-                    try:
-                        workout_start_time = parser.parse(workout_start_time).time()
-                    except (ValueError, TypeError):
-                        workout_start_time = None
-                
-                workout_result = await conn.fetchrow(
-                    """INSERT INTO workouts 
-                       (user_id, audio_file_id, transcription_id, workout_date, 
-                        workout_start_time, workout_duration_minutes, total_exercises, notes) 
-                       VALUES ($1, $2, $3, $4, $5, $6, $7, $8) 
-                       RETURNING id""",
-                    user_id,
-                    audio_file_id, 
-                    transcription_id,
-                    workout_date,
-                    workout_start_time,
-                    workout_data.get('workout_duration_minutes'),
-                    workout_data.get('total_exercises', 0),
-                    workout_data.get('notes')
-                )
-                
-                workout_id = workout_result['id']
-                
-                # Save exercises
-                exercises = workout_data.get('exercises', [])
-                for exercise in exercises:
-                    await conn.execute(
-                        """INSERT INTO exercises 
-                           (workout_id, exercise_name, exercise_type, muscle_groups, sets, 
-                            reps, weight_lbs, duration_minutes, distance_miles, effort_level, 
-                            rest_seconds, notes, order_in_workout) 
-                           VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)""",
-                        workout_id,
-                        exercise.get('exercise_name'),
-                        exercise.get('exercise_type'),
-                        exercise.get('muscle_groups', []),
-                        exercise.get('sets'),
-                        exercise.get('reps', []),
-                        exercise.get('weight_lbs', []),
-                        exercise.get('duration_minutes'),
-                        exercise.get('distance_miles'),
-                        exercise.get('effort_level'),
-                        exercise.get('rest_seconds'),
-                        exercise.get('notes'),
-                        exercise.get('order_in_workout', 1)
-                    )
-                    
-                    # Save progress tracking data
-                    await self._save_exercise_progress(
-                        conn, user_id, workout_id, exercise, workout_date
-                    )
-                
-                # Update user total workouts
-                await conn.execute(
-                    "UPDATE users SET total_workouts = total_workouts + 1 WHERE id = $1",
-                    user_id
-                )
-                
-                logger.info(f"Saved workout {workout_id} with {len(exercises)} exercises")
-                return workout_id
+                return await self._insert_workout(conn, user_id, audio_file_id, transcription_id, workout_data)
         finally:
             await self.connection_pool.release(conn)
 
-    async def _save_exercise_progress(self, conn, user_id: str, workout_id: str, exercise: Dict, workout_date: str):
-        """Save exercise progress tracking data"""
-        exercise_name = exercise.get('exercise_name')
-        if not exercise_name:
-            return
-            
-        # Save weight progress
-        weights = exercise.get('weight_lbs', [])
-        if weights and isinstance(weights, list):
-            max_weight = max(weights)
-            await conn.execute(
-                """INSERT INTO user_progress 
-                   (user_id, exercise_name, metric_type, metric_value, recorded_date, workout_id) 
-                   VALUES ($1, $2, 'weight', $3, $4, $5)""",
-                user_id, exercise_name, max_weight, workout_date, workout_id
-            )
+    async def _insert_workout(self, conn, user_id: str, audio_file_id: str, transcription_id: str,
+                              workout_data: Dict[str, Any]) -> str:
+        """Insert a workout with its exercises and progress rows (caller holds the transaction)"""
+        # Save workout
+        # Parse workout_date if it's a string
+        workout_date = workout_data.get('workout_date')
+        if isinstance(workout_date, str):
+            try:
+                workout_date = parser.parse(workout_date).date()
+            except (ValueError, TypeError):
+                workout_date = date.today()
         
-        # Save reps progress
-        reps = exercise.get('reps', [])
-        if reps and isinstance(reps, list):
-            max_reps = max(reps)
-            await conn.execute(
-                """INSERT INTO user_progress 
-                   (user_id, exercise_name, metric_type, metric_value, recorded_date, workout_id) 
-                   VALUES ($1, $2, 'reps', $3, $4, $5)""",
-                user_id, exercise_name, max_reps, workout_date, workout_id
-            )
+        # Parse workout_start_time if it's a string
+        workout_start_time = workout_data.get('workout_start_time')
+        if isinstance(workout_start_time, str):
+            try:
+                workout_start_time = parser.parse(workout_start_time).time()
+            except (ValueError, TypeError):
+                workout_start_time = None
         
-        # Save duration progress
-        duration = exercise.get('duration_minutes')
-        if duration:
-            await conn.execute(
-                """INSERT INTO user_progress 
-                   (user_id, exercise_name, metric_type, metric_value, recorded_date, workout_id) 
-                   VALUES ($1, $2, 'duration', $3, $4, $5)""",
-                user_id, exercise_name, duration, workout_date, workout_id
-            )
+        workout_result = await conn.fetchrow(
+            """INSERT INTO workouts 
+               (user_id, audio_file_id, transcription_id, workout_date, 
+                workout_start_time, workout_duration_minutes, total_exercises, notes) 
+               VALUES ($1, $2, $3, $4, $5, $6, $7, $8) 
+               RETURNING id""",
+            user_id,
+            audio_file_id, 
+            transcription_id,
+            workout_date,
+            workout_start_time,
+            workout_data.get('workout_duration_minutes'),
+            workout_data.get('total_exercises', 0),
+            workout_data.get('notes')
+        )
         
-        # Save distance progress
-        distance = exercise.get('distance_miles')
-        if distance:
-            await conn.execute(
+        workout_id = workout_result['id']
+        
+        # Save exercises and progress tracking data, one batch each
+        exercises = workout_data.get('exercises', [])
+        await self._insert_exercises(conn, workout_id, exercises)
+        await self._save_exercise_progress(conn, user_id, workout_id, exercises, workout_date)
+        
+        # Update user total workouts
+        await conn.execute(
+            "UPDATE users SET total_workouts = total_workouts + 1 WHERE id = $1",
+            user_id
+        )
+        
+        logger.info(f"Saved workout {workout_id} with {len(exercises)} exercises")
+        return workout_id
+
+    async def _insert_exercises(self, conn, workout_id, exercises: List[Dict]):
+        """Insert a workout's exercises in one pipelined executemany"""
+        if not exercises:
+            return
+        await conn.executemany(
+            """INSERT INTO exercises 
+               (workout_id, exercise_name, exercise_type, muscle_groups, sets, 
+                reps, weight_lbs, duration_minutes, distance_miles, effort_level, 
+                rest_seconds, notes, order_in_workout) 
+               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)""",
+            [
+                (
+                    workout_id,
+                    exercise.get('exercise_name'),
+                    exercise.get('exercise_type'),
+                    exercise.get('muscle_groups', []),
+                    exercise.get('sets'),
+                    exercise.get('reps', []),
+                    exercise.get('weight_lbs', []),
+                    exercise.get('duration_minutes'),
+                    exercise.get('distance_miles'),
+                    exercise.get('effort_level'),
+                    exercise.get('rest_seconds'),
+                    exercise.get('notes'),
+                    exercise.get('order_in_workout', 1)
+                )
+                for exercise in exercises
+            ]
+        )
+
+    async def _save_exercise_progress(self, conn, user_id: str, workout_id: str, exercises: List[Dict], workout_date: str):
+        """Save exercise progress tracking data (max weight, max reps, duration, distance) in one executemany"""
+        records = []
+        for exercise in exercises:
+            exercise_name = exercise.get('exercise_name')
+            if not exercise_name:
+                continue
+
+            weights = exercise.get('weight_lbs', [])
+            if weights and isinstance(weights, list):
+                weights = [weight for weight in weights if weight is not None]
+                if weights:
+                    records.append((user_id, exercise_name, 'weight', max(weights), workout_date, workout_id))
+
+            reps = exercise.get('reps', [])
+            if reps and isinstance(reps, list):
+                reps = [rep for rep in reps if rep is not None]
+                if reps:
+                    records.append((user_id, exercise_name, 'reps', max(reps), workout_date, workout_id))
+
+            duration = exercise.get('duration_minutes')
+            if duration:
+                records.append((user_id, exercise_name, 'duration', duration, workout_date, workout_id))
+
+            distance = exercise.get('distance_miles')
+            if distance:
+                records.append((user_id, exercise_name, 'distance', distance, workout_date, workout_id))
+
+        if records:
+            await conn.executemany(
                 """INSERT INTO user_progress 
                    (user_id, exercise_name, metric_type, metric_value, recorded_date, workout_id) 
-                   VALUES ($1, $2, 'distance', $3, $4, $5)""",
-                user_id, exercise_name, distance, workout_date, workout_id
+                   VALUES ($1, $2, $3, $4, $5, $6)""",
+                records
             )
 
-    async def get_pending_audio_files(self) -> List[Dict[str, Any]]:
-        """Get audio files that need processing"""
+    async def claim_pending_audio_files(self, worker_id: str, limit: int, lease_seconds: float,
+                                        exclude: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Lease audio files that need processing to this worker
+
+        Same contract as claim_pending_sessions: locked or leased rows are
+        skipped, lapsed 'processing' rows are reclaimed, and `exclude` holds
+        the ids this drain already took. Failed files wait for their
+        next_attempt_at; each claim counts as an attempt, and a file whose
+        worker keeps dying mid-job is dead-lettered once it is out of attempts.
+        """
         conn = await self.get_connection()
         try:
+            await conn.execute(
+                """UPDATE audio_files
+                   SET transcription_status = 'dead_letter', lease_owner = NULL, lease_expires_at = NULL,
+                       last_error = COALESCE(last_error, 'worker lease expired during processing')
+                   WHERE transcription_status = 'processing'
+                   AND lease_expires_at < NOW()
+                   AND attempt_count >= $1""",
+                self.max_attempts
+            )
             results = await conn.fetch(
-                """SELECT af.id, af.user_id, af.file_path, af.original_filename, u.device_uuid
-                   FROM audio_files af
-                   JOIN users u ON af.user_id = u.id
-                   WHERE af.processed = false 
-                   AND af.transcription_status IN ('pending', 'failed')
-                   ORDER BY af.upload_timestamp ASC
-                   LIMIT 50"""
+                """WITH candidates AS (
+                       SELECT af.id
+                       FROM audio_files af
+                       WHERE af.processed = false 
+                       AND (af.transcription_status IN ('pending', 'failed')
+                            OR (af.transcription_status = 'processing' AND af.lease_expires_at < NOW()))
+                       AND (af.lease_expires_at IS NULL OR af.lease_expires_at < NOW())
+                       AND (af.next_attempt_at IS NULL OR af.next_attempt_at <= NOW())
+                       AND NOT (af.id = ANY($4::uuid[]))
+                       ORDER BY af.upload_timestamp ASC
+                       LIMIT $2
+                       FOR UPDATE SKIP LOCKED
+                   )
+                   UPDATE audio_files af
+                   SET lease_owner = $1, lease_expires_at = NOW() + make_interval(secs => $3),
+                       attempt_count = af.attempt_count + 1
+                   FROM candidates c, users u
+                   WHERE af.id = c.id AND u.id = af.user_id
+                   RETURNING af.id, af.user_id, af.file_path, af.original_filename, af.upload_timestamp,
+                             af.attempt_count, u.device_uuid""",
+                worker_id, limit, float(lease_seconds), exclude or []
             )
             
-            return [dict(row) for row in results]
+            return sorted((dict(row) for row in results), key=lambda row: row['upload_timestamp'])
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def claim_audio_file(self, audio_file_id: str, worker_id: str, lease_seconds: float) -> Optional[int]:
+        """
+        Lease one queued audio file and return its attempt number
+
+        Returns None if the file is done, dead-lettered or already leased,
+        including by this worker: a redelivered job or a backlog poll must not
+        start a second run of a file that is in flight here.
+
+        A queued job is an explicit request, so it does not wait for the
+        file's backoff, but it does count as an attempt.
+        """
+        conn = await self.get_connection()
+        try:
+            return await conn.fetchval(
+                """UPDATE audio_files
+                   SET lease_owner = $2, lease_expires_at = NOW() + make_interval(secs => $3),
+                       attempt_count = attempt_count + 1
+                   WHERE id = $1
+                   AND processed = false
+                   AND transcription_status <> 'dead_letter'
+                   AND (lease_owner IS NULL OR lease_expires_at < NOW())
+                   RETURNING attempt_count""",
+                audio_file_id, worker_id, float(lease_seconds)
+            )
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def renew_leases(self, worker_id: str, lease_seconds: float, audio_file_ids: List[str]) -> int:
+        """Extend this worker's leases on the given in-flight files and its sessions; returns how many were renewed"""
+        conn = await self.get_connection()
+        try:
+            async with conn.transaction():
+                files = await conn.execute(
+                    """UPDATE audio_files SET lease_expires_at = NOW() + make_interval(secs => $2)
+                       WHERE lease_owner = $1 AND id = ANY($3::uuid[])""",
+                    worker_id, float(lease_seconds), audio_file_ids
+                )
+                sessions = await conn.execute(
+                    """UPDATE workout_sessions SET lease_expires_at = NOW() + make_interval(secs => $2)
+                       WHERE lease_owner = $1""",
+                    worker_id, float(lease_seconds)
+                )
+            return int(files.split()[-1]) + int(sessions.split()[-1])
+        finally:
+            await self.connection_pool.release(conn)
+
+    async def release_worker_leases(self, worker_id: str):
+        """
+        Hand back everything this worker still holds (shutdown); unfinished rows go back to pending
+
+        A file still leased here was claimed but never finished or failed, so
+        the attempt its claim counted is given back: a deploy or restart must
+        not use up a file's retry budget.
+        """
+        conn = await self.get_connection()
+        try:
+            async with conn.transaction():
+                await conn.execute(
+                    """UPDATE audio_files
+                       SET lease_owner = NULL, lease_expires_at = NULL,
+                           attempt_count = GREATEST(attempt_count - 1, 0),
+                           transcription_status = CASE WHEN transcription_status = 'processing'
+                                                       THEN 'pending' ELSE transcription_status END
+                       WHERE lease_owner = $1""",
+                    worker_id
+                )
+                await conn.execute(
+                    """UPDATE workout_sessions
+                       SET lease_owner = NULL, lease_expires_at = NULL,
+                           session_status = CASE WHEN session_status = 'processing'
+                                                 THEN 'pending' ELSE session_status END
+                       WHERE lease_owner = $1""",
+                    worker_id
+                )
         finally:
             await self.connection_pool.release(conn)
 
@@ -525,6 +804,44 @@ class DatabaseManager:
         finally:
             await self.connection_pool.release(conn)
     
+    async def get_voice_profile_changes(self, since: Optional[datetime] = None,
+                                        include_count: bool = True) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Get voice profiles changed since a watermark, plus the active profile count
+        
+        With no watermark every active profile is returned. With one, rows whose
+        updated_at is at or after it are returned whether active or not, so the
+        caller can drop deactivated profiles. The count is None unless
+        include_count is set, since it scans the whole table.
+        """
+        conn = await self.get_connection()
+        try:
+            if since is None:
+                results = await conn.fetch(
+                    """SELECT vp.id, vp.user_id, vp.embedding_vector, vp.confidence_score,
+                              vp.is_active, vp.updated_at
+                       FROM voice_profiles vp
+                       WHERE vp.is_active = true
+                       ORDER BY vp.created_at DESC"""
+                )
+            else:
+                results = await conn.fetch(
+                    """SELECT vp.id, vp.user_id, vp.embedding_vector, vp.confidence_score,
+                              vp.is_active, vp.updated_at
+                       FROM voice_profiles vp
+                       WHERE vp.updated_at >= $1
+                       ORDER BY vp.updated_at ASC""",
+                    since
+                )
+            active_count = None
+            if include_count:
+                active_count = await conn.fetchval(
+                    "SELECT COUNT(*) FROM voice_profiles WHERE is_active = true"
+                )
+            return [dict(row) for row in results], active_count
+        finally:
+            await self.connection_pool.release(conn)
+    
     async def create_voice_profile(self, user_id: str, embedding: List[float], 
                                  confidence_score: float, workout_id: str = None) -> str:
         """Create a new voice profile for a user"""
@@ -570,29 +887,32 @@ class DatabaseManager:
         conn = await self.get_connection()
         try:
             async with conn.transaction():
-                # Check if workout is still unclaimed
-                workout_status = await conn.fetchrow(
-                    "SELECT claim_status FROM workouts WHERE id = $1",
-                    workout_id
-                )
-                
-                if not workout_status or workout_status['claim_status'] != 'unclaimed':
-                    logger.warning(f"Workout {workout_id} is not available for auto-linking")
-                    return False
-                
-                # Use the claim_workout function with voice_match method
-                result = await conn.fetchval(
-                    "SELECT claim_workout($1, $2, $3, $4)",
-                    user_id, workout_id, 'voice_match', similarity_score
-                )
-                
-                return result is True
+                return await self._link_workout_by_voice(conn, workout_id, user_id, similarity_score)
                 
         except Exception as e:
             logger.error(f"Error auto-linking workout: {e}")
             return False
         finally:
             await self.connection_pool.release(conn)
+
+    async def _link_workout_by_voice(self, conn, workout_id: str, user_id: str, similarity_score: float) -> bool:
+        # Check if workout is still unclaimed
+        workout_status = await conn.fetchrow(
+            "SELECT claim_status FROM workouts WHERE id = $1",
+            workout_id
+        )
+        
+        if not workout_status or workout_status['claim_status'] != 'unclaimed':
+            logger.warning(f"Workout {workout_id} is not available for auto-linking")
+            return False
+        
+        # Use the claim_workout function with voice_match method
+        result = await conn.fetchval(
+            "SELECT claim_workout($1, $2, $3, $4)",
+            user_id, workout_id, 'voice_match', similarity_score
+        )
+        
+        return result is True
     
     async def get_workout_id_from_audio_file(self, audio_file_id: str) -> str:
         """Get workout ID associated with an audio file"""
@@ -620,4 +940,249 @@ class DatabaseManager:
             logger.error(f"Error cleaning up expired workouts: {e}")
             return 0
         finally:
-            await self.connection_pool.release(conn)
\ No newline at end of file
+            await self.connection_pool.release(conn)
+
+class JobUnitOfWork:
+    """
+    The database side of one audio file job.
+
+    Writes that other code needs to see straight away (the 'processing'
+    status, the transcription, the workout) run immediately on a connection
+    the unit of work holds until release(), so a stage's writes share one
+    pool checkout. Everything that only describes the finished job (the
+    duration, the voice embedding, the speaker verification, the voice
+    auto-link and the completed/processed flags) is queued and written by
+    complete() in a single transaction, so the file is never left half
+    finished. fail() records the failed attempt (with its retry backoff or
+    dead-lettering) the same way. Both also give up the worker's lease on
+    the file.
+
+    The unit of work also tracks how far the job got (see STAGES). fail()
+    checkpoints that progress, including an extraction that could not be
+    saved and the voice embedding, and a retry that calls begin(resume=True)
+    loads it back so the stages already done are skipped.
+    """
+
+    STAGES = ('transcribed', 'extracted', 'saved', 'voice_embedded')
+
+    def __init__(self, db: DatabaseManager, audio_file_id: str):
+        self.db = db
+        self.audio_file_id = audio_file_id
+        self.conn = None
+        self.duration_seconds = None
+        self.transcription_id = None
+        self.transcription_text = None
+        self.extracted_workout = None
+        self.workout_id = None
+        self.voice_embedding = None
+        self.voice_quality_score = None
+        self.verification = None
+        self.auto_link = None
+        self.finished = False
+
+    @property
+    def stage(self) -> Optional[str]:
+        """The last stage this job has completed"""
+        if self.voice_embedding is not None:
+            return 'voice_embedded'
+        if self.workout_id is not None:
+            return 'saved'
+        if self.extracted_workout is not None:
+            return 'extracted'
+        if self.transcription_id is not None:
+            return 'transcribed'
+        return None
+
+    async def _connection(self):
+        if self.conn is None:
+            self.conn = await self.db.get_connection()
+        return self.conn
+
+    async def release(self):
+        """Return the held connection to the pool (between stages and when the job ends)"""
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            await self.db.connection_pool.release(conn)
+
+    async def begin(self, resume: bool = False) -> Optional[str]:
+        """
+        Mark the file as processing and, when resuming a retry, load its checkpoint
+
+        Releases the connection afterwards so none is held through
+        transcription. Returns the stage the job resumes after (None to start
+        from scratch).
+        """
+        try:
+            conn = await self._connection()
+            await conn.execute(
+                "UPDATE audio_files SET transcription_status = 'processing' WHERE id = $1",
+                self.audio_file_id
+            )
+            logger.info(f"Updated audio file {self.audio_file_id} status to processing")
+            if resume:
+                await self._load_checkpoint(conn)
+        finally:
+            await self.release()
+        return self.stage
+
+    async def _load_checkpoint(self, conn):
+        """Pick up the transcription, extraction, workout and embedding earlier attempts stored"""
+        row = await conn.fetchrow(
+            """SELECT af.extracted_workout, af.voice_embedding, af.voice_quality_score,
+                      t.id AS transcription_id, t.raw_text, w.id AS workout_id
+               FROM audio_files af
+               LEFT JOIN LATERAL (
+                   SELECT id, raw_text FROM transcriptions
+                   WHERE audio_file_id = af.id
+                   ORDER BY created_at DESC
+                   LIMIT 1
+               ) t ON true
+               LEFT JOIN LATERAL (
+                   SELECT id FROM workouts
+                   WHERE audio_file_id = af.id
+                   ORDER BY created_at DESC
+                   LIMIT 1
+               ) w ON true
+               WHERE af.id = $1""",
+            self.audio_file_id
+        )
+        if not row:
+            return
+        if row['transcription_id'] is not None:
+            self.transcription_id = row['transcription_id']
+            self.transcription_text = row['raw_text']
+        if row['extracted_workout']:
+            self.extracted_workout = json.loads(row['extracted_workout'])
+        self.workout_id = row['workout_id']
+        if row['voice_embedding'] is not None:
+            self.voice_embedding = list(row['voice_embedding'])
+            self.voice_quality_score = float(row['voice_quality_score']) if row['voice_quality_score'] is not None else None
+        if self.stage:
+            logger.info(f"Resuming audio file {self.audio_file_id} after stage '{self.stage}'")
+
+    async def save_transcription(self, text: str, confidence: float, processing_time: int,
+                                 decoding_strategy: Optional[str] = None) -> str:
+        conn = await self._connection()
+        self.transcription_id = await self.db._insert_transcription(conn, self.audio_file_id, text, confidence,
+                                                                    processing_time, decoding_strategy)
+        self.transcription_text = text
+        return self.transcription_id
+
+    def record_extraction(self, workout_data: Dict[str, Any]):
+        """Keep the LLM extraction so a failed save does not cost another LLM call"""
+        self.extracted_workout = workout_data
+
+    async def save_workout_data(self, user_id: str, transcription_id: str, workout_data: Dict[str, Any]) -> str:
+        conn = await self._connection()
+        async with conn.transaction():
+            self.workout_id = await self.db._insert_workout(conn, user_id, self.audio_file_id,
+                                                            transcription_id, workout_data)
+        return self.workout_id
+
+    async def merge_into_session(self, workout_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Fold this recording's extraction into its session's partial state
+
+        Runs on the job's connection: taking a second one from the pool while
+        holding this one deadlocks once every pooled connection is held by a
+        job. Returns the session, or None if the file is not part of one.
+        """
+        conn = await self._connection()
+        session = await self.db._get_session_for_audio_file(conn, self.audio_file_id)
+        if session:
+            await self.db._merge_session_recording(conn, session['session_id'], self.audio_file_id,
+                                                   session['recording_order'], workout_data)
+        return session
+
+    def set_duration(self, duration_seconds: float):
+        self.duration_seconds = duration_seconds
+
+    def set_voice_embedding(self, embedding: List[float], quality_score: float):
+        self.voice_embedding = embedding
+        self.voice_quality_score = quality_score
+
+    def add_speaker_verification(self, voice_profile_id: str, similarity_score: float,
+                                 confidence_level: str, auto_linked: bool = False):
+        self.verification = (voice_profile_id, similarity_score, confidence_level, auto_linked)
+
+    def link_workout_to_user(self, workout_id: str, user_id: str, similarity_score: float):
+        self.auto_link = (workout_id, user_id, similarity_score)
+
+    async def complete(self) -> bool:
+        """
+        Write the job's final state in one transaction and release the connection
+
+        Returns whether the voice auto-link (if one was queued) succeeded. A
+        failed link does not roll back the rest.
+        """
+        linked = False
+        try:
+            conn = await self._connection()
+            async with conn.transaction():
+                await conn.execute(
+                    """UPDATE audio_files
+                       SET transcription_status = 'completed',
+                           processed = true,
+                           duration_seconds = COALESCE($2, duration_seconds),
+                           voice_embedding = COALESCE($3, voice_embedding),
+                           voice_extracted = ($3::float8[] IS NOT NULL) OR COALESCE(voice_extracted, false),
+                           voice_quality_score = COALESCE($4, voice_quality_score),
+                           lease_owner = NULL,
+                           lease_expires_at = NULL,
+                           next_attempt_at = NULL,
+                           last_error = NULL,
+                           processing_stage = $5,
+                           extracted_workout = NULL
+                       WHERE id = $1""",
+                    self.audio_file_id, self.duration_seconds, self.voice_embedding, self.voice_quality_score,
+                    self.stage
+                )
+
+                if self.verification:
+                    await conn.execute(
+                        """INSERT INTO speaker_verifications 
+                           (audio_file_id, voice_profile_id, similarity_score, confidence_level, auto_linked)
+                           VALUES ($1, $2, $3, $4, $5)""",
+                        self.audio_file_id, *self.verification
+                    )
+
+                if self.auto_link:
+                    try:
+                        # Savepoint: a lost claim race must not undo the completion
+                        async with conn.transaction():
+                            linked = await self.db._link_workout_by_voice(conn, *self.auto_link)
+                    except Exception as e:
+                        logger.error(f"Error auto-linking workout: {e}")
+
+            self.finished = True
+            logger.info(f"Updated audio file {self.audio_file_id} status to completed")
+            return linked
+        finally:
+            await self.release()
+
+    async def fail(self, error: Optional[str] = None):
+        """Checkpoint the job's progress, record the failed attempt and release the connection"""
+        if self.finished:
+            await self.release()
+            return
+        try:
+            conn = await self._connection()
+            async with conn.transaction():
+                if self.stage:
+                    # An unsaved extraction is only worth keeping until its workout exists
+                    extracted = self.extracted_workout if self.workout_id is None else None
+                    await conn.execute(
+                        """UPDATE audio_files
+                           SET processing_stage = $2,
+                               extracted_workout = $3::jsonb,
+                               voice_embedding = COALESCE($4, voice_embedding),
+                               voice_extracted = ($4::float8[] IS NOT NULL) OR COALESCE(voice_extracted, false),
+                               voice_quality_score = COALESCE($5, voice_quality_score)
+                           WHERE id = $1""",
+                        self.audio_file_id, self.stage, json.dumps(extracted) if extracted is not None else None,
+                        self.voice_embedding, self.voice_quality_score
+                    )
+                await self.db._record_failure(conn, self.audio_file_id, error, self.duration_seconds)
+            self.finished = True
+        finally:
+            await self.release()
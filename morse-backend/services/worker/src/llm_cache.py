@@ -0,0 +1,88 @@
+import re
+import copy
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+def normalize_transcription(text: str) -> str:
+    """
+    Canonical form of a transcript for cache keys
+
+    Case, punctuation and whitespace differences do not change
+    what the LLM extracts, so "Bench 185, five reps." and "bench 185 five
+    reps" share an entry. Digits, decimal points and words are kept as-is.
+    """
+    text = text.lower().replace('’', "'")
+    text = re.sub(r"[^\w\s'.]|(?<!\d)\.|\.(?!\d)", ' ', text)
+    return ' '.join(text.split())
+
+class LLMResponseCache:
+    """
+    In-memory LRU cache of parsed LLM extraction results with a TTL.
+
+    Keys combine the normalized transcript, the session context, the
+    provider/model and the prompt template version, so changing any of
+    them misses rather than serving a stale extraction.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(transcription: str, is_session: bool, recording_count: int,
+                 provider: str, prompt_version: int) -> str:
+        parts = [
+            normalize_transcription(transcription),
+            f'session={int(bool(is_session))}',
+            f'recordings={recording_count}',
+            f'provider={provider}',
+            f'prompt=v{prompt_version}'
+        ]
+        return hashlib.sha256('\x1f'.join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached value, or None if missing or expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a copy of a value, evicting the least recently used entries past max_entries"""
+        self.entries[key] = (time.monotonic(), copy.deepcopy(value))
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and size"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
@@ -0,0 +1,68 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def shared_http_client() -> httpx.AsyncClient:
+    """
+    Keep-alive HTTP connection pool shared by all LLM providers
+
+    Created on first use so it binds to the worker's event loop. Pool size
+    and timeouts come from LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE and LLM_HTTP_TIMEOUT_SECONDS.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', 20)),
+            max_keepalive_connections=int(os.getenv('LLM_HTTP_MAX_KEEPALIVE', 10)),
+            keepalive_expiry=60.0
+        )
+        timeout = httpx.Timeout(float(os.getenv('LLM_HTTP_TIMEOUT_SECONDS', 60)), connect=10.0)
+        _http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        logger.info(f"LLM HTTP pool: {limits.max_connections} connections, "
+                    f"{limits.max_keepalive_connections} kept alive")
+    return _http_client
+
+async def close_http_client():
+    """Close the shared pool (worker shutdown)"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+class RateLimiter:
+    """
+    Async token bucket: at most requests_per_minute calls, with bursts of up
+    to `burst` calls when the bucket is full. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+                self.waited_seconds += delay
+                await asyncio.sleep(delay)
@@ -2,42 +2,82 @@ import os
 import json
 import logging
 import asyncio
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime, date
 from abc import ABC, abstractmethod
+from llm_cache import LLMResponseCache
+from llm_http import RateLimiter, shared_http_client
+from llm_router import ProviderRouter
+from workout_parser import parse_workout
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever _build_extraction_prompt or response parsing changes, so cached
+# extractions made with the old prompt are not served
+EXTRACTION_PROMPT_VERSION = 1
+
 class LLMProvider(ABC):
-    """Abstract base class for LLM providers"""
+    """
+    Abstract base class for LLM providers
+
+    Calls are async-native over the shared keep-alive HTTP pool, so they do
+    not occupy default-executor threads (which Whisper uses). Each provider
+    caps its own in-flight requests with a semaphore and paces them with a
+    rate limiter, configured by <NAME>_MAX_CONCURRENCY and
+    <NAME>_REQUESTS_PER_MINUTE.
+    """
 
     @abstractmethod
     def __init__(self, api_key: str):
         pass
 
+    def _init_limits(self, name: str, max_concurrency: int, requests_per_minute: float):
+        self.max_concurrency = int(os.getenv(f'{name}_MAX_CONCURRENCY', max_concurrency))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.rate_limiter = RateLimiter(float(os.getenv(f'{name}_REQUESTS_PER_MINUTE', requests_per_minute)),
+                                        burst=self.max_concurrency)
+        self.in_flight = 0
+
+    async def generate_response(self, prompt: str, on_start: Optional[Callable[[], None]] = None) -> str:
+        """Call the provider once its limits allow; on_start fires when the request is actually sent"""
+        async with self.semaphore:
+            await self.rate_limiter.acquire()
+            self.in_flight += 1
+            try:
+                if on_start:
+                    on_start()
+                return await self._generate(prompt)
+            finally:
+                self.in_flight -= 1
+
     @abstractmethod
-    async def generate_response(self, prompt: str) -> str:
+    async def _generate(self, prompt: str) -> str:
         pass
 
     @abstractmethod
     def health_check(self) -> bool:
         pass
 
+    def get_limits(self) -> Dict[str, Any]:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'in_flight': self.in_flight,
+            'requests_per_minute': self.rate_limiter.rate * 60,
+            'rate_limited_seconds': round(self.rate_limiter.waited_seconds, 1)
+        }
+
 class ClaudeProvider(LLMProvider):
     """Anthropic Claude provider"""
 
     def __init__(self, api_key: str):
         import anthropic
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, http_client=shared_http_client())
         self.model = "claude-sonnet-4-20250514"
+        self._init_limits('CLAUDE', max_concurrency=4, requests_per_minute=50)
 
-    async def generate_response(self, prompt: str) -> str:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._call_claude_sync, prompt)
-
-    def _call_claude_sync(self, prompt: str) -> str:
+    async def _generate(self, prompt: str) -> str:
         try:
-            message = self.client.messages.create(
+            message = await self.client.messages.create(
                 model=self.model,
                 max_tokens=2000,
                 temperature=0.1,
@@ -55,27 +95,33 @@ class ClaudeProvider(LLMProvider):
             return False
 
 class GeminiProvider(LLMProvider):
-    """Google Gemini provider"""
+    """Google Gemini provider (generateContent REST endpoint)"""
 
-    def __init__(self, api_key: str):
-        import google.generativeai as genai
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-001')
+    API_URL = 'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent'
 
-    async def generate_response(self, prompt: str) -> str:
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._call_gemini_sync, prompt)
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.model = 'gemini-2.0-flash-001'
+        self._init_limits('GEMINI', max_concurrency=4, requests_per_minute=15)
 
-    def _call_gemini_sync(self, prompt: str) -> str:
+    async def _generate(self, prompt: str) -> str:
         try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    'temperature': 0.1,
-                    'max_output_tokens': 2000,
+            response = await shared_http_client().post(
+                self.API_URL.format(model=self.model),
+                headers={'x-goog-api-key': self.api_key},
+                json={
+                    'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+                    'generationConfig': {
+                        'temperature': 0.1,
+                        'maxOutputTokens': 2000,
+                    }
                 }
             )
-            return response.text
+            response.raise_for_status()
+            candidates = response.json().get('candidates') or []
+            if not candidates:
+                raise ValueError(f"Gemini returned no candidates: {response.text[:200]}")
+            return ''.join(part.get('text', '') for part in candidates[0].get('content', {}).get('parts', []))
         except Exception as e:
             logger.error(f"Gemini API error: {e}")
             raise
@@ -94,48 +140,93 @@ class WorkoutLLMProcessor:
         if not self.provider:
             raise ValueError("No valid LLM provider configured. Set ANTHROPIC_API_KEY or GOOGLE_API_KEY")
 
-    def _initialize_provider(self) -> LLMProvider:
-        """Initialize the best available LLM provider"""
+        # Identical transcripts (retries, duplicate uploads, common short phrases) reuse the last extraction
+        cache_size = int(os.getenv('LLM_CACHE_SIZE', 1000))
+        self.cache = LLMResponseCache(cache_size, float(os.getenv('LLM_CACHE_TTL_SECONDS', 86400))) \
+            if cache_size > 0 else None
+
+        # Simple single-recording transcripts are parsed locally; the LLM only sees the ones the rules can't explain
+        self.fast_parser_enabled = os.getenv('FAST_PARSER_ENABLED', 'true').lower() == 'true'
+        self.fast_parser_min_confidence = float(os.getenv('FAST_PARSER_MIN_CONFIDENCE', 0.8))
+        self.fast_parser_hits = 0
+        self.fast_parser_misses = 0
+
+    def _provider_name(self) -> str:
+        """
+        The router configuration (every provider:model it may call), as part of the response cache key
+
+        This identifies the configuration, not the provider that answered: a
+        hedged or failed-over request may be served by any of them, and the
+        entry is reused whichever one wins. Changing the provider list or a
+        model invalidates the cache.
+        """
+        return self.provider.model
+
+    def _initialize_provider(self) -> ProviderRouter:
+        """
+        Initialize every LLM provider with an API key, behind a router
+
+        LLM_PROVIDER picks the preferred provider; the others are failover and
+        hedging targets (LLM_ROUTER_ENABLED=false keeps only the preferred one).
+        """
 
         # Check for provider preference
         llm_provider = os.getenv('LLM_PROVIDER', 'auto').lower()
 
         if llm_provider == 'anthropic' or llm_provider == 'claude':
-            api_key = os.getenv('ANTHROPIC_API_KEY')
-            if api_key:
-                logger.info("Using Anthropic Claude provider")
-                return ClaudeProvider(api_key)
-            else:
-                logger.warning("ANTHROPIC_API_KEY not found, trying other providers")
-
-        elif llm_provider == 'google' or llm_provider == 'gemini':
-            api_key = os.getenv('GOOGLE_API_KEY')
+            preference = ['claude', 'gemini']
+        else:
+            # google/gemini, and auto: prefer free Gemini if available
+            preference = ['gemini', 'claude']
+
+        factories = {
+            'claude': ('ANTHROPIC_API_KEY', ClaudeProvider),
+            'gemini': ('GOOGLE_API_KEY', GeminiProvider)
+        }
+        providers = []
+        for name in preference:
+            env_var, provider_class = factories[name]
+            api_key = os.getenv(env_var)
             if api_key:
-                logger.info("Using Google Gemini provider")
-                return GeminiProvider(api_key)
+                providers.append((name, provider_class(api_key)))
             else:
-                logger.warning("GOOGLE_API_KEY not found, trying other providers")
+                logger.warning(f"{env_var} not found, {name} provider unavailable")
 
-        # Auto-detect best available provider
-        elif llm_provider == 'auto':
-            # Prefer free Gemini if available
-            google_key = os.getenv('GOOGLE_API_KEY')
-            if google_key:
-                logger.info("Auto-selected Google Gemini provider (free)")
-                return GeminiProvider(google_key)
+        if not providers:
+            return None
 
-            # Fallback to Claude
-            anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-            if anthropic_key:
-                logger.info("Auto-selected Anthropic Claude provider")
-                return ClaudeProvider(anthropic_key)
+        if os.getenv('LLM_ROUTER_ENABLED', 'true').lower() != 'true':
+            providers = providers[:1]
 
-        return None
+        logger.info(f"Using LLM provider(s): {', '.join(name for name, _ in providers)} (in preference order)")
+        return ProviderRouter(providers)
 
     async def extract_workout_data(self, transcription: str, device_uuid: str, is_session: bool = False, recording_count: int = 1) -> Dict[str, Any]:
         """Extract structured workout data from transcription using configured LLM"""
         try:
-            logger.info(f"Processing transcription with {self.provider.__class__.__name__} for device {device_uuid}")
+            if self.fast_parser_enabled and recording_count <= 1:
+                fast_result = self._fast_parse(transcription, device_uuid)
+                if fast_result:
+                    return fast_result
+
+            cache_key = None
+            if self.cache:
+                cache_key = LLMResponseCache.make_key(
+                    transcription, is_session, recording_count, self._provider_name(), EXTRACTION_PROMPT_VERSION
+                )
+                cached = self.cache.get(cache_key)
+                if cached:
+                    # The extraction is reused, the date is not
+                    cached['workout_date'] = date.today().isoformat()
+                    logger.info(f"LLM cache hit for device {device_uuid} "
+                                f"({len(cached.get('exercises', []))} exercises)")
+                    return {
+                        'success': True,
+                        'workout': cached,
+                        'cached': True
+                    }
+
+            logger.info(f"Processing transcription with {self.provider.name} for device {device_uuid}")
 
             # Prepare the prompt for the LLM
             prompt = self._build_extraction_prompt(transcription, is_session, recording_count)
@@ -155,6 +246,9 @@ class WorkoutLLMProcessor:
             exercise_count = len(workout_data.get('exercises', []))
             logger.info(f"Successfully extracted workout data: {exercise_count} exercises from {recording_count} recording(s)")
 
+            if cache_key:
+                self.cache.put(cache_key, workout_data)
+
             return {
                 'success': True,
                 'workout': workout_data
@@ -167,6 +261,24 @@ class WorkoutLLMProcessor:
                 'error': str(e)
             }
 
+    def _fast_parse(self, transcription: str, device_uuid: str) -> Dict[str, Any]:
+        """Extract with the rule-based parser, or return None if it is not confident enough"""
+        workout_data, confidence = parse_workout(transcription)
+        if workout_data is None or confidence < self.fast_parser_min_confidence:
+            self.fast_parser_misses += 1
+            return None
+
+        self.fast_parser_hits += 1
+        workout_data = self._validate_workout_data(workout_data)
+        logger.info(f"Fast-path parse for device {device_uuid}: {workout_data['total_exercises']} exercises "
+                    f"(confidence {confidence:.2f}), skipping LLM")
+        return {
+            'success': True,
+            'workout': workout_data,
+            'source': 'fast_path',
+            'confidence': confidence
+        }
+
     def _build_extraction_prompt(self, transcription: str, is_session: bool = False, recording_count: int = 1) -> str:
         """Build the prompt for LLM to extract workout data"""
         session_context = ""
@@ -394,9 +506,16 @@ Keep feedback concise, actionable, and encouraging. Focus on 2-3 key insights.""
         if not self.provider:
             return {"provider": "none", "status": "error"}
 
-        provider_name = self.provider.__class__.__name__.replace("Provider", "")
         return {
-            "provider": provider_name.lower(),
+            "provider": self.provider.name,
             "status": "ready",
-            "health": self.provider.health_check()
+            "health": self.provider.health_check(),
+            "limits": self.provider.get_limits(),
+            "cache": self.cache.get_stats() if self.cache else None,
+            "fast_parser": {
+                "enabled": self.fast_parser_enabled,
+                "min_confidence": self.fast_parser_min_confidence,
+                "hits": self.fast_parser_hits,
+                "misses": self.fast_parser_misses
+            }
         }
\ No newline at end of file
@@ -0,0 +1,197 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, List, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+class ProviderStats:
+    """Rolling latency and error rate of one provider over its last `window` calls"""
+
+    def __init__(self, window: int):
+        self.calls = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+
+    def record(self, seconds: float, ok: bool, failure_threshold: int, cooldown_seconds: float):
+        self.calls.append((seconds, ok))
+        if ok:
+            self.consecutive_errors = 0
+            return
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= failure_threshold:
+            self.cooldown_until = time.monotonic() + cooldown_seconds
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    @property
+    def error_rate(self) -> float:
+        return sum(1 for _, ok in self.calls if not ok) / len(self.calls) if self.calls else 0.0
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency percentile of successful calls, or None with too few samples to trust"""
+        latencies = sorted(seconds for seconds, ok in self.calls if ok)
+        if len(latencies) < 5:
+            return None
+        return latencies[min(len(latencies) - 1, int(percentile * len(latencies)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        p50, p95 = self.latency_percentile(0.5), self.latency_percentile(0.95)
+        return {
+            'calls': len(self.calls),
+            'error_rate': round(self.error_rate, 3),
+            'p50_seconds': round(p50, 2) if p50 is not None else None,
+            'p95_seconds': round(p95, 2) if p95 is not None else None,
+            'cooling_down': self.cooling_down
+        }
+
+class ProviderRouter:
+    """
+    Routes LLM calls across several providers with failover and hedging.
+
+    Providers are tried in preference order, except that a provider which
+    failed LLM_ROUTER_FAILURE_THRESHOLD times in a row (cooling down for
+    LLM_ROUTER_COOLDOWN_SECONDS) or whose rolling error rate is above
+    LLM_ROUTER_MAX_ERROR_RATE is moved to the back. A failed call fails over
+    to the next provider. With hedging on (LLM_HEDGE_ENABLED, off by
+    default), if the first call has not answered by its provider's rolling
+    p95 latency (LLM_HEDGE_DEFAULT_SECONDS until there is enough history), a
+    second request goes to the next provider and whichever answers first
+    wins; the other is cancelled.
+
+    Latency is measured from when the provider actually sends the request,
+    after its own concurrency and rate limits let it through. Time queued
+    locally neither counts towards the p95 nor starts the hedge clock, so
+    a rate-limited provider does not trigger duplicate paid requests.
+    """
+
+    def __init__(self, providers: List[Tuple[str, Any]]):
+        self.providers = providers
+        self.name = '+'.join(name for name, _ in providers)
+        window = int(os.getenv('LLM_ROUTER_WINDOW', 50))
+        self.stats = {name: ProviderStats(window) for name, _ in providers}
+        self.failure_threshold = int(os.getenv('LLM_ROUTER_FAILURE_THRESHOLD', 3))
+        self.cooldown_seconds = float(os.getenv('LLM_ROUTER_COOLDOWN_SECONDS', 60))
+        self.max_error_rate = float(os.getenv('LLM_ROUTER_MAX_ERROR_RATE', 0.5))
+        self.hedge_enabled = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true' and len(providers) > 1
+        self.hedge_default_seconds = float(os.getenv('LLM_HEDGE_DEFAULT_SECONDS', 15))
+        self.hedge_min_seconds = float(os.getenv('LLM_HEDGE_MIN_SECONDS', 2))
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def model(self) -> str:
+        """Every provider:model the router may call, in configured order"""
+        return '+'.join(f"{name}:{provider.model}" for name, provider in self.providers)
+
+    def _ranked(self) -> List[Tuple[str, Any]]:
+        def rank(item):
+            index, (name, _) = item
+            stats = self.stats[name]
+            degraded = len(stats.calls) >= 5 and stats.error_rate > self.max_error_rate
+            return (stats.cooling_down, degraded, index)
+        return [provider for _, provider in sorted(enumerate(self.providers), key=rank)]
+
+    def _hedge_deadline(self, name: str) -> float:
+        p95 = self.stats[name].latency_percentile(0.95)
+        return max(self.hedge_min_seconds, p95 if p95 is not None else self.hedge_default_seconds)
+
+    async def _timed_call(self, provider, prompt: str, call: Dict[str, Any]) -> str:
+        def on_start():
+            call['started_at'] = time.monotonic()
+            call['started'].set()
+
+        def elapsed() -> float:
+            return time.monotonic() - call['started_at'] if call['started_at'] is not None else 0.0
+
+        try:
+            response = await provider.generate_response(prompt, on_start)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats[call['name']].record(elapsed(), False, self.failure_threshold, self.cooldown_seconds)
+            raise
+        self.stats[call['name']].record(elapsed(), True, self.failure_threshold, self.cooldown_seconds)
+        return response
+
+    async def generate_response(self, prompt: str) -> str:
+        candidates = self._ranked()
+        pending = {}
+        errors = []
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            name, provider = candidates[next_index]
+            next_index += 1
+            call = {'name': name, 'started_at': None, 'started': asyncio.Event(), 'backup': next_index > 1}
+            pending[asyncio.ensure_future(self._timed_call(provider, prompt, call))] = call
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                watch = None
+                if self.hedge_enabled and len(pending) == 1 and next_index < len(candidates):
+                    call = next(iter(pending.values()))
+                    if call['started_at'] is None:
+                        # Still queued behind the provider's own limits; the hedge clock starts once it sends
+                        watch = asyncio.ensure_future(call['started'].wait())
+                    else:
+                        timeout = max(0.0, self._hedge_deadline(call['name']) - (time.monotonic() - call['started_at']))
+
+                try:
+                    done, _ = await asyncio.wait(set(pending) | ({watch} if watch else set()),
+                                                 timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    if watch:
+                        watch.cancel()
+                done.discard(watch)
+                if not done:
+                    if watch:
+                        continue
+                    self.hedges += 1
+                    logger.info(f"LLM provider {call['name']} slower than {self._hedge_deadline(call['name']):.1f}s, "
+                                f"hedging with {candidates[next_index][0]}")
+                    launch()
+                    continue
+
+                for task in done:
+                    call = pending.pop(task)
+                    name, is_backup = call['name'], call['backup']
+                    if task.exception() is None:
+                        if is_backup and pending:
+                            self.hedge_wins += 1
+                        return task.result()
+                    errors.append(f"{name}: {task.exception()}")
+                    logger.warning(f"LLM provider {name} failed: {task.exception()}")
+
+                if not pending and next_index < len(candidates):
+                    self.failovers += 1
+                    logger.info(f"Failing over to LLM provider {candidates[next_index][0]}")
+                    launch()
+
+            raise RuntimeError(f"All LLM providers failed: {'; '.join(errors)}")
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def health_check(self) -> bool:
+        return any(provider.health_check() for _, provider in self.providers)
+
+    def get_limits(self) -> Dict[str, Any]:
+        return {
+            'providers': {
+                name: dict(provider.get_limits(), **self.stats[name].to_dict())
+                for name, provider in self.providers
+            },
+            'hedging': self.hedge_enabled,
+            'failovers': self.failovers,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins
+        }
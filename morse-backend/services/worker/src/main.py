@@ -1,16 +1,23 @@
 import os
 import sys
+import socket
 import time
 import json
 import logging
 import asyncio
-from typing import Dict, Any, List
+from functools import partial
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 
-import redis
+import redis.asyncio as aioredis
 from transcriber import WhisperTranscriber
 from llm_processor import WorkoutLLMProcessor
+from llm_http import close_http_client
 from database import DatabaseManager
+from audio_loader import load_audio
+from pipeline import PipelineStage, StagePipeline
+from profile_cache import VoiceProfileCache
+from session_merge import finalize_session_workout
 
 load_dotenv()
 
@@ -21,7 +28,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 try:
-    from speaker_verifier import SpeakerVerifier
+    from speaker_verifier import SpeakerVerifier, EmbeddingBatcher
     SPEAKER_VERIFIER_AVAILABLE = True
 except Exception as e:
     logger.warning(f"Speaker verifier not available: {e}")
@@ -33,124 +40,354 @@ class WorkoutProcessor:
         self.transcriber = WhisperTranscriber()
         self.llm_processor = WorkoutLLMProcessor()
         self.speaker_verifier = SpeakerVerifier() if SPEAKER_VERIFIER_AVAILABLE else None
+        self.embedding_batcher = EmbeddingBatcher(self.speaker_verifier) if self.speaker_verifier else None
+        self.profile_cache = VoiceProfileCache(self.db, self.speaker_verifier) if self.speaker_verifier else None
         self.redis_client = None
+        self.redis_pool = None
         self.running = False
-        
+
+        # Bound the number of jobs processed concurrently by this worker
+        self.max_concurrent_jobs = max(1, int(os.getenv('WORKER_CONCURRENCY', 1)))
+        self.job_slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        self.active_jobs = set()
+        logger.info(f"Worker concurrency: {self.max_concurrent_jobs} job(s) in flight")
+
+        # 'pipeline' overlaps stages of different files; 'serial' runs each file end to end
+        self.processing_mode = os.getenv('PROCESSING_MODE', 'serial').lower()
+        self.pipeline = self._build_pipeline() if self.processing_mode == 'pipeline' else None
+        logger.info(f"Processing mode: {self.processing_mode}")
+        if self.pipeline and self.max_concurrent_jobs < len(self.pipeline.stages):
+            logger.warning("WORKER_CONCURRENCY is lower than the number of pipeline stages - stages will sit idle")
+
+        # 'incremental' merges each session recording's extraction as it arrives;
+        # 'batch' sends every recording of a session to the LLM in one prompt at the end
+        self.session_mode = os.getenv('SESSION_PROCESSING', 'batch').lower()
+        logger.info(f"Session processing: {self.session_mode}")
+
+        # Pending files transcribed per batched Whisper call when draining the backlog (1 disables batching)
+        self.backlog_batch_size = max(1, int(os.getenv('BACKLOG_BATCH_SIZE', 8)))
+
+        # Backlog rows are leased to this worker so replicas split the work instead of repeating it
+        self.worker_id = os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = float(os.getenv('WORKER_LEASE_SECONDS', 900))
+        self.lease_task = None
+        # Audio files this worker is working on; only these leases are renewed, so a
+        # lease left behind by a job that died before clearing it simply expires
+        self.leased_files = set()
+        logger.info(f"Worker id: {self.worker_id} (lease {self.lease_seconds:.0f}s)")
+
+    async def connect_redis(self):
+        """Connect to the Bull queue through a pooled asyncio Redis client"""
         try:
-            self.redis_client = redis.Redis(
+            self.redis_pool = aioredis.ConnectionPool(
                 host=os.getenv('REDIS_HOST', 'localhost'),
                 port=int(os.getenv('REDIS_PORT', 6379)),
                 password=os.getenv('REDIS_PASSWORD'),
-                decode_responses=True
+                decode_responses=True,
+                max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 10))
             )
-            self.redis_client.ping()
+            self.redis_client = aioredis.Redis(connection_pool=self.redis_pool)
+            await self.redis_client.ping()
             logger.info("Connected to Redis")
         except Exception as e:
             logger.warning(f"Redis connection failed: {e}")
             logger.info("Running without Redis queue - processing files directly")
+            await self.close_redis()
+
+    async def close_redis(self):
+        """Close the Redis client and release its pooled connections"""
+        if self.redis_client:
+            await self.redis_client.close()
+            self.redis_client = None
+        if self.redis_pool:
+            await self.redis_pool.disconnect()
+            self.redis_pool = None
+
+    def _container_path(self, file_path: str) -> str:
+        """Convert host path to container path for mounted uploads directory"""
+        if '/services/api/uploads/' in file_path:
+            filename = os.path.basename(file_path)
+            file_path = f'/app/uploads/{filename}'
+            logger.info(f"Translated host path to container path: {file_path}")
+        return file_path
+
+    def _build_job_context(self, job_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the mutable per-file context that is handed from stage to stage"""
+        # The backlog drain looks files up in the transcription cache before decoding them
+        cache_checked = 'cacheKey' in job_data
+        return {
+            'audio_file_id': job_data['audioFileId'],
+            'file_path': self._container_path(job_data['filePath']),
+            'user_id': job_data['userId'],
+            'device_uuid': job_data['deviceUuid'],
+            'uow': self.db.unit_of_work(job_data['audioFileId']),
+            # Attempts after the first resume from the checkpoint earlier attempts left
+            'attempt': job_data.get('attempt', 1),
+            # Set when the backlog drain already decoded and transcribed the file in a batch
+            'audio': job_data.pop('audio', None),
+            'transcription_result': job_data.pop('transcriptionResult', None),
+            'cache_checked': cache_checked,
+            'cache_key': job_data.pop('cacheKey', None)
+        }
 
     async def process_audio_file(self, job_data: Dict[str, Any]) -> bool:
         """Process a single audio file through the transcription and LLM pipeline"""
+        job = None
         try:
-            audio_file_id = job_data['audioFileId']
-            file_path = job_data['filePath']
-            user_id = job_data['userId']
-            device_uuid = job_data['deviceUuid']
-
-            # Convert host path to container path for mounted uploads directory
-            if '/services/api/uploads/' in file_path:
-                filename = os.path.basename(file_path)
-                file_path = f'/app/uploads/{filename}'
-                logger.info(f"Translated host path to container path: {file_path}")
+            job = self._build_job_context(job_data)
+            logger.info(f"Processing audio file {job['audio_file_id']} for user {job['device_uuid']}")
             
-            logger.info(f"Processing audio file {audio_file_id} for user {device_uuid}")
+            if not await self._run_stage(self._transcribe_stage, job):
+                return False
             
-            # Update status to processing
-            logger.info("Updating audio file status to processing...")
-            await self.db.update_audio_file_status(audio_file_id, 'processing')
+            if not await self._run_stage(self._extract_stage, job):
+                return False
             
-            # Step 1: Transcribe audio
-            logger.info(f"Transcribing audio file: {file_path}")
-            transcription_result = await self.transcriber.transcribe_audio(file_path)
+            return await self._run_stage(self._speaker_stage, job)
             
-            if not transcription_result['success']:
-                logger.error(f"Transcription failed: {transcription_result['error']}")
-                await self.db.update_audio_file_status(audio_file_id, 'failed')
+        except Exception as e:
+            logger.error(f"Error processing audio file: {str(e)}")
+            await self._mark_job_failed(job_data['audioFileId'], job, str(e))
+            return False
+
+    async def _run_stage(self, handler, job: Dict[str, Any]) -> bool:
+        """Run one stage, then hand the job's pooled connection back until the next stage needs it"""
+        try:
+            return await handler(job)
+        finally:
+            await job['uow'].release()
+
+    async def _transcribe_stage(self, job: Dict[str, Any]) -> bool:
+        """Stage 1: transcribe the audio and store the transcription"""
+        uow = job['uow']
+        
+        # Update status to processing
+        logger.info("Updating audio file status to processing...")
+        await uow.begin(resume=job['attempt'] > 1)
+        
+        if uow.transcription_id is not None:
+            # An earlier attempt already stored the transcript
+            logger.info(f"Reusing transcription {uow.transcription_id}")
+            job['transcription_id'] = uow.transcription_id
+            job['transcription_text'] = uow.transcription_text
+            return True
+        
+        transcription_result = job.pop('transcription_result', None)
+        if transcription_result is None and not job['cache_checked']:
+            # A cache hit needs no decode for Whisper
+            transcription_result, job['cache_key'] = await self.transcriber.lookup_cached(job['file_path'])
+            job['cache_checked'] = True
+        
+        # Decode once; the same buffer feeds Whisper and the speaker model
+        if transcription_result is None and job.get('audio') is None:
+            loop = asyncio.get_event_loop()
+            try:
+                job['audio'] = await loop.run_in_executor(None, load_audio, job['file_path'])
+            except Exception as e:
+                logger.error(f"Could not decode audio file {job['file_path']}: {e}")
+                await uow.fail(f"decode: {e}")
                 return False
-            
-            # Save transcription to database
-            transcription_id = await self.db.save_transcription(
-                audio_file_id,
-                transcription_result['text'],
-                transcription_result.get('confidence', 0.0),
-                transcription_result.get('processing_time_ms', 0)
+        
+        if transcription_result is None:
+            logger.info(f"Transcribing audio file: {job['file_path']}")
+            transcription_result = await self.transcriber.transcribe_audio(
+                job['file_path'], job['audio'], cache_key=job['cache_key'], looked_up=True
             )
-            
-            # Update audio file with duration
-            duration_seconds = transcription_result.get('duration_seconds', 0.0)
-            if duration_seconds > 0:
-                await self.db.update_audio_file_duration(audio_file_id, duration_seconds)
-            
-            logger.info(f"Saved transcription {transcription_id}")
-            
-            # Step 2: Process with LLM to extract workout data
+        
+        if not transcription_result['success']:
+            logger.error(f"Transcription failed: {transcription_result['error']}")
+            await uow.fail(f"transcription: {transcription_result['error']}")
+            return False
+        
+        # Save transcription to database
+        transcription_id = await uow.save_transcription(
+            transcription_result['text'],
+            transcription_result.get('confidence', 0.0),
+            transcription_result.get('processing_time_ms', 0),
+            transcription_result.get('decoding_strategy')
+        )
+        
+        # Duration is written with the job's final state
+        duration_seconds = transcription_result.get('duration_seconds', 0.0)
+        if duration_seconds > 0:
+            uow.set_duration(duration_seconds)
+        
+        logger.info(f"Saved transcription {transcription_id}")
+        
+        job['transcription_id'] = transcription_id
+        job['transcription_text'] = transcription_result['text']
+        return True
+
+    async def _extract_stage(self, job: Dict[str, Any]) -> bool:
+        """Stage 2: extract workout data with the LLM and save it"""
+        uow = job['uow']
+        
+        if uow.workout_id is not None:
+            logger.info(f"Reusing workout {uow.workout_id}")
+            job['workout_id'] = uow.workout_id
+            return True
+        
+        if uow.extracted_workout is not None:
+            # An earlier attempt extracted the workout but failed to save it
+            logger.info("Reusing checkpointed LLM extraction")
+            workout_data = {'success': True, 'workout': uow.extracted_workout}
+        else:
             logger.info("Processing transcription with LLM")
             workout_data = await self.llm_processor.extract_workout_data(
-                transcription_result['text'],
-                device_uuid
+                job['transcription_text'],
+                job['device_uuid']
             )
             
             if not workout_data['success']:
                 logger.error(f"LLM processing failed: {workout_data['error']}")
-                await self.db.update_audio_file_status(audio_file_id, 'failed')
+                await uow.fail(f"extraction: {workout_data['error']}")
                 return False
             
-            # Step 3: Save workout and exercise data
-            workout_id = await self.db.save_workout_data(
-                user_id,
-                audio_file_id,
-                transcription_id,
-                workout_data['workout']
-            )
-            
-            logger.info(f"Saved workout {workout_id}")
-            
-            # Step 4: Extract voice embedding and perform speaker verification
-            await self.process_speaker_verification(audio_file_id, file_path, workout_id)
-            
-            # Update status to completed
-            await self.db.update_audio_file_status(audio_file_id, 'completed')
-            await self.db.mark_audio_file_processed(audio_file_id)
-            
-            logger.info(f"Successfully processed audio file {audio_file_id}")
-            return True
-            
+            uow.record_extraction(workout_data['workout'])
+        
+        # Save workout and exercise data
+        workout_id = await uow.save_workout_data(
+            job['user_id'],
+            job['transcription_id'],
+            workout_data['workout']
+        )
+        
+        logger.info(f"Saved workout {workout_id}")
+        
+        if self.session_mode == 'incremental':
+            await self._merge_into_session(uow, workout_data['workout'])
+        
+        job['workout_id'] = workout_id
+        return True
+
+    async def _merge_into_session(self, uow, workout: Dict[str, Any]):
+        """Fold a session recording's extraction into the session's partial state"""
+        try:
+            session = await uow.merge_into_session(workout)
+            if session:
+                logger.info(f"Merged recording {session['recording_order']} into session {session['session_id']}")
         except Exception as e:
-            logger.error(f"Error processing audio file: {str(e)}")
+            # Not fatal: finalizing the session extracts and merges any recording missing from the state
+            logger.error(f"Error merging audio file {uow.audio_file_id} into its session: {e}")
+
+    async def _finalize_finished_session(self, audio_file_id: str):
+        """Finalize the file's session right away if this was its last unprocessed recording"""
+        try:
+            session = await self.db.get_session_for_audio_file(audio_file_id)
+            if not session:
+                return
+            claimed = await self.db.claim_finished_session(session['session_id'], self.worker_id, self.lease_seconds)
+            if not claimed:
+                return
             try:
-                await self.db.update_audio_file_status(job_data['audioFileId'], 'failed')
-            except:
-                pass
+                await self.process_workout_session(claimed['id'], claimed['device_uuid'])
+            finally:
+                await self.db.release_session_lease(claimed['id'], self.worker_id)
+        except Exception as e:
+            # Not fatal: the pending session sweep picks the session up later
+            logger.error(f"Error finalizing session of audio file {audio_file_id}: {e}")
+
+    async def _speaker_stage(self, job: Dict[str, Any]) -> bool:
+        """Stage 3: speaker verification, then mark the file completed"""
+        audio_file_id = job['audio_file_id']
+        uow = job['uow']
+        
+        # Extract voice embedding and perform speaker verification, reusing the decoded audio
+        audio = job.pop('audio', None)
+        await self.process_speaker_verification(
+            uow, audio if audio is not None else job['file_path'], job['workout_id']
+        )
+        
+        # Completed status, duration, embedding, verification and auto-link in one commit
+        linked = await uow.complete()
+        if uow.auto_link:
+            workout_id, user_id, similarity_score = uow.auto_link
+            if linked:
+                logger.info(f"Auto-linked workout {workout_id} to user {user_id} (similarity: {similarity_score:.3f})")
+            else:
+                logger.warning(f"Failed to auto-link workout {workout_id} - may already be claimed")
+        
+        logger.info(f"Successfully processed audio file {audio_file_id}")
+        return True
+
+    async def _mark_job_failed(self, audio_file_id: str, job: Optional[Dict[str, Any]] = None,
+                               error: Optional[str] = None):
+        """Best-effort record of a failed attempt after an unexpected error"""
+        try:
+            if job and job.get('uow'):
+                await job['uow'].fail(error)
+            else:
+                await self.db.record_audio_file_failure(audio_file_id, error)
+        except Exception:
+            pass
+
+    async def _on_pipeline_error(self, job: Dict[str, Any], error: Exception):
+        """Pipeline error hook: a stage raised instead of returning False"""
+        logger.error(f"Error processing audio file {job['audio_file_id']}: {error}")
+        await self._mark_job_failed(job['audio_file_id'], job, str(error))
+
+    def _build_pipeline(self) -> StagePipeline:
+        """Create the stage pipeline with a worker count per stage"""
+        queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
+        return StagePipeline(
+            [
+                PipelineStage('transcribe', partial(self._run_stage, self._transcribe_stage),
+                              int(os.getenv('PIPELINE_TRANSCRIBE_WORKERS', 1)), queue_size),
+                PipelineStage('extract', partial(self._run_stage, self._extract_stage),
+                              int(os.getenv('PIPELINE_LLM_WORKERS', 4)), queue_size),
+                PipelineStage('speaker', partial(self._run_stage, self._speaker_stage),
+                              int(os.getenv('PIPELINE_SPEAKER_WORKERS', 1)), queue_size),
+            ],
+            on_error=self._on_pipeline_error
+        )
+
+    async def run_job(self, job_data: Dict[str, Any]) -> bool:
+        """Run a job through the stage pipeline or serially, depending on the mode"""
+        if self.pipeline:
+            success = await self._submit_to_pipeline(job_data)
+        else:
+            success = await self.process_audio_file(job_data)
+        
+        if success and self.session_mode == 'incremental':
+            await self._finalize_finished_session(job_data['audioFileId'])
+        return success
+
+    async def _submit_to_pipeline(self, job_data: Dict[str, Any]) -> bool:
+        """Feed a job into the stage pipeline and wait for it to come out"""
+        job = None
+        try:
+            job = self._build_job_context(job_data)
+            logger.info(f"Queueing audio file {job['audio_file_id']} for user {job['device_uuid']}")
+            success = await self.pipeline.submit(job)
+        except Exception as e:
+            # Record the attempt so the file's lease does not sit until it expires
+            logger.error(f"Could not run audio file {job_data.get('audioFileId')} through the pipeline: {e}")
+            await self._mark_job_failed(job_data['audioFileId'], job, str(e))
             return False
+        logger.info(f"Pipeline stages: {self.pipeline.get_stats()}")
+        return success
 
     async def poll_for_jobs(self):
-        """Poll Redis for new transcription jobs"""
+        """Poll Redis for new transcription jobs, keeping up to max_concurrent_jobs in flight"""
         while self.running:
             try:
                 if not self.redis_client:
                     await asyncio.sleep(5)
                     continue
                 
-                # Try to get a job from the queue
-                job_data = self.redis_client.blpop('bull:audio transcription:wait', timeout=5)
-                
-                if job_data:
-                    try:
+                # Wait for a free slot before taking another job off the queue
+                await self.job_slots.acquire()
+                dispatched = False
+                try:
+                    # Try to get a job from the queue; the wait yields to the event loop
+                    job_data = await self.redis_client.blpop('bull:audio transcription:wait', timeout=5)
+                    
+                    if job_data:
                         # blpop returns [queue_name, job_id] where job_id is the actual data we need
                         job_id = job_data[1].decode() if isinstance(job_data[1], bytes) else job_data[1]
                         
                         # Get the full job data from Redis hash
-                        job_hash = self.redis_client.hgetall(f'bull:audio transcription:{job_id}')
+                        job_hash = await self.redis_client.hgetall(f'bull:audio transcription:{job_id}')
                         if not job_hash:
                             logger.error(f"Job {job_id} not found in Redis")
                             continue
@@ -162,31 +399,72 @@ class WorkoutProcessor:
                         
                         job_payload = json.loads(job_data_str)
                         
-                        logger.info(f"Processing job: {job_id}")
-                        success = await self.process_audio_file(job_payload)
+                        self._dispatch_job(job_id, job_payload)
+                        dispatched = True
                         
-                        if success:
-                            logger.info("Job completed successfully")
-                        else:
-                            logger.error("Job failed")
-                            
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse job data: {e}")
-                    except Exception as e:
-                        logger.error(f"Error processing job: {e}")
+                except json.JSONDecodeError as e:
+                    logger.error(f"Failed to parse job data: {e}")
+                finally:
+                    # The slot is handed over to the job task when one was started
+                    if not dispatched:
+                        self.job_slots.release()
                         
             except Exception as e:
                 logger.error(f"Error polling for jobs: {e}")
                 await asyncio.sleep(10)
 
+    def _dispatch_job(self, job_id: str, job_payload: Dict[str, Any]):
+        """Run a job in the background; its slot is released when the job finishes"""
+        task = asyncio.create_task(self._run_job(job_id, job_payload))
+        self.active_jobs.add(task)
+
+        def _on_done(finished: asyncio.Task):
+            self.active_jobs.discard(finished)
+            self.job_slots.release()
+
+        task.add_done_callback(_on_done)
+
+    async def _run_job(self, job_id: str, job_payload: Dict[str, Any]):
+        """Process a single queued job and log its outcome"""
+        try:
+            audio_file_id = job_payload['audioFileId']
+            attempt = await self.db.claim_audio_file(audio_file_id, self.worker_id, self.lease_seconds)
+            if attempt is None:
+                logger.info(f"Skipping job {job_id}: audio file already processed or leased by another worker")
+                return
+            job_payload['attempt'] = attempt
+            
+            self.leased_files.add(audio_file_id)
+            try:
+                logger.info(f"Processing job: {job_id} ({len(self.active_jobs)} in flight)")
+                success = await self.run_job(job_payload)
+            finally:
+                self.leased_files.discard(audio_file_id)
+            
+            if success:
+                logger.info(f"Job {job_id} completed successfully")
+            else:
+                logger.error(f"Job {job_id} failed")
+        except Exception as e:
+            logger.error(f"Error processing job {job_id}: {e}")
+
     async def process_pending_sessions(self):
         """Process complete workout sessions that are ready for LLM analysis"""
         try:
-            pending_sessions = await self.db.get_pending_sessions()
-            
-            for session_info in pending_sessions:
+            # One session at a time, so other replicas can take the rest
+            handled = []
+            while self.running:
+                claimed = await self.db.claim_pending_sessions(self.worker_id, 1, self.lease_seconds, handled)
+                if not claimed:
+                    break
+                
+                session_info = claimed[0]
+                handled.append(session_info['id'])
                 logger.info(f"Processing pending session: {session_info['id']}")
-                await self.process_workout_session(session_info['id'], session_info['device_uuid'])
+                try:
+                    await self.process_workout_session(session_info['id'], session_info['device_uuid'])
+                finally:
+                    await self.db.release_session_lease(session_info['id'], self.worker_id)
                 
         except Exception as e:
             logger.error(f"Error processing pending sessions: {e}")
@@ -194,24 +472,90 @@ class WorkoutProcessor:
     async def process_pending_files(self):
         """Process any pending audio files that weren't processed through the queue"""
         try:
-            pending_files = await self.db.get_pending_audio_files()
+            async def process_pending(job_data: Dict[str, Any]):
+                try:
+                    async with self.job_slots:
+                        logger.info(f"Processing pending file: {job_data['audioFileId']}")
+                        await self.run_job(job_data)
+                finally:
+                    self.leased_files.discard(job_data['audioFileId'])
             
-            for file_info in pending_files:
-                logger.info(f"Processing pending file: {file_info['id']}")
-                
-                job_data = {
-                    'audioFileId': file_info['id'],
-                    'filePath': file_info['file_path'],
-                    'userId': file_info['user_id'],
-                    'deviceUuid': file_info['device_uuid'],
-                    'originalFilename': file_info['original_filename']
-                }
+            # Claim one batch at a time so replicas draining together split the backlog.
+            # Transcribe the next batch while the previous one goes through extraction;
+            # waiting on it before moving on keeps at most two batches of audio in memory.
+            # Model calls from both batches queue on the transcriber's engine thread
+            previous_batch = []
+            handled = []
+            while self.running:
+                pending_files = await self.db.claim_pending_audio_files(
+                    self.worker_id, self.backlog_batch_size, self.lease_seconds, handled
+                )
+                if not pending_files:
+                    break
                 
-                await self.process_audio_file(job_data)
+                batch = [
+                    {
+                        'audioFileId': file_info['id'],
+                        'filePath': file_info['file_path'],
+                        'userId': file_info['user_id'],
+                        'deviceUuid': file_info['device_uuid'],
+                        'originalFilename': file_info['original_filename'],
+                        'attempt': file_info['attempt_count']
+                    }
+                    for file_info in pending_files
+                ]
+                handled.extend(file_info['id'] for file_info in pending_files)
+                self.leased_files.update(file_info['id'] for file_info in pending_files)
+                # Retries may already have a stored transcript, so they resume on their own
+                fresh = [job_data for job_data in batch if job_data['attempt'] <= 1]
+                if len(fresh) > 1:
+                    await self._transcribe_backlog_batch(fresh)
+                current_batch = [asyncio.create_task(process_pending(job_data)) for job_data in batch]
+                await asyncio.gather(*previous_batch)
+                previous_batch = current_batch
+            await asyncio.gather(*previous_batch)
                 
         except Exception as e:
             logger.error(f"Error processing pending files: {e}")
 
+    async def _transcribe_backlog_batch(self, batch: List[Dict[str, Any]]):
+        """
+        Decode and transcribe a batch of pending files with one batched call
+        
+        Results are attached to the job data for _transcribe_stage to store;
+        cached transcriptions are attached without decoding the file.
+        Files that fail here are left without a result and go through the
+        normal per-file path, which retries them on their own.
+        """
+        loop = asyncio.get_event_loop()
+        decoded = []
+        for job_data in batch:
+            file_path = self._container_path(job_data['filePath'])
+            try:
+                await self.db.update_audio_file_status(job_data['audioFileId'], 'processing')
+                cached, job_data['cacheKey'] = await self.transcriber.lookup_cached(file_path)
+                if cached:
+                    job_data['transcriptionResult'] = cached
+                    continue
+                job_data['audio'] = await loop.run_in_executor(None, load_audio, file_path)
+                decoded.append((job_data, file_path))
+            except Exception as e:
+                logger.error(f"Could not decode pending file {job_data['audioFileId']}: {e}")
+        
+        if not decoded:
+            return
+        
+        results = await self.transcriber.transcribe_batch(
+            [(file_path, job_data['audio']) for job_data, file_path in decoded],
+            cache_keys=[job_data['cacheKey'] for job_data, _ in decoded]
+        )
+        for (job_data, _), result in zip(decoded, results):
+            if result['success']:
+                job_data['transcriptionResult'] = result
+            else:
+                logger.warning(f"Batched transcription failed for {job_data['audioFileId']}: "
+                               f"{result['error']} - will retry on its own")
+
     async def start(self):
         """Start the worker process"""
         logger.info("Starting Morse workout processor...")
@@ -229,6 +573,15 @@ class WorkoutProcessor:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
         
+        # Connect to the job queue
+        await self.connect_redis()
+        
+        # Keep this worker's backlog leases alive while it runs
+        self.lease_task = asyncio.create_task(self.renew_leases_task())
+        
+        if self.pipeline:
+            self.pipeline.start()
+        
         # Process any pending files first
         await self.process_pending_files()
         
@@ -250,6 +603,25 @@ class WorkoutProcessor:
         """Stop the worker process"""
         logger.info("Stopping workout processor...")
         self.running = False
+        
+        # Let in-flight jobs finish before the pool goes away
+        if self.active_jobs:
+            logger.info(f"Waiting for {len(self.active_jobs)} in-flight job(s) to finish...")
+            await asyncio.gather(*self.active_jobs, return_exceptions=True)
+        
+        if self.pipeline:
+            await self.pipeline.stop()
+        
+        if self.lease_task:
+            self.lease_task.cancel()
+        try:
+            await self.db.release_worker_leases(self.worker_id)
+        except Exception as e:
+            logger.error(f"Error releasing worker leases: {e}")
+        
+        self.transcriber.shutdown()
+        await close_http_client()
+        await self.close_redis()
         await self.db.close_pool()
 
     async def process_workout_session(self, session_id: str, device_uuid: str) -> bool:
@@ -260,24 +632,33 @@ class WorkoutProcessor:
             # Update session status to processing
             await self.db.update_session_status(session_id, 'processing')
             
-            # Get combined transcription data
-            session_data = await self.db.get_combined_session_transcription(session_id)
-            
-            if not session_data:
-                logger.error(f"No transcription data found for session {session_id}")
-                await self.db.update_session_status(session_id, 'failed', 'No transcription data')
-                return False
-            
-            # Process with LLM
-            logger.info(f"Processing session with {session_data['totalRecordings']} recordings")
-            workout_data = await self.llm_processor.extract_session_workout_data(
-                session_data, device_uuid
-            )
+            workout_data = None
+            if self.session_mode == 'incremental':
+                workout_data = await self._finalize_incremental_session(session_id, device_uuid)
             
-            if not workout_data['success']:
-                logger.error(f"LLM processing failed for session {session_id}: {workout_data['error']}")
-                await self.db.update_session_status(session_id, 'failed', workout_data['error'])
-                return False
+            if workout_data is None:
+                # Get combined transcription data
+                session_data = await self.db.get_combined_session_transcription(session_id)
+                
+                if not session_data:
+                    logger.error(f"No transcription data found for session {session_id}")
+                    await self.db.update_session_status(session_id, 'failed', 'No transcription data')
+                    return False
+                
+                # Process with LLM
+                logger.info(f"Processing session with {session_data['totalRecordings']} recordings")
+                workout_data = await self.llm_processor.extract_session_workout_data(
+                    session_data, device_uuid
+                )
+                
+                if not workout_data['success']:
+                    logger.error(f"LLM processing failed for session {session_id}: {workout_data['error']}")
+                    await self.db.update_session_status(session_id, 'failed', workout_data['error'])
+                    return False
+                
+                total_recordings = session_data['totalRecordings']
+            else:
+                total_recordings = workout_data['totalRecordings']
             
             # Get user ID from session
             session_info = await self.db.get_session_info(session_id)
@@ -300,7 +681,7 @@ class WorkoutProcessor:
             await self.db.update_session_status(
                 session_id, 
                 'completed',
-                f'Processed {total_exercises} exercises from {session_data["totalRecordings"]} recordings'
+                f'Processed {total_exercises} exercises from {total_recordings} recordings'
             )
             await self.db.update_session_exercise_count(session_id, total_exercises)
             
@@ -311,55 +692,93 @@ class WorkoutProcessor:
             logger.error(f"Error processing session {session_id}: {str(e)}")
             try:
                 await self.db.update_session_status(session_id, 'failed', str(e))
-            except:
+            except Exception:
                 pass
             return False
 
-    async def process_speaker_verification(self, audio_file_id: str, file_path: str, workout_id: str) -> bool:
-        """Process speaker verification for an audio file"""
+    async def _finalize_incremental_session(self, session_id: str, device_uuid: str) -> Optional[Dict[str, Any]]:
+        """
+        Build the session workout from the partial state merged as recordings arrived
+        
+        Recordings missing from the state (extracted before incremental mode was
+        enabled, or whose merge failed) are extracted on their own and merged now.
+        Returns None when the state cannot be completed, so the caller falls back
+        to one prompt over the whole session.
+        """
+        state, recordings = await self.db.get_session_partial_state(session_id)
+        if not recordings:
+            return None
+        
+        merged = (state or {}).get('recordings', {})
+        missing = [recording for recording in recordings if str(recording['audio_file_id']) not in merged]
+        for recording in missing:
+            result = await self.llm_processor.extract_workout_data(recording['transcription'] or '', device_uuid)
+            if not result['success']:
+                logger.warning(f"Could not extract recording {recording['audio_file_id']} of session {session_id}: "
+                               f"{result['error']} - falling back to full session extraction")
+                return None
+            await self.db.merge_session_recording(
+                session_id,
+                recording['audio_file_id'],
+                recording['recording_order'],
+                result['workout']
+            )
+        if missing:
+            state, _ = await self.db.get_session_partial_state(session_id)
+        
+        logger.info(f"Finalizing session {session_id} from partial state "
+                    f"({len(recordings)} recordings, {len(missing)} merged at finalize)")
+        return {
+            'success': True,
+            'workout': finalize_session_workout(state),
+            'totalRecordings': len(recordings)
+        }
+
+    async def process_speaker_verification(self, uow, file_path, workout_id: str) -> bool:
+        """
+        Process speaker verification for an audio file (path or DecodedAudio)
+
+        The embedding, verification result and auto-link are queued on the
+        job's unit of work and written when it completes.
+        """
         try:
             if not self.speaker_verifier:
                 logger.info("Speaker verifier not available - skipping speaker verification")
                 return True
 
-            logger.info(f"Starting speaker verification for audio file {audio_file_id}")
+            logger.info(f"Starting speaker verification for audio file {uow.audio_file_id}")
 
-            # Extract voice embedding from audio
-            embedding_result = self.speaker_verifier.extract_voice_embedding(file_path)
+            if uow.voice_embedding is not None:
+                # Checkpointed by an earlier attempt
+                embedding = uow.voice_embedding
+                logger.info("Reusing stored voice embedding")
+            else:
+                # Extract voice embedding from audio, batched with other in-flight files
+                embedding_result = await self.embedding_batcher.extract(file_path)
 
-            if not embedding_result['success']:
-                logger.warning(f"Voice embedding extraction failed: {embedding_result['error']}")
-                return False
+                if not embedding_result['success']:
+                    logger.warning(f"Voice embedding extraction failed: {embedding_result['error']}")
+                    return False
 
-            embedding = embedding_result['embedding']
-            quality_score = embedding_result['quality_score']
+                embedding = embedding_result['embedding']
+                quality_score = embedding_result['quality_score']
 
-            # Save embedding to audio_files table
-            await self.db.save_voice_embedding(audio_file_id, embedding, quality_score)
-            logger.info(f"Saved voice embedding (quality: {quality_score:.3f})")
+                # Save embedding to audio_files table
+                uow.set_voice_embedding(embedding, quality_score)
+                logger.info(f"Extracted voice embedding (quality: {quality_score:.3f})")
 
-            # Get all existing voice profiles for comparison
-            voice_profiles = await self.db.get_all_voice_profiles()
+            # Perform speaker verification against the cached voice profiles
+            best_match_profile, verification_result = await self.profile_cache.match(embedding)
 
-            if not voice_profiles:
+            if verification_result is None:
                 logger.info("No existing voice profiles found - workout remains unclaimed")
                 return True
 
-            # Prepare embeddings for comparison
-            known_embeddings = [profile['embedding_vector'] for profile in voice_profiles]
-
-            # Perform speaker verification
-            verification_result = self.speaker_verifier.verify_speaker(embedding, known_embeddings)
-
             logger.info(f"Speaker verification result: {verification_result}")
 
             # Save verification result
-            best_match_profile = None
-            if verification_result['best_match_index'] is not None:
-                best_match_profile = voice_profiles[verification_result['best_match_index']]
-
-                await self.db.save_speaker_verification_result(
-                    audio_file_id,
+            if best_match_profile:
+                uow.add_speaker_verification(
                     best_match_profile['id'],
                     verification_result['similarity_score'],
                     verification_result['confidence_level'],
@@ -371,12 +790,7 @@ class WorkoutProcessor:
                 user_id = best_match_profile['user_id']
                 similarity_score = verification_result['similarity_score']
 
-                success = await self.db.auto_link_workout_to_user(workout_id, user_id, similarity_score)
-
-                if success:
-                    logger.info(f"Auto-linked workout {workout_id} to user {user_id} (similarity: {similarity_score:.3f})")
-                else:
-                    logger.warning(f"Failed to auto-link workout {workout_id} - may already be claimed")
+                uow.link_workout_to_user(workout_id, user_id, similarity_score)
             else:
                 logger.info(f"No high-confidence voice match - workout remains unclaimed")
 
@@ -386,6 +800,17 @@ class WorkoutProcessor:
             logger.error(f"Error in speaker verification: {e}")
             return False
 
+    async def renew_leases_task(self):
+        """Renew this worker's leases every third of the lease period until stopped"""
+        while self.running:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                held = await self.db.renew_leases(self.worker_id, self.lease_seconds, list(self.leased_files))
+                if held:
+                    logger.info(f"Renewed {held} lease(s) for worker {self.worker_id}")
+            except Exception as e:
+                logger.error(f"Error renewing worker leases: {e}")
+
     async def cleanup_expired_workouts_task(self):
         """Periodic task to clean up expired workouts"""
         try:
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+StageHandler = Callable[[Dict[str, Any]], Awaitable[bool]]
+ErrorHandler = Callable[[Dict[str, Any], Exception], Awaitable[None]]
+
+class PipelineStage:
+    """A named processing stage with its own input queue and worker count"""
+
+    def __init__(self, name: str, handler: StageHandler, workers: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and throughput counters for this stage"""
+        return {
+            'workers': self.workers,
+            'busy': self.busy,
+            'queued': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'processed': self.processed,
+            'failed': self.failed
+        }
+
+class StagePipeline:
+    """
+    Runs jobs through a chain of stages connected by bounded asyncio queues.
+
+    Each stage has its own pool of worker tasks, so a job can be in one
+    stage while the next job is already in an earlier one. A stage handler
+    returns True to pass the job on and False to drop it; the caller of
+    submit() gets the overall result once the job leaves the pipeline.
+    """
+
+    def __init__(self, stages: List[PipelineStage], on_error: Optional[ErrorHandler] = None):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.on_error = on_error
+        self.worker_tasks = []
+
+    def start(self):
+        """Start the worker tasks for every stage"""
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self.worker_tasks.append(asyncio.create_task(self._stage_worker(index)))
+            logger.info(f"Pipeline stage '{stage.name}' started with {stage.workers} worker(s)")
+
+    async def stop(self):
+        """Cancel the stage workers; call after in-flight jobs have finished"""
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+
+    async def submit(self, job: Dict[str, Any]) -> bool:
+        """Feed a job into the first stage and wait for it to leave the pipeline"""
+        future = asyncio.get_running_loop().create_future()
+        await self._enqueue(self.stages[0], job, future)
+        return await future
+
+    async def _enqueue(self, stage: PipelineStage, job: Dict[str, Any], future: asyncio.Future):
+        """Put a job on a stage queue, waiting if the stage is backed up"""
+        if stage.queue.full():
+            logger.info(f"Pipeline stage '{stage.name}' is full ({stage.queue.qsize()} queued) - waiting")
+        await stage.queue.put((job, future))
+
+    async def _stage_worker(self, index: int):
+        """Take jobs off a stage queue, run the handler and forward the job"""
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            job, future = await stage.queue.get()
+            stage.busy += 1
+            try:
+                success = await stage.handler(job)
+            except Exception as e:
+                logger.error(f"Pipeline stage '{stage.name}' raised: {e}")
+                success = False
+                if self.on_error:
+                    try:
+                        await self.on_error(job, e)
+                    except Exception as handler_error:
+                        logger.error(f"Pipeline error handler failed: {handler_error}")
+            finally:
+                stage.busy -= 1
+                stage.queue.task_done()
+
+            if not success:
+                stage.failed += 1
+                if not future.done():
+                    future.set_result(False)
+                continue
+
+            stage.processed += 1
+            if next_stage:
+                await self._enqueue(next_stage, job, future)
+            elif not future.done():
+                future.set_result(True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-stage queue depth and throughput counters"""
+        return {stage.name: stage.get_stats() for stage in self.stages}
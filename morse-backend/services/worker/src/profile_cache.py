@@ -0,0 +1,252 @@
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple, Optional
+from voice_index import VoiceProfileIndex
+
+logger = logging.getLogger(__name__)
+
+class VoiceProfileCache:
+    """
+    Worker-side cache of active voice profiles.
+
+    The first sync loads every active profile. Later syncs only fetch rows
+    whose updated_at moved past the last watermark (new profiles and
+    deactivations), so the per-file cost does not grow with the number of
+    enrolled users. Rows re-read through the overlap window that match the
+    cached copy are skipped. Hard deletes leave no updated_at trail; they
+    are caught by comparing the active count, checked every
+    VOICE_PROFILE_COUNT_CHECK_SECONDS, and trigger a full reload.
+
+    With VOICE_INDEX=ivf the embeddings live in a VoiceProfileIndex instead
+    of a brute-force matrix. If VOICE_INDEX_PATH is set, the index is saved
+    there with the profile metadata and watermark, so a restarted worker
+    only syncs what changed while it was down.
+    """
+
+    def __init__(self, db, speaker_verifier, refresh_seconds: float = None, overlap_seconds: float = 5.0):
+        self.db = db
+        self.speaker_verifier = speaker_verifier
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else \
+            float(os.getenv('VOICE_PROFILE_REFRESH_SECONDS', 5))
+        # Re-read a short window behind the watermark so rows committed late are not missed
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.count_check_seconds = float(os.getenv('VOICE_PROFILE_COUNT_CHECK_SECONDS', 60))
+        self.last_count_check = None
+        self.profiles = {}
+        self.watermark = None
+        self.last_sync = None
+        self.profile_list = []
+        self.matrix = None
+        self.dirty = True
+        self.lock = asyncio.Lock()
+
+        self.index = None
+        self.index_path = os.getenv('VOICE_INDEX_PATH')
+        self.index_save_seconds = float(os.getenv('VOICE_INDEX_SAVE_SECONDS', 300))
+        self.last_index_save = None
+        self.index_changed = False
+        if os.getenv('VOICE_INDEX', 'none').lower() == 'ivf':
+            self.index = VoiceProfileIndex(dim=speaker_verifier.embedding_dim)
+            self._load_index()
+
+    async def match(self, embedding: List[float]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Find the cached profile that best matches an embedding
+
+        Returns:
+            (best matching profile or None, verify_speaker result), or
+            (None, None) when there are no profiles to compare against
+        """
+        await self.sync()
+        if not self.profiles:
+            return None, None
+
+        if self.index is not None:
+            result = self.speaker_verifier.verify_speaker_indexed(embedding, self.index)
+            return self.profiles.get(result['best_match_id']), result
+
+        voice_profiles, known_embeddings = await self.get_profiles()
+        result = self.speaker_verifier.verify_speaker(embedding, known_embeddings)
+        best_match_index = result['best_match_index']
+        return (voice_profiles[best_match_index] if best_match_index is not None else None), result
+
+    async def get_profiles(self) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """Get the active profiles and their normalized embedding matrix (row i is profile i)"""
+        await self.sync()
+        if self.dirty:
+            self._rebuild()
+        return self.profile_list, self.matrix
+
+    def invalidate(self):
+        """Force a full reload on the next sync"""
+        self.watermark = None
+        self.last_sync = None
+
+    async def sync(self, force: bool = False):
+        """Bring the cache up to date if the refresh interval has passed"""
+        async with self.lock:
+            if not force and self.last_sync is not None and \
+                    time.monotonic() - self.last_sync < self.refresh_seconds:
+                return
+
+            try:
+                if self.watermark is None:
+                    await self._full_reload()
+                else:
+                    check_count = self.last_count_check is None or \
+                        time.monotonic() - self.last_count_check >= self.count_check_seconds
+                    rows, active_count = await self.db.get_voice_profile_changes(
+                        self.watermark - self.overlap, include_count=check_count
+                    )
+                    changed = self._apply(rows)
+                    if check_count:
+                        self.last_count_check = time.monotonic()
+                    if active_count is not None and len(self.profiles) != active_count:
+                        logger.info(f"Voice profile cache has {len(self.profiles)} profiles, "
+                                    f"database has {active_count} - reloading")
+                        await self._full_reload()
+                    elif changed:
+                        logger.info(f"Voice profile cache synced {changed} changed profile(s)")
+                self.last_sync = time.monotonic()
+                await self._maybe_save_index()
+            except Exception as e:
+                # Serve the profiles we already have rather than failing the job
+                logger.error(f"Error syncing voice profile cache: {e}")
+
+    async def _full_reload(self):
+        rows, _ = await self.db.get_voice_profile_changes(None, include_count=False)
+        self.profiles = {}
+        if self.index is not None:
+            # Build the index in one pass rather than row by row
+            active = [row for row in rows if row.get('is_active', True)]
+            self.index.build(
+                [str(row['id']) for row in active],
+                np.asarray([row['embedding_vector'] for row in active], dtype=np.float32).reshape(-1, self.index.dim)
+            )
+            self.index_changed = True
+        self._apply(rows, index_rows=self.index is None)
+        self.dirty = True
+        logger.info(f"Voice profile cache loaded {len(self.profiles)} active profiles")
+
+    def _apply(self, rows: List[Dict[str, Any]], index_rows: bool = True) -> int:
+        """Upsert active rows, drop inactive ones and advance the watermark; returns how many changed"""
+        added_ids, added_vectors, removed_ids = [], [], []
+        changed = 0
+        for row in rows:
+            profile_id = str(row['id'])
+            updated_at = row.get('updated_at')
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+            if self._unchanged(profile_id, row):
+                continue
+
+            changed += 1
+            if row.get('is_active', True):
+                profile = {
+                    'id': row['id'],
+                    'user_id': row['user_id'],
+                    'confidence_score': row['confidence_score'],
+                    'updated_at': updated_at
+                }
+                if self.index is None:
+                    profile['embedding'] = np.asarray(row['embedding_vector'], dtype=np.float32)
+                else:
+                    added_ids.append(profile_id)
+                    added_vectors.append(row['embedding_vector'])
+                self.profiles[profile_id] = profile
+            else:
+                self.profiles.pop(profile_id, None)
+                removed_ids.append(profile_id)
+            self.dirty = True
+
+        if self.index is not None and index_rows:
+            self.index.remove(removed_ids)
+            self.index.add(added_ids, added_vectors)
+            self.index_changed = self.index_changed or bool(added_ids or removed_ids)
+        return changed
+
+    def _unchanged(self, profile_id: str, row: Dict[str, Any]) -> bool:
+        """True if a row matches what is already cached, as rows re-read through the overlap window do"""
+        cached = self.profiles.get(profile_id)
+        if not row.get('is_active', True):
+            return cached is None and (self.index is None or profile_id not in self.index)
+        if cached is None or cached.get('updated_at') is None or cached['updated_at'] != row.get('updated_at'):
+            return False
+        if self.index is None:
+            return np.array_equal(cached['embedding'], np.asarray(row['embedding_vector'], dtype=np.float32))
+        return profile_id in self.index and np.allclose(
+            self.index.vectors[self.index.rows[profile_id]],
+            self.index._normalize(row['embedding_vector'])[0]
+        )
+
+    def _rebuild(self):
+        """Rebuild the profile list and embedding matrix after changes"""
+        self.profile_list = list(self.profiles.values())
+        if self.index is None:
+            self.matrix = self.speaker_verifier.build_embedding_matrix(
+                [profile['embedding'] for profile in self.profile_list]
+            )
+        self.dirty = False
+
+    def _load_index(self):
+        """Restore a persisted index, its profile metadata and watermark"""
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            index, metadata = VoiceProfileIndex.load(self.index_path)
+            profiles = {}
+            for profile_id, user_id, confidence_score in zip(
+                metadata['profile_ids'], metadata['user_ids'], metadata['confidence_scores']
+            ):
+                profiles[str(profile_id)] = {
+                    'id': str(profile_id),
+                    'user_id': str(user_id),
+                    'confidence_score': float(confidence_score)
+                }
+            if set(profiles) != set(index.ids):
+                raise ValueError("index entries do not match saved profile metadata")
+
+            self.index = index
+            self.profiles = profiles
+            watermark = str(metadata['watermark'])
+            self.watermark = datetime.fromisoformat(watermark) if watermark else None
+            self.dirty = True
+        except Exception as e:
+            logger.warning(f"Could not load voice profile index from {self.index_path}: {e}")
+
+    async def _maybe_save_index(self):
+        """Persist the index after changes, at most every index_save_seconds"""
+        if self.index is None or not self.index_path or not self.index_changed:
+            return
+        if self.last_index_save is not None and \
+                time.monotonic() - self.last_index_save < self.index_save_seconds:
+            return
+
+        profiles = list(self.profiles.values())
+        metadata = {
+            'profile_ids': np.asarray([str(profile['id']) for profile in profiles], dtype=str),
+            'user_ids': np.asarray([str(profile['user_id']) for profile in profiles], dtype=str),
+            'confidence_scores': np.asarray([float(profile['confidence_score']) for profile in profiles], dtype=np.float64),
+            'watermark': np.asarray(self.watermark.isoformat() if self.watermark else '')
+        }
+        # Runs under the sync lock, so the index is not modified while it is written
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.index.save, self.index_path, metadata)
+            self.index_changed = False
+        except Exception as e:
+            logger.error(f"Error saving voice profile index: {e}")
+        self.last_index_save = time.monotonic()
+
+    def get_cache_info(self) -> Dict[str, Any]:
+        """Get information about the cached profiles"""
+        return {
+            'profiles': len(self.profiles),
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+            'refresh_seconds': self.refresh_seconds,
+            'index': self.index.get_index_info() if self.index is not None else None
+        }
@@ -0,0 +1,197 @@
+import re
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+# Partial session state, stored as JSON on workout_sessions.partial_workout:
+#
+# {
+#   "recordings": {audio_file_id: recording_order, ...},
+#   "workouts": {audio_file_id: {"workout_start_time", "workout_duration_minutes", "notes"}},
+#   "exercises": [
+#     {
+#       "key": normalized exercise name,
+#       "first_seen": [recording_order, order_in_workout],
+#       "fields": {exercise_name, exercise_type, muscle_groups},
+#       "pieces": [{"audio_file_id", "recording_order", "order_in_workout", "sets", "reps", "weight_lbs",
+#                   "duration_minutes", "distance_miles", "effort_level", "rest_seconds", "notes"}]
+#     }
+#   ]
+# }
+#
+# Each piece is what one recording said about one exercise. Pieces are kept
+# sorted by recording order, so recordings may arrive in any order and a
+# reprocessed recording simply replaces its own pieces.
+
+def empty_state() -> Dict[str, Any]:
+    return {'recordings': {}, 'workouts': {}, 'exercises': []}
+
+def exercise_key(name: Optional[str]) -> str:
+    """Normalize an exercise name so 'Bench Press', 'bench-press' and 'bench presses' match"""
+    words = re.sub(r'[^a-z0-9]+', ' ', (name or '').lower()).split()
+    return ' '.join(_singular(word) for word in words)
+
+def _singular(word: str) -> str:
+    if len(word) <= 2 or not word.endswith('s') or word.endswith('ss'):
+        return word
+    if word.endswith(('sses', 'ches', 'shes', 'xes')):
+        return word[:-2]
+    return word[:-1]
+
+def merge_recording(state: Optional[Dict[str, Any]], audio_file_id: str, recording_order: int,
+                    workout: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fold one recording's extracted workout into the partial session state
+
+    Only the exercises named in the new recording are touched; the cost does
+    not depend on how many recordings were merged before.
+    """
+    state = state or empty_state()
+    audio_file_id = str(audio_file_id)
+    if audio_file_id in state['recordings']:
+        _remove_recording(state, audio_file_id)
+
+    state['recordings'][audio_file_id] = recording_order
+    state['workouts'][audio_file_id] = {
+        'workout_start_time': workout.get('workout_start_time'),
+        'workout_duration_minutes': workout.get('workout_duration_minutes'),
+        'notes': workout.get('notes')
+    }
+
+    by_key = {exercise['key']: exercise for exercise in state['exercises']}
+    for index, exercise in enumerate(workout.get('exercises', [])):
+        key = exercise_key(exercise.get('exercise_name'))
+        position = [recording_order, exercise.get('order_in_workout') or index + 1]
+        piece = {
+            'audio_file_id': audio_file_id,
+            'recording_order': recording_order,
+            'order_in_workout': position[1],
+            'sets': exercise.get('sets'),
+            'reps': exercise.get('reps'),
+            'weight_lbs': exercise.get('weight_lbs'),
+            'duration_minutes': exercise.get('duration_minutes'),
+            'distance_miles': exercise.get('distance_miles'),
+            'effort_level': exercise.get('effort_level'),
+            'rest_seconds': exercise.get('rest_seconds'),
+            'notes': exercise.get('notes')
+        }
+
+        existing = by_key.get(key)
+        if existing is None:
+            existing = {
+                'key': key,
+                'first_seen': position,
+                'fields': {
+                    'exercise_name': exercise.get('exercise_name'),
+                    'exercise_type': exercise.get('exercise_type'),
+                    'muscle_groups': list(exercise.get('muscle_groups') or [])
+                },
+                'pieces': []
+            }
+            state['exercises'].append(existing)
+            by_key[key] = existing
+        else:
+            if position < existing['first_seen']:
+                # An earlier recording arrived late; it names and orders the exercise
+                existing['first_seen'] = position
+                existing['fields']['exercise_name'] = exercise.get('exercise_name') or existing['fields']['exercise_name']
+            for muscle_group in exercise.get('muscle_groups') or []:
+                if muscle_group not in existing['fields']['muscle_groups']:
+                    existing['fields']['muscle_groups'].append(muscle_group)
+            if not existing['fields'].get('exercise_type'):
+                existing['fields']['exercise_type'] = exercise.get('exercise_type')
+
+        pieces = existing['pieces']
+        insert_at = len(pieces)
+        while insert_at > 0 and pieces[insert_at - 1]['recording_order'] > recording_order:
+            insert_at -= 1
+        pieces.insert(insert_at, piece)
+
+    return state
+
+def _remove_recording(state: Dict[str, Any], audio_file_id: str):
+    state['recordings'].pop(audio_file_id, None)
+    state['workouts'].pop(audio_file_id, None)
+    exercises = []
+    for exercise in state['exercises']:
+        exercise['pieces'] = [piece for piece in exercise['pieces'] if piece['audio_file_id'] != audio_file_id]
+        if exercise['pieces']:
+            exercise['first_seen'] = min([piece['recording_order'], piece['order_in_workout']]
+                                         for piece in exercise['pieces'])
+            exercises.append(exercise)
+    state['exercises'] = exercises
+
+def per_set(values, count: int) -> List[Any]:
+    """
+    Spread a piece's reps/weights over its sets ([185] for 3 sets is [185, 185, 185])
+
+    Shorter lists are padded with None up to count, so reps and weights of
+    the same piece stay the same length and line up set by set.
+    """
+    if not values:
+        return [None] * count
+    if len(values) == 1 and count > 1:
+        return list(values) * count
+    return list(values) + [None] * (count - len(values))
+
+def set_count(piece: Dict[str, Any]) -> int:
+    """Number of sets a piece describes, falling back to the length of its reps/weights"""
+    return piece.get('sets') or len(piece.get('reps') or []) or len(piece.get('weight_lbs') or []) or 1
+
+def _sum_or_none(values: List[Any]) -> Optional[float]:
+    values = [value for value in values if value is not None]
+    return sum(values) if values else None
+
+def finalize_session_workout(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the session workout (the shape save_session_workout_data expects) from the partial state"""
+    recordings = sorted(state['recordings'].items(), key=lambda item: item[1])
+    workouts = [state['workouts'].get(audio_file_id, {}) for audio_file_id, _ in recordings]
+
+    exercises = []
+    for order, exercise in enumerate(sorted(state['exercises'], key=lambda item: item['first_seen']), 1):
+        pieces = exercise['pieces']
+        strength = any(piece.get('reps') or piece.get('weight_lbs') or piece.get('sets') for piece in pieces)
+        reps, weights, sets = [], [], 0
+        if strength:
+            for piece in pieces:
+                count = max(set_count(piece), len(piece.get('reps') or []), len(piece.get('weight_lbs') or []))
+                piece_reps = per_set(piece.get('reps'), count)
+                piece_weights = per_set(piece.get('weight_lbs'), count)
+                sets += count
+                reps.extend(piece_reps)
+                weights.extend(piece_weights)
+
+        efforts = [piece['effort_level'] for piece in pieces if piece.get('effort_level') is not None]
+        rests = [piece['rest_seconds'] for piece in pieces if piece.get('rest_seconds') is not None]
+        notes = []
+        for piece in pieces:
+            if piece.get('notes') and piece['notes'] not in notes:
+                notes.append(piece['notes'])
+
+        exercises.append({
+            'exercise_name': exercise['fields']['exercise_name'],
+            'exercise_type': exercise['fields'].get('exercise_type') or 'other',
+            'muscle_groups': exercise['fields'].get('muscle_groups') or [],
+            'sets': sets or None,
+            'reps': reps if any(rep is not None for rep in reps) else None,
+            'weight_lbs': weights if any(weight is not None for weight in weights) else None,
+            'duration_minutes': _sum_or_none([piece.get('duration_minutes') for piece in pieces]),
+            'distance_miles': _sum_or_none([piece.get('distance_miles') for piece in pieces]),
+            'effort_level': max(efforts) if efforts else None,
+            'rest_seconds': rests[0] if rests else None,
+            'notes': '; '.join(notes) or None,
+            'order_in_workout': order
+        })
+
+    notes = []
+    for workout in workouts:
+        if workout.get('notes') and workout['notes'] not in notes:
+            notes.append(workout['notes'])
+
+    return {
+        'workout_date': date.today().isoformat(),
+        'workout_start_time': next((w['workout_start_time'] for w in workouts if w.get('workout_start_time')), None),
+        'workout_duration_minutes': _sum_or_none([w.get('workout_duration_minutes') for w in workouts]),
+        'notes': '; '.join(notes) or None,
+        'exercises': exercises,
+        'total_exercises': len(exercises)
+    }
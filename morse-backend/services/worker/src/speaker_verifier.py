@@ -1,13 +1,19 @@
 import os
 import logging
+import asyncio
 import numpy as np
 import torch
 import torchaudio
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, Union
 from speechbrain.pretrained import EncoderClassifier
 from sklearn.metrics.pairwise import cosine_similarity
 import librosa
 import soundfile as sf
+from audio_loader import DecodedAudio, load_audio
+from vad import vad_enabled, best_voiced_audio
+
+# An audio file path, or a recording already decoded by audio_loader
+AudioSource = Union[str, DecodedAudio]
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +24,10 @@ class SpeakerVerifier:
         self.embedding_dim = 192  # ECAPA-TDNN embedding dimension
         self.confidence_threshold = 0.95  # 95% confidence threshold
         self.voice_quality_threshold = 0.6  # Minimum quality score for voice samples
+        self.max_batch_size = int(os.getenv('SPEAKER_BATCH_SIZE', 8))
+        self.bucket_length_ratio = 1.5  # Longest clip in a bucket may be at most 1.5x the shortest
+        self.max_audio_seconds = 30  # Embed at most 30 seconds of audio for efficiency
+        self.vad_enabled = vad_enabled()
         
         # Initialize the model
         self._load_model()
@@ -36,9 +46,9 @@ class SpeakerVerifier:
             logger.error(f"Failed to load speaker verification model: {e}")
             raise
     
-    def extract_voice_embedding(self, audio_file_path: str) -> Dict[str, Any]:
+    def extract_voice_embedding(self, audio_file_path: AudioSource) -> Dict[str, Any]:
         """
-        Extract voice embedding from audio file
+        Extract voice embedding from audio file (or already decoded audio)
         
         Returns:
             Dict containing:
@@ -47,56 +57,110 @@ class SpeakerVerifier:
             - success: boolean
             - error: error message if failed
         """
-        try:
-            logger.info(f"Extracting voice embedding from: {audio_file_path}")
-            
-            # Load and preprocess audio
-            audio_data, sample_rate = self._load_and_preprocess_audio(audio_file_path)
-            
-            if audio_data is None:
-                return {
-                    'success': False,
-                    'error': 'Failed to load audio file',
-                    'embedding': None,
-                    'quality_score': 0.0
-                }
-            
-            # Calculate voice quality score
-            quality_score = self._calculate_voice_quality(audio_data, sample_rate)
-            
-            if quality_score < self.voice_quality_threshold:
-                logger.warning(f"Low voice quality score: {quality_score:.3f}")
-                # Still proceed but flag the quality
-            
-            # Extract embedding using SpeechBrain model
-            with torch.no_grad():
-                # Convert to tensor and move to device
-                audio_tensor = torch.from_numpy(audio_data).unsqueeze(0).to(self.device)
+        return self.extract_voice_embeddings([audio_file_path])[0]
+    
+    def extract_voice_embeddings(self, audio_file_paths: List[AudioSource]) -> List[Dict[str, Any]]:
+        """
+        Extract voice embeddings for many audio files (paths or decoded audio)
+        
+        Clips are bucketed by length, zero-padded to the longest clip in their
+        bucket and encoded with one encode_batch call per bucket.
+        
+        Returns:
+            One result dict per input path, in input order, shaped like
+            extract_voice_embedding's result
+        """
+        results = [None] * len(audio_file_paths)
+        loaded = []
+        
+        for index, audio_file_path in enumerate(audio_file_paths):
+            try:
+                logger.info(f"Extracting voice embedding from: {self._source_name(audio_file_path)}")
                 
-                # Extract embedding
-                embeddings = self.model.encode_batch(audio_tensor)
-                embedding = embeddings.squeeze().cpu().numpy()
+                # Load and preprocess audio
+                audio_data, sample_rate = self._load_and_preprocess_audio(audio_file_path)
                 
-                # Normalize embedding
-                embedding = embedding / np.linalg.norm(embedding)
+                if audio_data is None:
+                    results[index] = self._embedding_error('Failed to load audio file')
+                    continue
                 
-            logger.info(f"Successfully extracted voice embedding (dim: {len(embedding)}, quality: {quality_score:.3f})")
-            
-            return {
-                'success': True,
-                'embedding': embedding.tolist(),  # Convert to list for JSON serialization
-                'quality_score': float(quality_score),
-                'error': None
-            }
-            
-        except Exception as e:
-            logger.error(f"Error extracting voice embedding: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'embedding': None,
-                'quality_score': 0.0
-            }
+                # Calculate voice quality score
+                quality_score = self._calculate_voice_quality(audio_data, sample_rate)
+                
+                if quality_score < self.voice_quality_threshold:
+                    logger.warning(f"Low voice quality score: {quality_score:.3f}")
+                    # Still proceed but flag the quality
+                
+                loaded.append((index, audio_data, quality_score))
+                
+            except Exception as e:
+                logger.error(f"Error extracting voice embedding: {e}")
+                results[index] = self._embedding_error(str(e))
+        
+        for bucket in self._bucket_by_length(loaded):
+            try:
+                embeddings = self._encode_bucket([audio_data for _, audio_data, _ in bucket])
+                
+                for (index, _, quality_score), embedding in zip(bucket, embeddings):
+                    logger.info(f"Successfully extracted voice embedding (dim: {len(embedding)}, quality: {quality_score:.3f})")
+                    results[index] = {
+                        'success': True,
+                        'embedding': embedding.tolist(),  # Convert to list for JSON serialization
+                        'quality_score': float(quality_score),
+                        'error': None
+                    }
+                    
+            except Exception as e:
+                logger.error(f"Error extracting voice embeddings for batch of {len(bucket)}: {e}")
+                for index, _, _ in bucket:
+                    results[index] = self._embedding_error(str(e))
+        
+        return results
+    
+    def _bucket_by_length(self, loaded: List[Tuple[int, np.ndarray, float]]) -> List[List[Tuple[int, np.ndarray, float]]]:
+        """Group clips of similar length so padding stays small"""
+        buckets = []
+        current = []
+        
+        for item in sorted(loaded, key=lambda entry: len(entry[1])):
+            if current and (
+                len(current) >= self.max_batch_size or
+                len(item[1]) > len(current[0][1]) * self.bucket_length_ratio
+            ):
+                buckets.append(current)
+                current = []
+            current.append(item)
+        
+        if current:
+            buckets.append(current)
+        return buckets
+    
+    def _encode_bucket(self, waveforms: List[np.ndarray]) -> List[np.ndarray]:
+        """Run one encode_batch forward pass over zero-padded waveforms"""
+        max_length = max(len(waveform) for waveform in waveforms)
+        batch = np.zeros((len(waveforms), max_length), dtype=np.float32)
+        for row, waveform in enumerate(waveforms):
+            batch[row, :len(waveform)] = waveform
+        
+        # Relative lengths tell the model which samples are padding
+        wav_lens = torch.tensor([len(waveform) / max_length for waveform in waveforms], dtype=torch.float32)
+        
+        with torch.no_grad():
+            audio_tensor = torch.from_numpy(batch).to(self.device)
+            embeddings = self.model.encode_batch(audio_tensor, wav_lens.to(self.device))
+            embeddings = embeddings.reshape(len(waveforms), -1).cpu().numpy()
+        
+        # Normalize embeddings
+        return [embedding / np.linalg.norm(embedding) for embedding in embeddings]
+    
+    def _embedding_error(self, error: str) -> Dict[str, Any]:
+        """Build a failed embedding result"""
+        return {
+            'success': False,
+            'error': error,
+            'embedding': None,
+            'quality_score': 0.0
+        }
     
     def compare_embeddings(self, embedding1: List[float], embedding2: List[float]) -> float:
         """
@@ -122,79 +186,146 @@ class SpeakerVerifier:
             logger.error(f"Error comparing embeddings: {e}")
             return 0.0
     
-    def verify_speaker(self, test_embedding: List[float], known_embeddings: List[List[float]]) -> Dict[str, Any]:
+    def build_embedding_matrix(self, embeddings: List[List[float]]) -> np.ndarray:
+        """Stack embeddings into one contiguous, L2-normalized float32 matrix (one row per embedding)"""
+        if len(embeddings) == 0:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        # Zero rows stay zero, matching cosine_similarity's handling of empty vectors
+        matrix /= np.maximum(norms, 1e-12)
+        return matrix
+    
+    def verify_speaker(self, test_embedding: List[float], known_embeddings, top_k: int = 1) -> Dict[str, Any]:
         """
         Verify if test embedding matches any of the known embeddings
         
+        known_embeddings may be a list of embeddings or a matrix built by
+        build_embedding_matrix; passing the matrix avoids rebuilding it for
+        every probe. All candidates are scored with one matrix-vector product.
+        
         Returns:
             Dict containing:
             - match_found: boolean
             - best_match_index: index of best matching embedding
             - similarity_score: float similarity score
             - confidence_level: string (high/medium/low/no_match)
+            - top_matches: list of (index, similarity_score), best first
         """
         try:
-            if not known_embeddings:
-                return {
-                    'match_found': False,
-                    'best_match_index': None,
-                    'similarity_score': 0.0,
-                    'confidence_level': 'no_match'
-                }
+            if len(known_embeddings) == 0:
+                return self._verification_result(None, 0.0)
             
-            best_similarity = 0.0
-            best_match_index = -1
+            if isinstance(known_embeddings, np.ndarray) and known_embeddings.dtype == np.float32:
+                matrix = known_embeddings
+            else:
+                matrix = self.build_embedding_matrix(known_embeddings)
             
-            # Compare with each known embedding
-            for i, known_embedding in enumerate(known_embeddings):
-                similarity = self.compare_embeddings(test_embedding, known_embedding)
-                
-                if similarity > best_similarity:
-                    best_similarity = similarity
-                    best_match_index = i
+            probe = np.asarray(test_embedding, dtype=np.float32)
+            probe = probe / max(float(np.linalg.norm(probe)), 1e-12)
             
-            # Determine confidence level
-            if best_similarity >= self.confidence_threshold:
-                confidence_level = 'high'
-                match_found = True
-            elif best_similarity >= 0.85:
-                confidence_level = 'medium'
-                match_found = False  # Not confident enough for auto-linking
-            elif best_similarity >= 0.7:
-                confidence_level = 'low'
-                match_found = False
-            else:
-                confidence_level = 'no_match'
-                match_found = False
+            # Cosine similarity against every profile, converted to 0-1 range
+            similarities = (matrix @ probe + 1.0) / 2.0
             
-            logger.info(f"Speaker verification result: similarity={best_similarity:.3f}, confidence={confidence_level}")
+            # argmax returns the first of equal scores, as the old sequential scan did
+            best_match_index = int(np.argmax(similarities))
+            best_similarity = float(similarities[best_match_index])
+            if best_similarity <= 0.0:
+                best_match_index = None
             
-            return {
-                'match_found': match_found,
-                'best_match_index': best_match_index if best_match_index >= 0 else None,
-                'similarity_score': float(best_similarity),
-                'confidence_level': confidence_level
-            }
+            top_matches = []
+            if top_k > 1:
+                k = min(top_k, len(similarities))
+                candidates = np.argpartition(-similarities, k - 1)[:k]
+                candidates = candidates[np.argsort(-similarities[candidates], kind='stable')]
+                top_matches = [(int(i), float(similarities[i])) for i in candidates]
+            elif best_match_index is not None:
+                top_matches = [(best_match_index, best_similarity)]
+            
+            return self._verification_result(best_match_index, best_similarity, top_matches)
             
         except Exception as e:
             logger.error(f"Error in speaker verification: {e}")
-            return {
-                'match_found': False,
-                'best_match_index': None,
-                'similarity_score': 0.0,
-                'confidence_level': 'no_match'
-            }
+            return self._verification_result(None, 0.0)
+    
+    def verify_speaker_indexed(self, test_embedding: List[float], index, top_k: int = 1) -> Dict[str, Any]:
+        """
+        Verify a test embedding against a VoiceProfileIndex
+        
+        The index re-scores its candidates exactly, so thresholds behave as
+        in verify_speaker. Matches are identified by profile id: the result
+        has best_match_id instead of best_match_index, and top_matches holds
+        (profile_id, similarity_score) pairs.
+        """
+        try:
+            matches = index.search(test_embedding, top_k=max(top_k, 1))
+            # Cosine similarity converted to 0-1 range
+            top_matches = [(profile_id, (score + 1.0) / 2.0) for profile_id, score in matches]
+            
+            if not top_matches or top_matches[0][1] <= 0.0:
+                result = self._verification_result(None, 0.0)
+                result['best_match_id'] = None
+                return result
+            
+            result = self._verification_result(None, top_matches[0][1], top_matches)
+            result['best_match_id'] = top_matches[0][0]
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in indexed speaker verification: {e}")
+            result = self._verification_result(None, 0.0)
+            result['best_match_id'] = None
+            return result
+    
+    def _verification_result(self, best_match_index: Optional[int], best_similarity: float,
+                             top_matches: List[Tuple[int, float]] = None) -> Dict[str, Any]:
+        """Map the best similarity onto a confidence level and build the result"""
+        # Determine confidence level
+        if best_similarity >= self.confidence_threshold:
+            confidence_level = 'high'
+            match_found = True
+        elif best_similarity >= 0.85:
+            confidence_level = 'medium'
+            match_found = False  # Not confident enough for auto-linking
+        elif best_similarity >= 0.7:
+            confidence_level = 'low'
+            match_found = False
+        else:
+            confidence_level = 'no_match'
+            match_found = False
+        
+        logger.info(f"Speaker verification result: similarity={best_similarity:.3f}, confidence={confidence_level}")
+        
+        return {
+            'match_found': match_found,
+            'best_match_index': best_match_index,
+            'similarity_score': float(best_similarity),
+            'confidence_level': confidence_level,
+            'top_matches': top_matches or []
+        }
     
-    def _load_and_preprocess_audio(self, audio_file_path: str) -> Tuple[Optional[np.ndarray], int]:
+    def _load_and_preprocess_audio(self, audio_file_path: AudioSource) -> Tuple[Optional[np.ndarray], int]:
         """Load and preprocess audio file for speaker verification"""
         try:
-            # Check if file exists
-            if not os.path.exists(audio_file_path):
-                logger.error(f"Audio file not found: {audio_file_path}")
-                return None, 0
+            if isinstance(audio_file_path, DecodedAudio):
+                # Reuse the decode shared with transcription (already 16kHz mono)
+                decoded = audio_file_path
+            else:
+                # Check if file exists
+                if not os.path.exists(audio_file_path):
+                    logger.error(f"Audio file not found: {audio_file_path}")
+                    return None, 0
+                
+                decoded = load_audio(audio_file_path)  # Resampled to 16kHz mono
             
-            # Load audio using librosa (handles various formats)
-            audio_data, sample_rate = librosa.load(audio_file_path, sr=16000)  # Resample to 16kHz
+            sample_rate = decoded.sample_rate
+            if self.vad_enabled:
+                # Use the clearest voiced seconds rather than the start of the file
+                audio_data = best_voiced_audio(decoded.samples, decoded.speech_segments, sample_rate,
+                                               self.max_audio_seconds)
+            else:
+                audio_data = decoded.samples
             
             # Ensure minimum length (at least 1 second for reliable speaker verification)
             min_length = sample_rate * 1  # 1 second
@@ -204,7 +335,7 @@ class SpeakerVerifier:
                 audio_data = np.pad(audio_data, (0, min_length - len(audio_data)), mode='constant')
             
             # Limit maximum length to 30 seconds for efficiency
-            max_length = sample_rate * 30
+            max_length = sample_rate * self.max_audio_seconds
             if len(audio_data) > max_length:
                 audio_data = audio_data[:max_length]
             
@@ -214,9 +345,12 @@ class SpeakerVerifier:
             return audio_data, sample_rate
             
         except Exception as e:
-            logger.error(f"Error loading audio file {audio_file_path}: {e}")
+            logger.error(f"Error loading audio file {self._source_name(audio_file_path)}: {e}")
             return None, 0
     
+    def _source_name(self, audio_file_path: AudioSource) -> str:
+        return audio_file_path.file_path if isinstance(audio_file_path, DecodedAudio) else audio_file_path
+    
     def _calculate_voice_quality(self, audio_data: np.ndarray, sample_rate: int) -> float:
         """
         Calculate voice quality score based on audio characteristics
@@ -285,4 +419,70 @@ class SpeakerVerifier:
             'voice_quality_threshold': self.voice_quality_threshold,
             'device': str(self.device),
             'model_loaded': self.model is not None
-        }
\ No newline at end of file
+        }
+
+class EmbeddingBatcher:
+    """
+    Collects voice embedding requests for a short window and runs them
+    through SpeakerVerifier.extract_voice_embeddings as one batch.
+    
+    A batch is flushed when the window expires or when max_batch_size
+    requests are waiting, whichever comes first.
+    """
+    
+    def __init__(self, verifier: SpeakerVerifier, window_seconds: float = None, max_batch_size: int = None):
+        self.verifier = verifier
+        self.window_seconds = window_seconds if window_seconds is not None else \
+            float(os.getenv('SPEAKER_BATCH_WINDOW_MS', 200)) / 1000.0
+        self.max_batch_size = max_batch_size or verifier.max_batch_size
+        self.pending = []
+        self.flush_task = None
+        # Early flushes, held so the event loop's weak references do not let them be collected mid-run
+        self.flushing = set()
+    
+    async def extract(self, audio_file_path: AudioSource) -> Dict[str, Any]:
+        """Queue a file for the next batch and wait for its embedding result"""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((audio_file_path, future))
+        
+        if len(self.pending) >= self.max_batch_size:
+            # Batch is full - flush now instead of waiting out the window
+            if self.flush_task:
+                self.flush_task.cancel()
+                self.flush_task = None
+            task = asyncio.create_task(self._flush())
+            self.flushing.add(task)
+            task.add_done_callback(self.flushing.discard)
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_after_window())
+        
+        return await future
+    
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.window_seconds)
+        self.flush_task = None
+        await self._flush()
+    
+    async def _flush(self):
+        """Run the waiting requests through the model off the event loop"""
+        batch = self.pending[:self.max_batch_size]
+        self.pending = self.pending[self.max_batch_size:]
+        if not batch:
+            return
+        
+        # Anything left over starts the next window
+        if self.pending and self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_after_window())
+        
+        paths = [path for path, _ in batch]
+        logger.info(f"Extracting voice embeddings for batch of {len(paths)} file(s)")
+        try:
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(None, self.verifier.extract_voice_embeddings, paths)
+        except Exception as e:
+            logger.error(f"Batched voice embedding extraction failed: {e}")
+            results = [self.verifier._embedding_error(str(e)) for _ in paths]
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -1,37 +1,164 @@
 import os
 import time
 import logging
-import whisper
 import torch
 import asyncio
-import soundfile as sf
-from typing import Dict, Any
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from typing import Dict, Any, List, Tuple, Optional
 from pathlib import Path
+from audio_loader import DecodedAudio, load_audio, probe_audio
+from vad import vad_enabled, worth_trimming, concatenate_segments, remap_timestamp
+from transcription_engine import (
+    create_transcription_engine, TRANSCRIBE_OPTIONS,
+    ADAPTIVE_LOGPROB_THRESHOLD, ADAPTIVE_COMPRESSION_THRESHOLD
+)
+from transcription_cache import TranscriptionCache
+from transcription_process import (
+    init_process, decode, decode_batch, transcribe_in_process, transcribe_batch_in_process, process_ready
+)
 
 logger = logging.getLogger(__name__)
 
 class WhisperTranscriber:
     def __init__(self):
-        self.model = None
+        self.engine = None
+        self.executor = None
+        # Single thread that owns the in-process engine; Whisper keeps per-call decode state
+        # (KV-cache hooks) on the model, so concurrent jobs must not run it in parallel
+        self.engine_thread = None
         self.model_name = os.getenv('WHISPER_MODEL', 'base')
+        # 'whisper' (openai-whisper on PyTorch) or 'faster-whisper' (CTranslate2, int8 by default)
+        self.engine_name = os.getenv('WHISPER_ENGINE', 'whisper').lower()
         self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # 'beam' always runs beam search; 'adaptive' decodes greedily and beam-searches weak segments only
+        self.decoding = os.getenv('WHISPER_DECODING', 'beam').lower()
+        # 'thread' runs one shared model on a dedicated thread; 'process' gives each pool process its own
+        self.executor_mode = os.getenv('WHISPER_EXECUTOR', 'thread').lower()
+        self.num_processes = max(1, int(os.getenv('WHISPER_PROCESSES', os.cpu_count() or 1)))
+        self.torch_threads = int(os.getenv('WHISPER_TORCH_THREADS', 1))
+        # Decode only voiced regions when VAD finds enough silence to skip
+        self.vad_enabled = vad_enabled()
+        self.cache = self._open_cache()
         logger.info(f"Using device: {self.device}")
-        self._load_model()
+        if self.executor_mode == 'process':
+            self._start_process_pool()
+        else:
+            self._load_model()
+
+    def _open_cache(self) -> Optional[TranscriptionCache]:
+        """Open the transcription result cache if TRANSCRIPTION_CACHE_DIR is set"""
+        cache_dir = os.getenv('TRANSCRIPTION_CACHE_DIR')
+        if not cache_dir:
+            return None
+        try:
+            return TranscriptionCache(
+                cache_dir,
+                int(float(os.getenv('TRANSCRIPTION_CACHE_MAX_MB', 512)) * 1024 * 1024),
+                {
+                    'engine': self.engine_name,
+                    'model': self.model_name,
+                    'compute_type': os.getenv('WHISPER_COMPUTE_TYPE', 'int8'),
+                    'decoding': self.decoding,
+                    'adaptive_thresholds': [ADAPTIVE_LOGPROB_THRESHOLD, ADAPTIVE_COMPRESSION_THRESHOLD],
+                    'vad': self.vad_enabled,
+                    'options': TRANSCRIBE_OPTIONS
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Transcription cache disabled: {e}")
+            return None
+
+    async def _cache_key(self, file_path: str) -> Optional[str]:
+        """Cache key for a file, or None when caching is off or the file cannot be read"""
+        if not self.cache or not os.path.exists(file_path):
+            return None
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self.cache.key_for, file_path)
+        except Exception as e:
+            logger.warning(f"Could not hash {file_path} for the transcription cache: {e}")
+            return None
+
+    def _cached_result(self, file_path: str, cache_key: Optional[str], start_time: float) -> Optional[Dict[str, Any]]:
+        """Look a file up in the cache; hits report only the lookup time as processing time"""
+        if not cache_key:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+        logger.info(f"Transcription cache hit for {file_path}")
+        cached['processing_time_ms'] = int((time.time() - start_time) * 1000)
+        cached['cached'] = True
+        return cached
+
+    async def lookup_cached(self, file_path: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """
+        Look a file up in the cache before decoding it
+
+        Returns (cached result or None, cache key). On a miss, pass the key
+        back to transcribe_audio/transcribe_batch so the file is not hashed
+        and looked up a second time.
+        """
+        start_time = time.time()
+        cache_key = await self._cache_key(file_path)
+        return self._cached_result(file_path, cache_key, start_time), cache_key
+
+    async def _store_result(self, cache_key: Optional[str], result: Dict[str, Any]):
+        if cache_key and result['success']:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.cache.put, cache_key, result)
 
     def _load_model(self):
-        """Load the Whisper model"""
+        """Load the transcription engine"""
         try:
-            logger.info(f"Loading Whisper model: {self.model_name}")
-            self.model = whisper.load_model(self.model_name, device=self.device)
-            logger.info("Whisper model loaded successfully")
+            self.engine = create_transcription_engine(self.engine_name, self.model_name, self.device)
+            self.engine_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='transcriber')
+            logger.info("Transcription model loaded successfully")
         except Exception as e:
-            logger.error(f"Failed to load Whisper model: {e}")
+            logger.error(f"Failed to load transcription model: {e}")
             raise
 
-    async def transcribe_audio(self, file_path: str) -> Dict[str, Any]:
-        """Transcribe an audio file using Whisper"""
+    def _start_process_pool(self):
+        """Start the transcription process pool and wait for every process to load its model"""
         try:
-            if not os.path.exists(file_path):
+            logger.info(f"Starting {self.num_processes} {self.engine_name} process(es) "
+                        f"with {self.torch_threads} thread(s) each, model: {self.model_name}")
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.num_processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_process,
+                initargs=(self.engine_name, self.model_name, self.device, self.torch_threads)
+            )
+            # Submitting one task per process spawns the whole pool up front
+            warmups = [self.executor.submit(process_ready) for _ in range(self.num_processes)]
+            pids = {warmup.result() for warmup in warmups}
+            logger.info(f"Transcription process pool ready ({len(pids)} process(es) loaded)")
+        except Exception as e:
+            logger.error(f"Failed to start transcription process pool: {e}")
+            self.shutdown()
+            raise
+
+    def shutdown(self):
+        """Stop the transcription process pool or engine thread if one is running"""
+        if self.executor:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.engine_thread:
+            self.engine_thread.shutdown(wait=True, cancel_futures=True)
+            self.engine_thread = None
+
+    async def transcribe_audio(self, file_path: str, audio: DecodedAudio = None,
+                               cache_key: Optional[str] = None, looked_up: bool = False) -> Dict[str, Any]:
+        """
+        Transcribe an audio file using Whisper
+        
+        Pass the already decoded audio to skip decoding the file again, and
+        looked_up=True with the key from lookup_cached to skip the cache lookup.
+        """
+        try:
+            if audio is None and not os.path.exists(file_path):
                 return {
                     'success': False,
                     'error': f'Audio file not found: {file_path}'
@@ -40,53 +167,31 @@ class WhisperTranscriber:
             logger.info(f"Starting transcription of: {file_path}")
             start_time = time.time()
 
-            # Get audio duration first
-            duration_seconds = self._get_audio_duration(file_path)
+            # Identical audio with identical settings was transcribed before - reuse it
+            if not looked_up:
+                cache_key = await self._cache_key(file_path)
+                cached = self._cached_result(file_path, cache_key, start_time)
+                if cached:
+                    return cached
 
-            # Run transcription in a thread pool to avoid blocking
             loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None, 
-                self._transcribe_sync, 
-                file_path
-            )
+            prepared = await self._prepare_audio(file_path, audio)
 
-            processing_time = int((time.time() - start_time) * 1000)
-            
-            if result is None:
-                return {
-                    'success': False,
-                    'error': 'Transcription returned no result'
-                }
+            # Run transcription in the process pool or on the engine thread to avoid blocking
+            if self.executor:
+                result = await loop.run_in_executor(self.executor, transcribe_in_process,
+                                                    prepared['samples'], self.decoding)
+            else:
+                result = await loop.run_in_executor(
+                    self.engine_thread, 
+                    self._transcribe_sync, 
+                    prepared['samples']
+                )
 
-            # Extract text and segments
-            text = result['text'].strip()
-            segments = result.get('segments', [])
-            
-            # Calculate average confidence from segments
-            confidence = 0.0
-            if segments:
-                confidence_scores = [
-                    segment.get('avg_logprob', 0.0) 
-                    for segment in segments 
-                    if 'avg_logprob' in segment
-                ]
-                if confidence_scores:
-                    # Convert log probabilities to confidence (0-1 scale)
-                    confidence = max(0.0, min(1.0, (sum(confidence_scores) / len(confidence_scores) + 1.0) / 2.0))
-
-            logger.info(f"Transcription completed in {processing_time}ms")
-            logger.info(f"Transcribed text: {text[:100]}...")
-            
-            return {
-                'success': True,
-                'text': text,
-                'confidence': confidence,
-                'processing_time_ms': processing_time,
-                'segments': segments,
-                'language': result.get('language', 'unknown'),
-                'duration_seconds': duration_seconds
-            }
+            processing_time = int((time.time() - start_time) * 1000)
+            transcription = self._build_result(result, prepared, processing_time)
+            await self._store_result(cache_key, transcription)
+            return transcription
 
         except Exception as e:
             logger.error(f"Transcription error: {str(e)}")
@@ -95,34 +200,152 @@ class WhisperTranscriber:
                 'error': str(e)
             }
 
-    def _get_audio_duration(self, file_path: str) -> float:
-        """Get audio file duration in seconds"""
+    async def transcribe_batch(self, items: List[Tuple[str, Optional[DecodedAudio]]],
+                               cache_keys: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+        """
+        Transcribe several audio files with one batched engine call
+
+        Meant for draining a backlog: the engine packs the 30-second windows
+        of every file into shared encoder/decoder batches. Takes
+        (file_path, decoded audio or None) pairs and returns one
+        transcribe_audio-shaped result per item, in order. The batch's
+        processing time is split between files by their share of the audio.
+        Pass the keys from lookup_cached as cache_keys when the files were
+        already looked up.
+        """
+        results = [None] * len(items)
+        looked_up = cache_keys is not None
+        cache_keys = list(cache_keys) if looked_up else [None] * len(items)
+        prepared_items = []
+        start_time = time.time()
+        for index, (file_path, audio) in enumerate(items):
+            try:
+                if audio is None and not os.path.exists(file_path):
+                    raise FileNotFoundError(f'Audio file not found: {file_path}')
+                if not looked_up:
+                    cache_keys[index] = await self._cache_key(file_path)
+                    cached = self._cached_result(file_path, cache_keys[index], time.time())
+                    if cached:
+                        results[index] = cached
+                        continue
+                prepared_items.append((index, await self._prepare_audio(file_path, audio)))
+            except Exception as e:
+                logger.error(f"Transcription error for {file_path}: {str(e)}")
+                results[index] = {'success': False, 'error': str(e)}
+
+        if not prepared_items:
+            return results
+
         try:
-            data, samplerate = sf.read(file_path)
-            duration = len(data) / samplerate
-            logger.info(f"Audio duration: {duration:.2f} seconds")
-            return round(duration, 2)
+            logger.info(f"Starting batched transcription of {len(prepared_items)} file(s)")
+            batch = [prepared['samples'] for _, prepared in prepared_items]
+            loop = asyncio.get_event_loop()
+            if self.executor:
+                batch_results = await loop.run_in_executor(self.executor, transcribe_batch_in_process,
+                                                          batch, self.decoding)
+            else:
+                batch_results = await loop.run_in_executor(self.engine_thread, decode_batch,
+                                                          self.engine, batch, self.decoding)
         except Exception as e:
-            logger.warning(f"Could not get audio duration: {e}")
-            return 0.0
+            logger.error(f"Batched transcription error: {str(e)}")
+            for index, _ in prepared_items:
+                results[index] = {'success': False, 'error': str(e)}
+            return results
+
+        elapsed_ms = (time.time() - start_time) * 1000
+        total_samples = max(1, sum(len(samples) for samples in batch))
+        for (index, prepared), result in zip(prepared_items, batch_results):
+            processing_time = int(elapsed_ms * len(prepared['samples']) / total_samples)
+            try:
+                results[index] = self._build_result(result, prepared, processing_time)
+                await self._store_result(cache_keys[index], results[index])
+            except Exception as e:
+                logger.error(f"Transcription error for {items[index][0]}: {str(e)}")
+                results[index] = {'success': False, 'error': str(e)}
+
+        logger.info(f"Batched transcription of {len(prepared_items)} file(s) completed in {int(elapsed_ms)}ms")
+        return results
+
+    async def _prepare_audio(self, file_path: str, audio: Optional[DecodedAudio]) -> Dict[str, Any]:
+        """Decode if needed, read the duration and cut silence; returns what the engine should see"""
+        loop = asyncio.get_event_loop()
+        if audio is None:
+            audio = await loop.run_in_executor(None, load_audio, file_path)
+
+        # Duration comes from the file headers; the decoded length is the fallback
+        metadata = await loop.run_in_executor(None, probe_audio, file_path)
+        duration_seconds = metadata['duration_seconds'] if metadata else audio.duration_seconds
+        logger.info(f"Audio duration: {duration_seconds:.2f} seconds")
+
+        samples, offsets = audio.samples, None
+        speech_seconds = audio.duration_seconds
+        if self.vad_enabled:
+            segments = await loop.run_in_executor(None, lambda: audio.speech_segments)
+            if worth_trimming(segments, len(audio)):
+                samples, offsets = concatenate_segments(audio.samples, segments, audio.sample_rate)
+                speech_seconds = round(sum(end - start for start, end in segments) / audio.sample_rate, 2)
+                logger.info(f"VAD kept {speech_seconds:.2f}s of speech in {len(segments)} segment(s) "
+                            f"out of {audio.duration_seconds:.2f}s")
 
-    def _transcribe_sync(self, file_path: str):
+        return {
+            'samples': samples,
+            'offsets': offsets,
+            'duration_seconds': duration_seconds,
+            'speech_seconds': speech_seconds
+        }
+
+    def _build_result(self, result: Optional[Dict[str, Any]], prepared: Dict[str, Any],
+                      processing_time: int) -> Dict[str, Any]:
+        """Turn an engine result into the transcription result stored by the worker"""
+        if result is None:
+            return {
+                'success': False,
+                'error': 'Transcription returned no result'
+            }
+
+        # Extract text and segments
+        text = result['text'].strip()
+        segments = result.get('segments', [])
+        
+        # Put segment timings back on the original recording's timeline
+        offsets = prepared['offsets']
+        if offsets:
+            for segment in segments:
+                segment['start'] = remap_timestamp(segment['start'], offsets)
+                segment['end'] = remap_timestamp(segment['end'], offsets)
+        
+        # Calculate average confidence from segments
+        confidence = 0.0
+        if segments:
+            confidence_scores = [
+                segment.get('avg_logprob', 0.0) 
+                for segment in segments 
+                if 'avg_logprob' in segment
+            ]
+            if confidence_scores:
+                # Convert log probabilities to confidence (0-1 scale)
+                confidence = max(0.0, min(1.0, (sum(confidence_scores) / len(confidence_scores) + 1.0) / 2.0))
+
+        logger.info(f"Transcription completed in {processing_time}ms "
+                    f"({result.get('decoding_strategy', 'beam')} decoding)")
+        logger.info(f"Transcribed text: {text[:100]}...")
+        
+        return {
+            'success': True,
+            'text': text,
+            'confidence': confidence,
+            'processing_time_ms': processing_time,
+            'segments': segments,
+            'language': result.get('language', 'unknown'),
+            'duration_seconds': prepared['duration_seconds'],
+            'speech_seconds': prepared['speech_seconds'],
+            'decoding_strategy': result.get('decoding_strategy', 'beam')
+        }
+
+    def _transcribe_sync(self, samples: np.ndarray):
         """Synchronous transcription method"""
         try:
-            # Whisper transcription options
-            options = {
-                'language': 'en',  # Assuming English for workout audio
-                'task': 'transcribe',
-                'temperature': 0.0,  # More deterministic results
-                'best_of': 1,
-                'beam_size': 5,
-                'patience': 1.0,
-                'length_penalty': 1.0,
-                'suppress_tokens': "-1",
-                'initial_prompt': "This is a recording of someone describing their workout exercises, including reps, sets, weights, and effort levels."
-            }
-            
-            result = self.model.transcribe(file_path, **options)
+            result = decode(self.engine, samples, self.decoding)
             return result
             
         except Exception as e:
@@ -133,14 +356,19 @@ class WhisperTranscriber:
         """Get information about the loaded model"""
         return {
             'model_name': self.model_name,
+            'engine': self.engine_name,
+            'decoding': self.decoding,
+            'cache': self.cache.get_stats() if self.cache else None,
             'device': self.device,
-            'model_loaded': self.model is not None
+            'executor': self.executor_mode,
+            'processes': self.num_processes if self.executor else 0,
+            'model_loaded': self.engine is not None or self.executor is not None
         }
 
     async def health_check(self) -> bool:
         """Check if the transcriber is working properly"""
         try:
-            if self.model is None:
+            if self.engine is None and self.executor is None:
                 return False
             
             # Could add a test transcription here if needed
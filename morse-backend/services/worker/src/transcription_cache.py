@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class TranscriptionCache:
+    """
+    Content-addressed on-disk cache of transcription results.
+
+    Entries are keyed by the SHA-256 of the audio file bytes together with
+    everything that changes the transcript (engine, model, decoding policy,
+    VAD and the decoding options), so a re-upload of the same bytes or a
+    retry of a file hits the cache while a model or option change misses.
+    Each entry is one JSON file. When the directory grows past max_bytes
+    the least recently used entries (by mtime, bumped on every hit) are
+    deleted.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, context: Dict[str, Any]):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Fingerprint of the transcription settings, mixed into every key
+        self.context_hash = hashlib.sha256(json.dumps(context, sort_keys=True).encode()).hexdigest()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir)
+                               if entry.name.endswith('.json'))
+        logger.info(f"Transcription cache at {cache_dir}: {self.total_bytes / 1e6:.1f}MB "
+                    f"of {max_bytes / 1e6:.0f}MB used")
+
+    def key_for(self, file_path: str) -> str:
+        """Hash the audio file contents and the transcription settings into a cache key"""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(self.context_hash.encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+            self.hits += 1
+            return result
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable transcription cache entry {key}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Store a result and evict old entries if the cache is over its size limit"""
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f)
+            size = os.path.getsize(tmp_path)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.total_bytes += size - previous
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        except Exception as e:
+            logger.warning(f"Could not write transcription cache entry {key}: {e}")
+            self._remove(tmp_path)
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is 90% of max_bytes"""
+        with self.lock:
+            entries = sorted(
+                (entry for entry in os.scandir(self.cache_dir) if entry.name.endswith('.json')),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            self.total_bytes = sum(entry.stat().st_size for entry in entries)
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for entry in entries:
+                if self.total_bytes <= target:
+                    break
+                size = entry.stat().st_size
+                if self._remove(entry.path):
+                    self.total_bytes -= size
+                    removed += 1
+            logger.info(f"Evicted {removed} transcription cache entries "
+                        f"({self.total_bytes / 1e6:.1f}MB left)")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and disk usage"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes
+        }
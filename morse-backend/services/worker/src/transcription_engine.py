@@ -0,0 +1,299 @@
+import os
+import logging
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Whisper transcription options
+TRANSCRIBE_OPTIONS = {
+    'language': 'en',  # Assuming English for workout audio
+    'task': 'transcribe',
+    'temperature': 0.0,  # More deterministic results
+    'best_of': 1,
+    'beam_size': 5,
+    'patience': 1.0,
+    'length_penalty': 1.0,
+    'suppress_tokens': "-1",
+    'initial_prompt': "This is a recording of someone describing their workout exercises, including reps, sets, weights, and effort levels."
+}
+
+# First pass of the adaptive policy: the same options with greedy decoding
+GREEDY_OPTIONS = dict(TRANSCRIBE_OPTIONS, beam_size=None, patience=None)
+
+# Greedy segments below this avg_logprob or above this compression ratio
+# (a sign of repetition loops) are re-decoded with beam search
+ADAPTIVE_LOGPROB_THRESHOLD = float(os.getenv('ADAPTIVE_LOGPROB_THRESHOLD', -0.5))
+ADAPTIVE_COMPRESSION_THRESHOLD = float(os.getenv('ADAPTIVE_COMPRESSION_THRESHOLD', 2.4))
+
+SAMPLE_RATE = 16000
+
+class TranscriptionEngine(ABC):
+    """
+    Abstract base class for speech-to-text backends
+
+    transcribe() takes 16 kHz mono float32 samples and returns a dict shaped
+    like openai-whisper's result: 'text', 'language' and 'segments', where
+    each segment has 'start', 'end', 'text' and 'avg_logprob'. options
+    default to TRANSCRIBE_OPTIONS (beam search).
+    """
+
+    name = 'unknown'
+
+    @abstractmethod
+    def __init__(self, model_name: str, device: str, threads: int = 0):
+        pass
+
+    @abstractmethod
+    def transcribe(self, samples: np.ndarray, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        pass
+
+    def transcribe_batch(self, batch: List[np.ndarray],
+                         options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Transcribe several recordings; engines that can batch the model calls override this"""
+        return [self.transcribe(samples, options) for samples in batch]
+
+    def transcribe_adaptive(self, samples: np.ndarray) -> Dict[str, Any]:
+        """Decode greedily, then beam-search only the segments greedy decoding was unsure of"""
+        return self.refine_segments(samples, self.transcribe(samples, GREEDY_OPTIONS))
+
+    def transcribe_batch_adaptive(self, batch: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """transcribe_adaptive for several recordings, with the greedy pass batched"""
+        results = self.transcribe_batch(batch, GREEDY_OPTIONS)
+        return [self.refine_segments(samples, result) for samples, result in zip(batch, results)]
+
+    def refine_segments(self, samples: np.ndarray, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Re-decode the weak segments of a greedy result with beam search
+
+        A segment is weak when its avg_logprob is below
+        ADAPTIVE_LOGPROB_THRESHOLD or its compression ratio is above
+        ADAPTIVE_COMPRESSION_THRESHOLD. Its audio span is decoded again with
+        TRANSCRIBE_OPTIONS, and the beam text replaces the greedy text only
+        if it scores a higher avg_logprob, so the stored confidence never
+        drops below the greedy pass. Sets 'decoding_strategy' to 'greedy'
+        or 'greedy+beam' and 'redecoded_segments' to the count replaced.
+        """
+        segments = result.get('segments', [])
+        redecoded = 0
+        for segment in segments:
+            if segment.get('avg_logprob', 0.0) >= ADAPTIVE_LOGPROB_THRESHOLD and \
+                    segment.get('compression_ratio', 0.0) <= ADAPTIVE_COMPRESSION_THRESHOLD:
+                continue
+
+            start = max(0, int(segment['start'] * SAMPLE_RATE))
+            end = min(len(samples), int(segment['end'] * SAMPLE_RATE))
+            if end - start < SAMPLE_RATE // 10:
+                continue
+
+            beam_segments = self.transcribe(samples[start:end], TRANSCRIBE_OPTIONS).get('segments', [])
+            if not beam_segments:
+                continue
+            beam_logprob = sum(beam['avg_logprob'] for beam in beam_segments) / len(beam_segments)
+            if beam_logprob <= segment.get('avg_logprob', 0.0):
+                continue
+
+            segment.update({
+                'text': ''.join(beam['text'] for beam in beam_segments),
+                'tokens': [token for beam in beam_segments for token in beam.get('tokens', [])],
+                'avg_logprob': beam_logprob,
+                'compression_ratio': max(beam.get('compression_ratio', 0.0) for beam in beam_segments)
+            })
+            redecoded += 1
+
+        if redecoded:
+            result['text'] = ''.join(segment['text'] for segment in segments)
+        result['decoding_strategy'] = 'greedy+beam' if redecoded else 'greedy'
+        result['redecoded_segments'] = redecoded
+        return result
+
+class OpenAIWhisperEngine(TranscriptionEngine):
+    """Reference openai-whisper backend running on PyTorch"""
+
+    name = 'whisper'
+
+    def __init__(self, model_name: str, device: str, threads: int = 0):
+        import torch
+        import whisper
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_name, device=device)
+        # Windows per encoder/decoder batch in transcribe_batch
+        self.batch_size = max(1, int(os.getenv('WHISPER_BATCH_SIZE', 8)))
+
+    def transcribe(self, samples: np.ndarray, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self.model.transcribe(samples, **(options or TRANSCRIBE_OPTIONS))
+
+    def transcribe_batch(self, batch: List[np.ndarray],
+                         options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Decode the 30-second windows of several recordings in shared batches
+
+        Every recording is cut into fixed 30-second windows, and up to
+        WHISPER_BATCH_SIZE windows (from any recording) go through the
+        encoder and decoder together. Each window is decoded independently
+        with the initial prompt, unlike transcribe(), which seeks window to
+        window and conditions on the previous text. Most workout clips fit
+        in a single window, where the two are equivalent.
+        """
+        import torch
+        import whisper
+        from whisper.audio import N_SAMPLES, CHUNK_LENGTH
+        from whisper.tokenizer import get_tokenizer
+
+        transcribe_options = options or TRANSCRIBE_OPTIONS
+        options = whisper.DecodingOptions(
+            task=transcribe_options['task'],
+            language=transcribe_options['language'],
+            temperature=transcribe_options['temperature'],
+            beam_size=transcribe_options['beam_size'],
+            patience=transcribe_options['patience'],
+            length_penalty=transcribe_options['length_penalty'],
+            suppress_tokens=transcribe_options['suppress_tokens'],
+            prompt=transcribe_options['initial_prompt'],
+            fp16=self.model.device.type != 'cpu'
+        )
+        tokenizer = get_tokenizer(
+            self.model.is_multilingual,
+            num_languages=self.model.num_languages,
+            language=options.language,
+            task=options.task
+        )
+
+        # (recording index, window offset in seconds, window length in seconds, mel)
+        windows = []
+        for index, samples in enumerate(batch):
+            for start in range(0, max(len(samples), 1), N_SAMPLES):
+                chunk = torch.from_numpy(np.ascontiguousarray(samples[start:start + N_SAMPLES]))
+                mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(chunk), n_mels=self.model.dims.n_mels)
+                windows.append((index, start / SAMPLE_RATE, min(len(chunk) / SAMPLE_RATE, CHUNK_LENGTH), mel))
+
+        segments_by_recording = [[] for _ in batch]
+        for start in range(0, len(windows), self.batch_size):
+            group = windows[start:start + self.batch_size]
+            mels = torch.stack([mel for _, _, _, mel in group]).to(self.model.device)
+            decoded = whisper.decode(self.model, mels, options)
+            for (index, offset, length, _), result in zip(group, decoded):
+                # Same silence test transcribe() applies to a window
+                if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+                    continue
+                segments_by_recording[index].extend(
+                    self._window_segments(result, tokenizer, offset, length)
+                )
+
+        results = []
+        for segments in segments_by_recording:
+            for segment_id, segment in enumerate(segments):
+                segment['id'] = segment_id
+            results.append({
+                'text': ''.join(segment['text'] for segment in segments),
+                'segments': segments,
+                'language': options.language
+            })
+        return results
+
+    @staticmethod
+    def _window_segments(result, tokenizer, offset: float, length: float) -> List[Dict[str, Any]]:
+        """Split a decoded window at its timestamp tokens into segments on the recording's timeline"""
+        timestamp_begin = tokenizer.timestamp_begin
+        segments = []
+        start, text_tokens = None, []
+
+        def close(end: float):
+            segments.append({
+                'seek': int(offset * 100),
+                'start': round(offset + start, 2),
+                'end': round(offset + min(end, length), 2),
+                'text': tokenizer.decode(text_tokens),
+                'tokens': list(text_tokens),
+                'temperature': result.temperature,
+                'avg_logprob': result.avg_logprob,
+                'compression_ratio': result.compression_ratio,
+                'no_speech_prob': result.no_speech_prob
+            })
+
+        for token in result.tokens:
+            if token >= timestamp_begin:
+                # <|t0|> text <|t1|>: a timestamp after text closes the segment
+                time_seconds = (token - timestamp_begin) * 0.02
+                if start is not None and text_tokens:
+                    close(time_seconds)
+                    start, text_tokens = None, []
+                elif start is None:
+                    start = time_seconds
+            else:
+                if start is None:
+                    start = 0.0
+                text_tokens.append(token)
+
+        if text_tokens:
+            close(length)
+        return segments
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """
+    faster-whisper backend running the same Whisper checkpoints on CTranslate2
+
+    Weights are quantized at load time to WHISPER_COMPUTE_TYPE (int8 by
+    default), which is several times faster than PyTorch fp32 on CPU.
+    """
+
+    name = 'faster-whisper'
+
+    def __init__(self, model_name: str, device: str, threads: int = 0):
+        from faster_whisper import WhisperModel
+        self.compute_type = os.getenv('WHISPER_COMPUTE_TYPE', 'int8')
+        self.model = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=self.compute_type,
+            cpu_threads=max(0, threads)
+        )
+
+    def transcribe(self, samples: np.ndarray, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        options = dict(options or TRANSCRIBE_OPTIONS)
+        options['suppress_tokens'] = [int(token) for token in options['suppress_tokens'].split(',')]
+        # CTranslate2 spells greedy decoding as a beam of one
+        if options['beam_size'] is None:
+            options['beam_size'] = 1
+            options['patience'] = 1.0
+        segments, info = self.model.transcribe(samples, **options)
+
+        # Segments are generated lazily; decoding happens while iterating
+        result_segments = [
+            {
+                'id': segment.id,
+                'seek': segment.seek,
+                'start': segment.start,
+                'end': segment.end,
+                'text': segment.text,
+                'tokens': list(segment.tokens),
+                'temperature': segment.temperature,
+                'avg_logprob': segment.avg_logprob,
+                'compression_ratio': segment.compression_ratio,
+                'no_speech_prob': segment.no_speech_prob
+            }
+            for segment in segments
+        ]
+        return {
+            'text': ''.join(segment['text'] for segment in result_segments),
+            'segments': result_segments,
+            'language': info.language
+        }
+
+TRANSCRIPTION_ENGINES = {
+    'whisper': OpenAIWhisperEngine,
+    'openai-whisper': OpenAIWhisperEngine,
+    'faster-whisper': FasterWhisperEngine,
+    'ctranslate2': FasterWhisperEngine
+}
+
+def create_transcription_engine(engine_name: str, model_name: str, device: str, threads: int = 0) -> TranscriptionEngine:
+    """Instantiate a transcription engine by name (see TRANSCRIPTION_ENGINES)"""
+    engine_class = TRANSCRIPTION_ENGINES.get(engine_name.lower())
+    if engine_class is None:
+        raise ValueError(f"Unknown transcription engine '{engine_name}'. "
+                         f"Choose one of: {', '.join(sorted(TRANSCRIPTION_ENGINES))}")
+    logger.info(f"Loading {engine_class.name} engine with model: {model_name}")
+    return engine_class(model_name, device, threads)
@@ -0,0 +1,41 @@
+import os
+import time
+import numpy as np
+from typing import List
+from transcription_engine import create_transcription_engine
+
+# Entry points for the spawn-started transcription process pool. Each child
+# unpickles these by module name, so this module imports nothing beyond the
+# engine it loads: no torch, asyncio, audio or cache modules at startup.
+
+# Engine owned by a process-pool worker, loaded once by init_process
+_process_engine = None
+
+def init_process(engine_name: str, model_name: str, device: str, threads: int):
+    """Process-pool initializer: load the engine once, pinned to the given thread count"""
+    global _process_engine
+    _process_engine = create_transcription_engine(engine_name, model_name, device, threads)
+
+def decode(engine, samples: np.ndarray, decoding: str):
+    """Run the engine with the configured decoding policy"""
+    if decoding == 'adaptive':
+        return engine.transcribe_adaptive(samples)
+    return engine.transcribe(samples)
+
+def decode_batch(engine, batch: List[np.ndarray], decoding: str):
+    if decoding == 'adaptive':
+        return engine.transcribe_batch_adaptive(batch)
+    return engine.transcribe_batch(batch)
+
+def transcribe_in_process(samples: np.ndarray, decoding: str):
+    """Transcribe with the engine preloaded in this pool process"""
+    return decode(_process_engine, samples, decoding)
+
+def transcribe_batch_in_process(batch: List[np.ndarray], decoding: str):
+    """Batch-transcribe with the engine preloaded in this pool process"""
+    return decode_batch(_process_engine, batch, decoding)
+
+def process_ready() -> int:
+    """Warm-up task; returning means the initializer has loaded the model"""
+    time.sleep(0.1)
+    return os.getpid()
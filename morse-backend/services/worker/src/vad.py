@@ -0,0 +1,140 @@
+import os
+import logging
+import numpy as np
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Speech segments are (start_sample, end_sample) pairs, end exclusive
+Segment = Tuple[int, int]
+
+FRAME_SECONDS = 0.02
+# Kept low so quiet or distant speech stays in; trimming too little only costs time
+THRESHOLD_MARGIN_DB = float(os.getenv('VAD_THRESHOLD_MARGIN_DB', 6.0))
+MIN_SPEECH_SECONDS = 0.2
+MIN_SILENCE_SECONDS = 0.4
+PADDING_SECONDS = 0.25
+# Skip trimming when it would remove less than this share of the audio
+MIN_TRIM_RATIO = 0.1
+
+def vad_enabled() -> bool:
+    """Off unless VAD_ENABLED=true; a dropped quiet set is worse than a slower transcription"""
+    return os.getenv('VAD_ENABLED', 'false').lower() == 'true'
+
+def _frame_energy_db(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """RMS energy per non-overlapping frame, in dBFS"""
+    frame_count = len(samples) // frame_length
+    frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+    return 10.0 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-10)
+
+def detect_speech(samples: np.ndarray, sample_rate: int) -> List[Segment]:
+    """
+    Energy-based voice activity detection
+
+    Frames more than THRESHOLD_MARGIN_DB above the estimated noise floor
+    (the 20th percentile frame energy) count as voiced. Voiced runs closer
+    than MIN_SILENCE_SECONDS are merged, runs shorter than MIN_SPEECH_SECONDS
+    are dropped and the survivors are padded by PADDING_SECONDS on each side.
+    """
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    if len(samples) < frame_length:
+        return [(0, len(samples))] if len(samples) else []
+
+    energy = _frame_energy_db(samples, frame_length)
+    noise_floor = np.percentile(energy, 20)
+    voiced = energy > max(noise_floor + THRESHOLD_MARGIN_DB, -60.0)
+    if not voiced.any():
+        return []
+
+    # Start/end frame of every voiced run
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    min_silence = int(MIN_SILENCE_SECONDS / FRAME_SECONDS)
+    min_speech = int(MIN_SPEECH_SECONDS / FRAME_SECONDS)
+    padding = int(PADDING_SECONDS * sample_rate)
+
+    merged = []
+    for start, end in zip(starts, ends):
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    segments = []
+    for start, end in merged:
+        if end - start < min_speech:
+            continue
+        start_sample = max(0, start * frame_length - padding)
+        end_sample = min(len(samples), end * frame_length + padding)
+        if segments and start_sample <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], end_sample)
+        else:
+            segments.append((start_sample, end_sample))
+    return segments
+
+def worth_trimming(segments: List[Segment], total_samples: int) -> bool:
+    """True when the segments drop enough silence to be worth using"""
+    if not segments or total_samples == 0:
+        return False
+    voiced = sum(end - start for start, end in segments)
+    return voiced <= total_samples * (1.0 - MIN_TRIM_RATIO)
+
+def concatenate_segments(samples: np.ndarray, segments: List[Segment], sample_rate: int,
+                         gap_seconds: float = 0.3) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """
+    Join the voiced segments with short silences in between
+
+    Returns:
+        The joined buffer and, per segment, (start in buffer, start in
+        original) in seconds, for remap_timestamp
+    """
+    gap = np.zeros(int(gap_seconds * sample_rate), dtype=samples.dtype)
+    pieces, offsets = [], []
+    position = 0
+    for index, (start, end) in enumerate(segments):
+        if index:
+            pieces.append(gap)
+            position += len(gap)
+        offsets.append((position / sample_rate, float(start) / sample_rate))
+        pieces.append(samples[start:end])
+        position += end - start
+    return np.concatenate(pieces), offsets
+
+def remap_timestamp(seconds: float, offsets: List[Tuple[float, float]]) -> float:
+    """Map a time in a concatenate_segments buffer back onto the original recording"""
+    buffer_start, original_start = offsets[0]
+    for candidate_buffer_start, candidate_original_start in offsets:
+        if candidate_buffer_start > seconds:
+            break
+        buffer_start, original_start = candidate_buffer_start, candidate_original_start
+    return round(float(original_start + (seconds - buffer_start)), 2)
+
+def best_voiced_audio(samples: np.ndarray, segments: List[Segment], sample_rate: int,
+                      max_seconds: float = 30.0) -> np.ndarray:
+    """
+    Pick up to max_seconds of the loudest voiced audio, kept in time order
+
+    Segments are ranked by mean energy, which favours close, clearly spoken
+    sets over distant chatter; the last segment taken is cut to fit.
+    """
+    if not segments:
+        return samples[:int(max_seconds * sample_rate)]
+
+    ranked = sorted(
+        segments,
+        key=lambda segment: float(np.mean(samples[segment[0]:segment[1]].astype(np.float64) ** 2)),
+        reverse=True
+    )
+    budget = int(max_seconds * sample_rate)
+    chosen = []
+    for start, end in ranked:
+        if budget <= 0:
+            break
+        end = min(end, start + budget)
+        chosen.append((start, end))
+        budget -= end - start
+
+    chosen.sort()
+    return np.concatenate([samples[start:end] for start, end in chosen])
@@ -0,0 +1,246 @@
+import os
+import logging
+import numpy as np
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class VoiceProfileIndex:
+    """
+    IVF (inverted file) index over L2-normalized voice embeddings.
+
+    Vectors are partitioned by their nearest of n_lists spherical k-means
+    centroids. A query only scans the n_probe partitions whose centroids are
+    closest to the probe, then re-scores those candidates exactly against
+    their full float32 vectors. A hit therefore has the same similarity
+    brute force would report, so the auto-link threshold is unaffected.
+
+    Entries are keyed by profile id and can be added, replaced or removed
+    one at a time. The centroids are retrained once the index has grown
+    4x past the size they were trained on.
+    """
+
+    # Below this size a query scans everything; the partitions would not pay off
+    BRUTE_FORCE_LIMIT = 2048
+
+    def __init__(self, dim: int = 192, n_lists: int = None, n_probe: int = None, seed: int = 0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe or int(os.getenv('VOICE_INDEX_NPROBE', 16))
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.trained_size = 0
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.size = 0
+        self.ids = []
+        self.rows = {}
+        self._list_order = None
+        self._list_offsets = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, profile_id: str) -> bool:
+        return profile_id in self.rows
+
+    def build(self, ids: List[str], vectors):
+        """Replace the index contents and train centroids on them"""
+        vectors = self._normalize(vectors)
+        self.size = len(ids)
+        self.ids = list(ids)
+        self.rows = {profile_id: row for row, profile_id in enumerate(self.ids)}
+        self.vectors = vectors
+        self._train()
+
+    def add(self, ids: List[str], vectors):
+        """Insert or replace entries, retraining when the index has outgrown its centroids"""
+        if len(ids) == 0:
+            return
+        vectors = self._normalize(vectors)
+
+        new_rows = []
+        for profile_id, vector in zip(ids, vectors):
+            row = self.rows.get(profile_id)
+            if row is None:
+                row = self.size
+                self._reserve(self.size + 1)
+                self.ids.append(profile_id)
+                self.rows[profile_id] = row
+                self.size += 1
+            self.vectors[row] = vector
+            new_rows.append(row)
+
+        if self.centroids is None or self.size > 4 * max(self.trained_size, self.BRUTE_FORCE_LIMIT // 4):
+            self._train()
+        else:
+            new_rows = np.asarray(new_rows, dtype=np.int64)
+            self.assignments[new_rows] = self._assign(self.vectors[new_rows])
+            self._list_order = None
+
+    def remove(self, ids: List[str]):
+        """Remove entries by moving the last row into each freed slot"""
+        for profile_id in ids:
+            row = self.rows.pop(profile_id, None)
+            if row is None:
+                continue
+            last = self.size - 1
+            if row != last:
+                moved_id = self.ids[last]
+                self.vectors[row] = self.vectors[last]
+                self.assignments[row] = self.assignments[last]
+                self.ids[row] = moved_id
+                self.rows[moved_id] = row
+            self.ids.pop()
+            self.size -= 1
+        self._list_order = None
+
+    def search(self, probe, top_k: int = 1, n_probe: int = None) -> List[Tuple[str, float]]:
+        """
+        Find the entries closest to a probe embedding
+
+        Returns:
+            Up to top_k (profile_id, cosine_similarity) pairs, best first
+        """
+        if self.size == 0:
+            return []
+
+        probe = np.asarray(probe, dtype=np.float32)
+        probe = probe / max(float(np.linalg.norm(probe)), 1e-12)
+        vectors = self.vectors[:self.size]
+
+        if self.centroids is None or self.size <= self.BRUTE_FORCE_LIMIT:
+            rows = None
+            scores = vectors @ probe
+        else:
+            n_probe = min(n_probe or self.n_probe, len(self.centroids))
+            centroid_scores = self.centroids @ probe
+            lists = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+
+            order, offsets = self._inverted_lists()
+            rows = np.concatenate([order[offsets[list_id]:offsets[list_id + 1]] for list_id in lists])
+            if len(rows) == 0:
+                return []
+            # Exact re-scoring of the candidates against their full vectors
+            scores = vectors[rows] @ probe
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        if rows is not None:
+            return [(self.ids[rows[i]], float(scores[i])) for i in best]
+        return [(self.ids[i], float(scores[i])) for i in best]
+
+    def save(self, path: str, metadata: Dict[str, np.ndarray] = None):
+        """Write the index (and optional metadata arrays) to an .npz file atomically"""
+        arrays = {
+            'vectors': self.vectors[:self.size],
+            'assignments': self.assignments[:self.size],
+            'ids': np.asarray(self.ids, dtype=str),
+            'trained_size': np.asarray(self.trained_size),
+            'n_probe': np.asarray(self.n_probe)
+        }
+        if self.centroids is not None:
+            arrays['centroids'] = self.centroids
+        for key, value in (metadata or {}).items():
+            arrays[f'meta_{key}'] = value
+
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved voice profile index ({self.size} entries) to {path}")
+
+    @classmethod
+    def load(cls, path: str) -> Tuple['VoiceProfileIndex', Dict[str, np.ndarray]]:
+        """Load an index saved by save(); returns the index and its metadata arrays"""
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data['vectors']
+            index = cls(dim=vectors.shape[1], n_probe=int(data['n_probe']))
+            index.vectors = np.array(vectors, dtype=np.float32)
+            index.assignments = np.array(data['assignments'], dtype=np.int32)
+            index.size = len(vectors)
+            index.ids = [str(profile_id) for profile_id in data['ids']]
+            index.rows = {profile_id: row for row, profile_id in enumerate(index.ids)}
+            index.trained_size = int(data['trained_size'])
+            if 'centroids' in data:
+                index.centroids = np.array(data['centroids'], dtype=np.float32)
+            metadata = {key[len('meta_'):]: data[key] for key in data.files if key.startswith('meta_')}
+        logger.info(f"Loaded voice profile index ({index.size} entries) from {path}")
+        return index, metadata
+
+    def get_index_info(self) -> Dict[str, Any]:
+        """Get information about the index"""
+        return {
+            'entries': self.size,
+            'lists': 0 if self.centroids is None else len(self.centroids),
+            'n_probe': self.n_probe,
+            'trained_size': self.trained_size
+        }
+
+    def _normalize(self, vectors) -> np.ndarray:
+        vectors = np.array(vectors, dtype=np.float32).reshape(-1, self.dim)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _reserve(self, capacity: int):
+        """Grow the backing arrays geometrically so appends stay amortized O(1)"""
+        if capacity <= len(self.vectors):
+            return
+        new_capacity = max(capacity, 2 * len(self.vectors), 64)
+        vectors = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        assignments = np.zeros(new_capacity, dtype=np.int32)
+        assignments[:self.size] = self.assignments[:self.size]
+        self.vectors = vectors
+        self.assignments = assignments
+
+    def _train(self, iterations: int = 10):
+        """Spherical k-means on a sample of the vectors, then assign every vector"""
+        vectors = self.vectors[:self.size]
+        self.trained_size = self.size
+        self._list_order = None
+        if self.size <= self.BRUTE_FORCE_LIMIT:
+            self.centroids = None
+            self.assignments = np.zeros(len(self.vectors), dtype=np.int32)
+            return
+
+        n_lists = min(self.n_lists or int(4 * np.sqrt(self.size)), self.size)
+        sample_size = min(self.size, n_lists * 32)
+        sample = vectors[self.rng.choice(self.size, sample_size, replace=False)]
+        centroids = sample[self.rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+
+            # Reseed empty lists from random sample points
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[self.rng.choice(sample_size, int(empty.sum()))]
+            centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+        self.centroids = centroids.astype(np.float32)
+        assignments = np.zeros(len(self.vectors), dtype=np.int32)
+        assignments[:self.size] = self._assign(vectors)
+        self.assignments = assignments
+        logger.info(f"Trained voice profile index: {n_lists} lists over {self.size} entries")
+
+    def _assign(self, vectors: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """Nearest centroid per vector, in chunks to bound memory"""
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            labels[start:start + chunk_size] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return labels
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Row ids grouped by list, rebuilt lazily after changes"""
+        if self._list_order is None:
+            assignments = self.assignments[:self.size]
+            self._list_order = np.argsort(assignments, kind='stable')
+            self._list_offsets = np.searchsorted(
+                assignments[self._list_order], np.arange(len(self.centroids) + 1)
+            )
+        return self._list_order, self._list_offsets
@@ -0,0 +1,381 @@
+import re
+import logging
+from typing import Dict, Any, Tuple, Optional
+from session_merge import per_set
+
+logger = logging.getLogger(__name__)
+
+# canonical name: (exercise_type, muscle_groups, spoken aliases, bodyweight)
+# Aliases are matched on word boundaries, longest first, with an optional
+# plural 's'/'es'; spaces in an alias also match hyphens or nothing.
+EXERCISE_LEXICON = {
+    'Bench Press': ('strength', ['chest', 'triceps', 'shoulders'],
+                    ['bench press', 'bench', 'benched', 'flat bench', 'barbell bench', 'chest press'], False),
+    'Incline Bench Press': ('strength', ['chest', 'shoulders', 'triceps'],
+                           ['incline bench press', 'incline bench', 'incline press'], False),
+    'Squats': ('strength', ['quadriceps', 'glutes', 'hamstrings'],
+               ['squat', 'squatted', 'back squat', 'barbell squat'], False),
+    'Front Squats': ('strength', ['quadriceps', 'glutes', 'core'], ['front squat'], False),
+    'Deadlifts': ('strength', ['hamstrings', 'glutes', 'back'],
+                  ['deadlift', 'dead lift', 'deadlifted', 'conventional deadlift', 'sumo deadlift'], False),
+    'Romanian Deadlifts': ('strength', ['hamstrings', 'glutes', 'back'], ['romanian deadlift', 'rdl'], False),
+    'Overhead Press': ('strength', ['shoulders', 'triceps'],
+                       ['overhead press', 'ohp', 'military press', 'shoulder press'], False),
+    'Barbell Rows': ('strength', ['back', 'biceps'],
+                     ['barbell row', 'bent over row', 'bent-over row', 'row'], False),
+    'Pull-ups': ('strength', ['back', 'biceps'], ['pull up', 'pullup'], True),
+    'Chin-ups': ('strength', ['back', 'biceps'], ['chin up', 'chinup'], True),
+    'Push-ups': ('strength', ['chest', 'triceps', 'shoulders'], ['push up', 'pushup'], True),
+    'Dips': ('strength', ['chest', 'triceps'], ['dip'], True),
+    'Bicep Curls': ('strength', ['biceps'],
+                    ['bicep curl', 'biceps curl', 'dumbbell curl', 'barbell curl', 'curl'], False),
+    'Hammer Curls': ('strength', ['biceps', 'forearms'], ['hammer curl'], False),
+    'Tricep Extensions': ('strength', ['triceps'],
+                          ['tricep extension', 'triceps extension', 'skull crusher', 'tricep pushdown'], False),
+    'Lat Pulldowns': ('strength', ['back', 'biceps'], ['lat pulldown', 'lat pull down', 'pulldown', 'pull down'], False),
+    'Leg Press': ('strength', ['quadriceps', 'glutes'], ['leg press'], False),
+    'Lunges': ('strength', ['quadriceps', 'glutes'], ['lunge', 'walking lunge'], True),
+    'Leg Curls': ('strength', ['hamstrings'], ['leg curl', 'hamstring curl'], False),
+    'Leg Extensions': ('strength', ['quadriceps'], ['leg extension'], False),
+    'Calf Raises': ('strength', ['calves'], ['calf raise'], False),
+    'Lateral Raises': ('strength', ['shoulders'], ['lateral raise', 'side raise', 'lat raise'], False),
+    'Hip Thrusts': ('strength', ['glutes', 'hamstrings'], ['hip thrust'], False),
+    'Sit-ups': ('strength', ['core'], ['sit up', 'situp'], True),
+    'Crunches': ('strength', ['core'], ['crunch'], True),
+    'Plank': ('strength', ['core'], ['plank'], True),
+    'Running': ('cardio', ['legs'], ['running', 'run', 'ran', 'jog', 'jogging', 'jogged', 'treadmill'], False),
+    'Cycling': ('cardio', ['legs'], ['cycling', 'bike', 'biking', 'biked', 'spin', 'stationary bike'], False),
+    'Rowing Machine': ('cardio', ['back', 'legs'], ['rowing', 'rower', 'rowing machine', 'erg'], False),
+    'Walking': ('cardio', ['legs'], ['walking', 'walk', 'walked'], False),
+    'Elliptical': ('cardio', ['legs'], ['elliptical'], False),
+    'Jump Rope': ('cardio', ['calves', 'shoulders'], ['jump rope', 'skipping rope'], False),
+}
+
+NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7,
+    'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13, 'fourteen': 14,
+    'fifteen': 15, 'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19
+}
+TENS_WORDS = {
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50,
+    'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90
+}
+
+EFFORT_WORDS = [
+    ('very hard', 9), ('very easy', 3), ('brutal', 9), ('max effort', 10), ('all out', 10),
+    ('hard', 8), ('tough', 8), ('heavy', 7), ('moderate', 6), ('medium', 6), ('light', 4), ('easy', 4)
+]
+
+# Words that carry no workout data of their own
+FILLER_WORDS = {
+    'i', 'did', 'do', 'done', 'then', 'and', 'a', 'an', 'the', 'some', 'of', 'for', 'at', 'with', 'on',
+    'my', 'me', 'it', 'was', 'were', 'just', 'also', 'next', 'after', 'that', 'um', 'uh', 'so', 'okay',
+    'ok', 'each', 'per', 'set', 'sets', 'rep', 'reps', 'repetitions', 'times', 'x', 'by', 'about', 'like',
+    'today', 'got', 'went', 'to', 'in', 'all', 'them', 'those', 'did', 'another', 'more', 'now', 'finished',
+    'worked', 'up', 'working', 'weight', 'again', 'round', 'rounds', 'actually', 'felt', 'pretty'
+}
+
+NUMBER = r'\d+(?:\.\d+)?'
+WEIGHT_UNITS = r'(?:lbs?|pounds?|kgs?|kilos?|kilograms?)'
+UNIT_PATTERNS = {
+    'sets_of': re.compile(rf'\b({NUMBER})\s*sets?\s*(?:of|x|by)\s*({NUMBER})\b(?:\s*reps?)?'),
+    'cross': re.compile(rf'\b({NUMBER})\s*(?:x|by)\s*({NUMBER})\b'),
+    'weight_for': re.compile(rf'\b({NUMBER})\s*{WEIGHT_UNITS}?\s*for\s*({NUMBER})\b(?:\s*reps?)?'),
+    'sets': re.compile(rf'\b({NUMBER})\s*(?:sets?|rounds?)\b'),
+    'reps': re.compile(rf'\b({NUMBER})\s*(?:reps?|repetitions|times)\b'),
+    'weight': re.compile(rf'\b({NUMBER})\s*({WEIGHT_UNITS})(?![a-z])'),
+    'minutes': re.compile(rf'\b({NUMBER})\s*(?:minutes?|mins?)\b'),
+    'seconds': re.compile(rf'\b({NUMBER})\s*(?:seconds?|secs?)\b'),
+    'miles': re.compile(rf'\b({NUMBER})\s*(?:miles?|mi)\b'),
+    'kilometers': re.compile(rf'\b({NUMBER})\s*(?:kilometers?|kilometres?|km|k)\b'),
+    'effort': re.compile(rf'\b(?:rpe|effort(?: level)?)\s*(?:of|was|at)?\s*({NUMBER})\b'),
+}
+
+def _alias_pattern(alias: str) -> str:
+    return r'[\s-]*'.join(re.escape(word) for word in alias.split())
+
+_ALIASES = sorted(
+    ((alias, name) for name, (_, _, aliases, _) in EXERCISE_LEXICON.items() for alias in aliases + [name.lower()]),
+    key=lambda item: len(item[0]),
+    reverse=True
+)
+_EXERCISE_PATTERN = re.compile(
+    r'\b(' + '|'.join(f'(?:{_alias_pattern(alias)})' for alias, _ in _ALIASES) + r')(?:e?s)?\b'
+)
+_ALIAS_LOOKUP = {re.sub(r'[\s-]+', '', alias): name for alias, name in _ALIASES}
+
+def _words_to_numbers(text: str) -> str:
+    """Replace spoken numbers with digits ('one eighty five' -> 185, 'twenty five' -> 25)"""
+    tokens = text.split()
+    output = []
+    index = 0
+    while index < len(tokens):
+        groups, hundreds, consumed = [], None, 0
+        position = index
+        while position < len(tokens):
+            word = tokens[position].replace('-', ' ').split()
+            if len(word) == 2 and word[0] in TENS_WORDS and word[1] in NUMBER_WORDS:
+                groups.append(TENS_WORDS[word[0]] + NUMBER_WORDS[word[1]])
+            elif tokens[position] in TENS_WORDS:
+                value = TENS_WORDS[tokens[position]]
+                if position + 1 < len(tokens) and tokens[position + 1] in NUMBER_WORDS \
+                        and 0 < NUMBER_WORDS[tokens[position + 1]] < 10:
+                    value += NUMBER_WORDS[tokens[position + 1]]
+                    position += 1
+                groups.append(value)
+            elif tokens[position] in NUMBER_WORDS:
+                groups.append(NUMBER_WORDS[tokens[position]])
+            elif tokens[position] == 'hundred' and groups and hundreds is None:
+                hundreds = groups.pop() * 100 if groups else 100
+            elif tokens[position] == 'and' and hundreds is not None:
+                pass
+            else:
+                break
+            position += 1
+        consumed = position - index
+
+        if consumed == 0:
+            output.append(tokens[index])
+            index += 1
+            continue
+
+        if hundreds is not None:
+            output.append(str(hundreds + sum(groups)))
+        elif len(groups) == 2 and groups[0] < 10 and 10 <= groups[1] < 100:
+            # "one eighty five", "two twenty five": spoken plate weights
+            output.append(str(groups[0] * 100 + groups[1]))
+        else:
+            output.extend(str(group) for group in groups)
+        index = position
+    return ' '.join(output)
+
+def normalize_text(text: str) -> str:
+    text = text.lower().replace('’', "'")
+    text = re.sub(r'(\d),(\d{3})', r'\1\2', text)
+    text = re.sub(r"[^\w\s.'-]|(?<!\d)\.|\.(?!\d)", ' ', text)
+    text = re.sub(r'(\d)(?=[a-z])', r'\1 ', text)
+    return _words_to_numbers(' '.join(text.split()))
+
+def _to_number(value: str):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+class _ExerciseMention:
+    def __init__(self, name: str, order: int):
+        self.name = name
+        self.order = order
+        self.sets = None
+        self.reps = None
+        self.weights = None
+        self.pairs = []
+        self.duration_minutes = None
+        self.distance_miles = None
+        self.effort_level = None
+
+def _consume(pattern: re.Pattern, text: str, handler) -> str:
+    """Apply handler to every match (in order) and blank the match out of the text"""
+    def replace(match):
+        handler(match)
+        return ' ' * (match.end() - match.start())
+    return pattern.sub(replace, text)
+
+def _parse_segment(mention: _ExerciseMention, text: str) -> Tuple[int, int]:
+    """
+    Fill a mention from the text spoken about it
+
+    Later values win, since people correct themselves ("5 sets ... 4 sets").
+    Returns (numbers assigned by guessing, words nobody could explain).
+    """
+    exercise_type, _, _, bodyweight = EXERCISE_LEXICON[mention.name]
+
+    def sets_of(match):
+        mention.sets, mention.reps = int(float(match.group(1))), _to_number(match.group(2))
+
+    def cross(match):
+        first, second = float(match.group(1)), float(match.group(2))
+        if first > 20:
+            mention.pairs.append((_to_number(match.group(1)), _to_number(match.group(2))))
+        else:
+            mention.sets, mention.reps = int(first), _to_number(match.group(2))
+
+    def weight_for(match):
+        mention.pairs.append((_to_number(match.group(1)), _to_number(match.group(2))))
+
+    def weight(match):
+        value = float(match.group(1))
+        if match.group(2).startswith('k'):
+            value = round(value * 2.20462)
+        mention.weights = [_to_number(str(value))]
+
+    def minutes(match):
+        mention.duration_minutes = _to_number(match.group(1))
+
+    def seconds(match):
+        mention.duration_minutes = round(float(match.group(1)) / 60.0, 2)
+
+    def miles(match):
+        mention.distance_miles = _to_number(match.group(1))
+
+    def kilometers(match):
+        mention.distance_miles = round(float(match.group(1)) * 0.621371, 2)
+
+    def effort(match):
+        mention.effort_level = _to_number(match.group(1))
+
+    text = _consume(UNIT_PATTERNS['effort'], text, effort)
+    text = _consume(UNIT_PATTERNS['sets_of'], text, sets_of)
+    text = _consume(UNIT_PATTERNS['weight_for'], text, weight_for)
+    text = _consume(UNIT_PATTERNS['cross'], text, cross)
+    text = _consume(UNIT_PATTERNS['sets'], text, lambda match: setattr(mention, 'sets', int(float(match.group(1)))))
+    text = _consume(UNIT_PATTERNS['reps'], text, lambda match: setattr(mention, 'reps', _to_number(match.group(1))))
+    text = _consume(UNIT_PATTERNS['weight'], text, weight)
+    text = _consume(UNIT_PATTERNS['minutes'], text, minutes)
+    text = _consume(UNIT_PATTERNS['seconds'], text, seconds)
+    text = _consume(UNIT_PATTERNS['miles'], text, miles)
+    text = _consume(UNIT_PATTERNS['kilometers'], text, kilometers)
+
+    for phrase, level in EFFORT_WORDS:
+        if re.search(rf'\b{phrase}\b', text):
+            if mention.effort_level is None:
+                mention.effort_level = level
+            text = re.sub(rf'\b{phrase}\b', ' ', text)
+
+    # Bare numbers: place them by magnitude where the slot is still empty
+    guessed, unexplained = 0, 0
+    for token in text.split():
+        if re.fullmatch(NUMBER, token):
+            value = float(token)
+            if exercise_type == 'cardio':
+                if mention.duration_minutes is None:
+                    mention.duration_minutes = _to_number(token)
+                    guessed += 1
+                else:
+                    unexplained += 1
+            elif not bodyweight and mention.weights is None and not mention.pairs and value >= 45:
+                mention.weights = [_to_number(token)]
+                guessed += 1
+            elif mention.reps is None and not mention.pairs and value <= 50:
+                mention.reps = _to_number(token)
+                guessed += 1
+            elif mention.sets is None and value <= 10:
+                mention.sets = int(value)
+                guessed += 1
+            else:
+                unexplained += 1
+        elif token not in FILLER_WORDS and not re.fullmatch(r"[a-z]{1,2}|'s", token):
+            unexplained += 1
+    return guessed, unexplained
+
+def _build_exercise(mention: _ExerciseMention) -> Dict[str, Any]:
+    exercise_type, muscle_groups, _, _ = EXERCISE_LEXICON[mention.name]
+    sets, reps, weights = mention.sets, None, mention.weights
+    if mention.pairs:
+        weights = [weight for weight, _ in mention.pairs]
+        reps = [count for _, count in mention.pairs]
+        sets = sets or len(mention.pairs)
+    elif mention.reps is not None:
+        sets = sets or 1
+        reps = [mention.reps] * sets
+    elif weights and not sets:
+        sets = 1
+
+    return {
+        'exercise_name': mention.name,
+        'exercise_type': exercise_type,
+        'muscle_groups': list(muscle_groups),
+        'sets': sets,
+        'reps': reps,
+        'weight_lbs': weights,
+        'duration_minutes': mention.duration_minutes,
+        'distance_miles': mention.distance_miles,
+        'effort_level': mention.effort_level,
+        'rest_seconds': None,
+        'notes': None,
+        'order_in_workout': mention.order
+    }
+
+def _merge_exercise(merged: Dict[str, Any], later: Dict[str, Any]) -> bool:
+    """
+    Fold a repeated mention of an exercise into the earlier one as more sets
+
+    Returns False when the two cannot be lined up set by set (no reps, or
+    weights on only one of them); the later values then win and the caller
+    should not trust the result.
+    """
+    if merged['reps'] and later['reps'] and bool(merged['weight_lbs']) == bool(later['weight_lbs']):
+        if merged['weight_lbs']:
+            merged['weight_lbs'] = per_set(merged['weight_lbs'], merged['sets']) + \
+                per_set(later['weight_lbs'], later['sets'])
+        merged['reps'] = merged['reps'] + later['reps']
+        merged['sets'] = merged['sets'] + later['sets']
+        if later['effort_level'] is not None:
+            merged['effort_level'] = later['effort_level']
+        return True
+
+    for key in ('sets', 'reps', 'weight_lbs', 'duration_minutes', 'distance_miles', 'effort_level'):
+        if later[key] is not None:
+            merged[key] = later[key]
+    return False
+
+def parse_workout(transcription: str) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Extract a workout from a transcript without the LLM
+
+    Recognizes lexicon exercises and the numbers spoken around them (sets,
+    reps, weights with units, "3x8", "185 for 5", durations, distances,
+    effort). Text before the first exercise belongs to it ("185 bench 5
+    reps"). A repeated mention of an exercise adds its sets to the first
+    ("bench 185 for 5 then bench 205 for 5" is two sets).
+
+    Returns:
+        (workout in the LLM's JSON structure or None, confidence 0-1). The
+        confidence drops for every number placed by guessing, every word
+        that is neither an exercise, a number, a unit nor filler, every
+        strength exercise without reps or weight, and every repeated mention
+        that could not be merged set by set.
+    """
+    text = normalize_text(transcription or '')
+    matches = list(_EXERCISE_PATTERN.finditer(text))
+    if not matches:
+        return None, 0.0
+
+    order = {}
+    segments = []
+    for index, match in enumerate(matches):
+        name = _ALIAS_LOOKUP.get(re.sub(r'[\s-]+', '', match.group(1)))
+        if name is None:
+            return None, 0.0
+        order.setdefault(name, len(order) + 1)
+        start = 0 if index == 0 else match.end()
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(text)
+        segment = (text[start:match.start()] + ' ' if index == 0 else '') + text[match.end():end]
+        segments.append((_ExerciseMention(name, order[name]), segment))
+
+    confidence = 1.0
+    merged = {}
+    for mention, segment in segments:
+        guessed, unexplained = _parse_segment(mention, segment)
+        confidence -= 0.1 * guessed + 0.15 * unexplained
+        exercise = _build_exercise(mention)
+        if mention.name not in merged:
+            merged[mention.name] = exercise
+        elif not _merge_exercise(merged[mention.name], exercise):
+            confidence -= 0.3
+
+    exercises = list(merged.values())
+    for exercise in exercises:
+        if exercise['exercise_type'] == 'strength' and not exercise['reps'] and not exercise['weight_lbs'] \
+                and exercise['duration_minutes'] is None:
+            confidence -= 0.3
+        if exercise['exercise_type'] == 'cardio' and exercise['duration_minutes'] is None \
+                and exercise['distance_miles'] is None:
+            confidence -= 0.3
+
+    workout = {
+        'workout_date': None,
+        'workout_start_time': None,
+        'workout_duration_minutes': None,
+        'notes': None,
+        'exercises': exercises
+    }
+    return workout, round(max(0.0, min(1.0, confidence)), 3)
@@ -0,0 +1,49 @@
+import os
+import sys
+import asyncio
+
+import pytest
+
+# The worker runs as `python src/main.py` with flat imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '..', '..', '..', 'database', 'init_production_schema.sql')
+
+@pytest.fixture
+def postgres():
+    """
+    Run a test coroutine against a DatabaseManager on a fresh production schema
+
+    Needs TEST_DATABASE_URL pointing at a throwaway database: its public
+    schema is dropped and recreated for every test. Skipped when unset.
+    """
+    url = os.getenv('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    asyncpg = pytest.importorskip('asyncpg')
+    pytest.importorskip('dateutil')
+    from database import DatabaseManager
+
+    with open(SCHEMA_PATH) as f:
+        schema = f.read()
+
+    def run(test):
+        async def main():
+            conn = await asyncpg.connect(url)
+            try:
+                await conn.execute('DROP SCHEMA public CASCADE; CREATE SCHEMA public;')
+                await conn.execute(schema)
+            finally:
+                await conn.close()
+
+            db = DatabaseManager()
+            db.database_url = url
+            await db.initialize_pool()
+            try:
+                return await test(db)
+            finally:
+                await db.close_pool()
+        return asyncio.run(main())
+
+    return run
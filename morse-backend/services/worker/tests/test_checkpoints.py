@@ -0,0 +1,190 @@
+import pytest
+
+WORKOUT = {
+    'workout_date': '2026-01-05',
+    'exercises': [{'exercise_name': 'Bench Press', 'exercise_type': 'strength', 'muscle_groups': ['chest'],
+                   'sets': 3, 'reps': [10, 10, 8], 'weight_lbs': [135, 135, 145], 'order_in_workout': 1}],
+    'total_exercises': 1
+}
+
+async def _add_file(db):
+    """Insert a user and one audio file; returns (user_id, audio_file_id) as strings"""
+    conn = await db.get_connection()
+    try:
+        user_id = await conn.fetchval(
+            "INSERT INTO users (device_uuid) VALUES ('device-' || gen_random_uuid()) RETURNING id"
+        )
+        audio_file_id = await conn.fetchval(
+            """INSERT INTO audio_files (user_id, original_filename, file_path, file_size)
+               VALUES ($1, 'set.m4a', '/app/uploads/set.m4a', 1)
+               RETURNING id""",
+            user_id
+        )
+        return str(user_id), str(audio_file_id)
+    finally:
+        await db.connection_pool.release(conn)
+
+async def _fetch(db, query, *args):
+    conn = await db.get_connection()
+    try:
+        return await conn.fetchrow(query, *args)
+    finally:
+        await db.connection_pool.release(conn)
+
+async def _resume(db, audio_file_id):
+    uow = db.unit_of_work(audio_file_id)
+    await uow.begin(resume=True)
+    return uow
+
+def test_each_failed_stage_is_checkpointed_and_resumed(postgres):
+    async def test(db):
+        user_id, audio_file_id = await _add_file(db)
+
+        # Fails right after transcribing
+        uow = db.unit_of_work(audio_file_id)
+        assert await uow.begin() is None
+        transcription_id = await uow.save_transcription('bench press three sets of ten', 0.9, 100)
+        await uow.fail('extraction: timeout')
+
+        uow = await _resume(db, audio_file_id)
+        assert uow.stage == 'transcribed'
+        assert uow.transcription_id == transcription_id
+        assert uow.transcription_text == 'bench press three sets of ten'
+
+        # Fails after the LLM answered but before the workout was saved
+        uow.record_extraction(WORKOUT)
+        await uow.fail('save: connection reset')
+        row = await _fetch(db, "SELECT processing_stage, transcription_status FROM audio_files WHERE id = $1",
+                           audio_file_id)
+        assert row['processing_stage'] == 'extracted'
+        assert row['transcription_status'] == 'failed'
+
+        uow = await _resume(db, audio_file_id)
+        assert uow.stage == 'extracted'
+        assert uow.extracted_workout == WORKOUT
+
+        # Fails after saving the workout, during speaker verification
+        workout_id = await uow.save_workout_data(user_id, uow.transcription_id, uow.extracted_workout)
+        await uow.fail('speaker: out of memory')
+        row = await _fetch(db, "SELECT processing_stage, extracted_workout FROM audio_files WHERE id = $1",
+                           audio_file_id)
+        assert row['processing_stage'] == 'saved'
+        # The saved workout supersedes the checkpointed extraction
+        assert row['extracted_workout'] is None
+
+        uow = await _resume(db, audio_file_id)
+        assert uow.stage == 'saved'
+        assert uow.workout_id == workout_id
+        assert uow.extracted_workout is None
+
+        await uow.complete()
+        row = await _fetch(
+            db,
+            """SELECT af.transcription_status, af.processed, af.processing_stage,
+                      (SELECT COUNT(*) FROM transcriptions WHERE audio_file_id = af.id) AS transcriptions,
+                      (SELECT COUNT(*) FROM workouts WHERE audio_file_id = af.id) AS workouts
+               FROM audio_files af WHERE af.id = $1""",
+            audio_file_id
+        )
+        assert row['transcription_status'] == 'completed' and row['processed']
+        assert row['transcriptions'] == 1 and row['workouts'] == 1
+
+    postgres(test)
+
+def test_fresh_attempt_ignores_the_checkpoint(postgres):
+    async def test(db):
+        _, audio_file_id = await _add_file(db)
+        uow = db.unit_of_work(audio_file_id)
+        await uow.begin()
+        await uow.save_transcription('squats', 0.9, 100)
+        await uow.fail('extraction: timeout')
+
+        uow = db.unit_of_work(audio_file_id)
+        assert await uow.begin(resume=False) is None
+
+    postgres(test)
+
+class FakeTranscriber:
+    """Answers from the 'cache' so no audio is decoded"""
+
+    def __init__(self):
+        self.lookups = 0
+
+    async def lookup_cached(self, file_path):
+        self.lookups += 1
+        return {'success': True, 'text': 'bench press three sets of ten', 'confidence': 0.9,
+                'processing_time_ms': 100}, 'cache-key'
+
+class FakeLLM:
+    def __init__(self, fail_first=False):
+        self.calls = 0
+        self.fail_first = fail_first
+
+    async def extract_workout_data(self, transcription, device_uuid, **kwargs):
+        self.calls += 1
+        if self.fail_first and self.calls == 1:
+            return {'success': False, 'error': 'rate limited'}
+        return {'success': True, 'workout': dict(WORKOUT)}
+
+@pytest.fixture
+def processor_factory():
+    # main imports Whisper, Redis and dotenv at module level
+    main = pytest.importorskip('main')
+
+    def make(db, llm):
+        processor = main.WorkoutProcessor.__new__(main.WorkoutProcessor)
+        processor.db = db
+        processor.transcriber = FakeTranscriber()
+        processor.llm_processor = llm
+        processor.speaker_verifier = None
+        processor.session_mode = 'batch'
+        return processor
+
+    return make
+
+def _job(user_id, audio_file_id, attempt):
+    return {'audioFileId': audio_file_id, 'filePath': '/app/uploads/set.m4a', 'userId': user_id,
+            'deviceUuid': 'device', 'attempt': attempt}
+
+@pytest.mark.parametrize('failed_stage', ['transcribed', 'extracted', 'saved'])
+def test_retry_skips_completed_stages(postgres, processor_factory, failed_stage):
+    async def test(db):
+        user_id, audio_file_id = await _add_file(db)
+        llm = FakeLLM(fail_first=failed_stage == 'transcribed')
+        processor = processor_factory(db, llm)
+
+        if failed_stage == 'extracted':
+            insert_workout = db._insert_workout
+
+            async def failing_insert(*args, **kwargs):
+                db._insert_workout = insert_workout
+                raise RuntimeError('connection reset')
+            db._insert_workout = failing_insert
+        elif failed_stage == 'saved':
+            speaker_verification = processor.process_speaker_verification
+
+            async def failing_speaker(*args, **kwargs):
+                processor.process_speaker_verification = speaker_verification
+                raise RuntimeError('out of memory')
+            processor.process_speaker_verification = failing_speaker
+
+        assert not await processor.process_audio_file(_job(user_id, audio_file_id, 1))
+        row = await _fetch(db, "SELECT processing_stage FROM audio_files WHERE id = $1", audio_file_id)
+        assert row['processing_stage'] == failed_stage
+
+        assert await processor.process_audio_file(_job(user_id, audio_file_id, 2))
+        # The transcript is never redone and a stored extraction is never asked for again
+        assert processor.transcriber.lookups == 1
+        assert llm.calls == (2 if failed_stage == 'transcribed' else 1)
+        row = await _fetch(
+            db,
+            """SELECT af.transcription_status,
+                      (SELECT COUNT(*) FROM transcriptions WHERE audio_file_id = af.id) AS transcriptions,
+                      (SELECT COUNT(*) FROM workouts WHERE audio_file_id = af.id) AS workouts
+               FROM audio_files af WHERE af.id = $1""",
+            audio_file_id
+        )
+        assert row['transcription_status'] == 'completed'
+        assert row['transcriptions'] == 1 and row['workouts'] == 1
+
+    postgres(test)
@@ -0,0 +1,166 @@
+import asyncio
+
+async def _add_files(db, count, **columns):
+    """Insert a user and `count` pending audio files, oldest first; returns their ids as strings"""
+    conn = await db.get_connection()
+    try:
+        user_id = await conn.fetchval(
+            "INSERT INTO users (device_uuid) VALUES ('device-' || gen_random_uuid()) RETURNING id"
+        )
+        ids = []
+        for index in range(count):
+            ids.append(str(await conn.fetchval(
+                """INSERT INTO audio_files (user_id, original_filename, file_path, file_size, upload_timestamp)
+                   VALUES ($1, $2, $3, 1, NOW() - make_interval(secs => $4))
+                   RETURNING id""",
+                user_id, f'{index}.m4a', f'/app/uploads/{index}.m4a', float(count - index)
+            )))
+        for column, value in columns.items():
+            await conn.execute(f"UPDATE audio_files SET {column} = $1 WHERE id = ANY($2::uuid[])", value, ids)
+        return ids
+    finally:
+        await db.connection_pool.release(conn)
+
+async def _rows(db, ids):
+    conn = await db.get_connection()
+    try:
+        rows = await conn.fetch(
+            """SELECT id, lease_owner, lease_expires_at, attempt_count, transcription_status
+               FROM audio_files WHERE id = ANY($1::uuid[])""",
+            ids
+        )
+        return {str(row['id']): dict(row) for row in rows}
+    finally:
+        await db.connection_pool.release(conn)
+
+async def _expire_leases(db, ids):
+    conn = await db.get_connection()
+    try:
+        await conn.execute(
+            "UPDATE audio_files SET lease_expires_at = NOW() - INTERVAL '1 second' WHERE id = ANY($1::uuid[])",
+            ids
+        )
+    finally:
+        await db.connection_pool.release(conn)
+
+async def _set_status(db, ids, status):
+    for audio_file_id in ids:
+        await db.update_audio_file_status(audio_file_id, status)
+
+def test_concurrent_claims_split_the_backlog(postgres):
+    async def test(db):
+        ids = await _add_files(db, 10)
+        first, second = await asyncio.gather(
+            db.claim_pending_audio_files('worker-a', 6, 60, []),
+            db.claim_pending_audio_files('worker-b', 6, 60, [])
+        )
+        first_ids = {str(row['id']) for row in first}
+        second_ids = {str(row['id']) for row in second}
+        assert not first_ids & second_ids
+        assert first_ids | second_ids == set(ids)
+        assert all(row['attempt_count'] == 1 for row in first + second)
+
+    postgres(test)
+
+def test_leased_files_are_not_claimed_again(postgres):
+    async def test(db):
+        ids = await _add_files(db, 3)
+        claimed = await db.claim_pending_audio_files('worker-a', 3, 60, [])
+        assert len(claimed) == 3
+
+        assert await db.claim_pending_audio_files('worker-b', 3, 60, []) == []
+        # Not even by the worker holding them: a redelivered job must not start a second run
+        assert await db.claim_audio_file(ids[0], 'worker-a', 60) is None
+        assert await db.claim_audio_file(ids[0], 'worker-b', 60) is None
+        assert all(row['attempt_count'] == 1 for row in (await _rows(db, ids)).values())
+
+    postgres(test)
+
+def test_lapsed_lease_is_reclaimed(postgres):
+    async def test(db):
+        ids = await _add_files(db, 2)
+        await db.claim_pending_audio_files('worker-a', 2, 60, [])
+        await _set_status(db, ids, 'processing')
+        await _expire_leases(db, ids[:1])
+
+        reclaimed = await db.claim_pending_audio_files('worker-b', 2, 60, [])
+        assert [str(row['id']) for row in reclaimed] == ids[:1]
+        assert reclaimed[0]['attempt_count'] == 2
+        assert await db.claim_audio_file(ids[1], 'worker-b', 60) is None
+
+        await _expire_leases(db, ids[1:])
+        assert await db.claim_audio_file(ids[1], 'worker-b', 60) == 2
+        rows = await _rows(db, ids)
+        assert {row['lease_owner'] for row in rows.values()} == {'worker-b'}
+
+    postgres(test)
+
+def test_lapsed_lease_out_of_attempts_is_dead_lettered(postgres):
+    async def test(db):
+        db.max_attempts = 2
+        ids = await _add_files(db, 1, attempt_count=2, lease_owner='worker-a')
+        await _set_status(db, ids, 'processing')
+        await _expire_leases(db, ids)
+
+        assert await db.claim_pending_audio_files('worker-b', 1, 60, []) == []
+        row = (await _rows(db, ids))[ids[0]]
+        assert row['transcription_status'] == 'dead_letter'
+        assert row['lease_owner'] is None
+        assert await db.claim_audio_file(ids[0], 'worker-b', 60) is None
+
+    postgres(test)
+
+def test_renew_extends_only_listed_leases_of_this_worker(postgres):
+    async def test(db):
+        ids = await _add_files(db, 3)
+        await db.claim_pending_audio_files('worker-a', 2, 60, [])
+        await db.claim_pending_audio_files('worker-b', 1, 60, [])
+        before = await _rows(db, ids)
+
+        renewed = await db.renew_leases('worker-a', 3600, ids[:1])
+        assert renewed == 1
+        after = await _rows(db, ids)
+        assert after[ids[0]]['lease_expires_at'] > before[ids[0]]['lease_expires_at']
+        assert after[ids[1]]['lease_expires_at'] == before[ids[1]]['lease_expires_at']
+        assert after[ids[2]]['lease_expires_at'] == before[ids[2]]['lease_expires_at']
+
+    postgres(test)
+
+def test_shutdown_release_hands_back_files_and_attempts(postgres):
+    async def test(db):
+        ids = await _add_files(db, 3)
+        await db.claim_pending_audio_files('worker-a', 2, 60, [])
+        await db.claim_pending_audio_files('worker-b', 1, 60, [])
+        await _set_status(db, ids, 'processing')
+
+        await db.release_worker_leases('worker-a')
+        rows = await _rows(db, ids)
+        for audio_file_id in ids[:2]:
+            assert rows[audio_file_id]['lease_owner'] is None
+            assert rows[audio_file_id]['transcription_status'] == 'pending'
+            assert rows[audio_file_id]['attempt_count'] == 0
+        assert rows[ids[2]]['lease_owner'] == 'worker-b'
+        assert rows[ids[2]]['attempt_count'] == 1
+
+        # Handed-back files are immediately claimable again
+        claimed = await db.claim_pending_audio_files('worker-c', 3, 60, [])
+        assert {str(row['id']) for row in claimed} == set(ids[:2])
+
+    postgres(test)
+
+def test_failed_files_wait_for_their_backoff(postgres):
+    async def test(db):
+        ids = await _add_files(db, 1)
+        await db.claim_pending_audio_files('worker-a', 1, 60, [])
+        assert await db.record_audio_file_failure(ids[0], 'boom') == 'failed'
+
+        assert await db.claim_pending_audio_files('worker-a', 1, 60, []) == []
+        conn = await db.get_connection()
+        try:
+            await conn.execute("UPDATE audio_files SET next_attempt_at = NOW() - INTERVAL '1 second'")
+        finally:
+            await db.connection_pool.release(conn)
+        claimed = await db.claim_pending_audio_files('worker-a', 1, 60, [])
+        assert claimed[0]['attempt_count'] == 2
+
+    postgres(test)
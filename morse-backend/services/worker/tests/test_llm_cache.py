@@ -0,0 +1,61 @@
+import llm_cache
+from llm_cache import LLMResponseCache, normalize_transcription
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def _clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, 'monotonic', clock)
+    return clock
+
+def test_normalization_ignores_case_punctuation_and_spacing():
+    assert normalize_transcription("Bench 185,  five reps.") == normalize_transcription("bench 185 five reps")
+    assert normalize_transcription("ran 3.5 miles") == "ran 3.5 miles"
+
+def test_key_changes_with_prompt_version_and_provider():
+    key = LLMResponseCache.make_key("bench 185", False, 1, 'claude', 1)
+    assert key == LLMResponseCache.make_key("Bench 185.", False, 1, 'claude', 1)
+    assert key != LLMResponseCache.make_key("bench 185", False, 1, 'claude', 2)
+    assert key != LLMResponseCache.make_key("bench 185", False, 1, 'gemini', 1)
+    assert key != LLMResponseCache.make_key("bench 185", True, 2, 'claude', 1)
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = _clock(monkeypatch)
+    cache = LLMResponseCache(max_entries=10, ttl_seconds=60)
+    cache.put('a', {'exercises': []})
+
+    clock.now += 59
+    assert cache.get('a') == {'exercises': []}
+    clock.now += 2
+    assert cache.get('a') is None
+    assert 'a' not in cache.entries
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    _clock(monkeypatch)
+    cache = LLMResponseCache(max_entries=2, ttl_seconds=60)
+    cache.put('a', {'value': 1})
+    cache.put('b', {'value': 2})
+    cache.get('a')
+    cache.put('c', {'value': 3})
+
+    assert cache.get('b') is None
+    assert cache.get('a') == {'value': 1}
+    assert cache.get('c') == {'value': 3}
+    assert cache.evictions == 1
+
+def test_cached_values_are_copies(monkeypatch):
+    _clock(monkeypatch)
+    cache = LLMResponseCache(max_entries=2, ttl_seconds=60)
+    value = {'exercises': [{'exercise_name': 'Bench Press'}]}
+    cache.put('a', value)
+    value['exercises'].clear()
+
+    hit = cache.get('a')
+    hit['exercises'][0]['exercise_name'] = 'Squats'
+    assert cache.get('a') == {'exercises': [{'exercise_name': 'Bench Press'}]}
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from llm_router import ProviderRouter
+
+class FakeProvider:
+    """Provider stand-in: waits `queued` seconds for local limits, then `delay` seconds for the response"""
+
+    model = 'fake'
+
+    def __init__(self, reply='ok', delay=0.0, queued=0.0, error=None):
+        self.reply = reply
+        self.delay = delay
+        self.queued = queued
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate_response(self, prompt, on_start=None):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.queued)
+            if on_start:
+                on_start()
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return self.reply
+
+    def health_check(self):
+        return True
+
+    def get_limits(self):
+        return {}
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setenv('LLM_HEDGE_ENABLED', 'true')
+    monkeypatch.setenv('LLM_HEDGE_DEFAULT_SECONDS', '0.05')
+    monkeypatch.setenv('LLM_HEDGE_MIN_SECONDS', '0.01')
+
+def test_fails_over_to_next_provider():
+    first = FakeProvider(error=RuntimeError('boom'))
+    second = FakeProvider(reply='second')
+    router = ProviderRouter([('claude', first), ('gemini', second)])
+
+    assert asyncio.run(router.generate_response('prompt')) == 'second'
+    assert router.failovers == 1
+    assert router.stats['claude'].consecutive_errors == 1
+
+def test_all_providers_failing_raises():
+    router = ProviderRouter([('claude', FakeProvider(error=RuntimeError('a'))),
+                             ('gemini', FakeProvider(error=RuntimeError('b')))])
+    with pytest.raises(RuntimeError, match='All LLM providers failed'):
+        asyncio.run(router.generate_response('prompt'))
+
+def test_cooling_down_provider_is_tried_last(monkeypatch):
+    monkeypatch.setenv('LLM_ROUTER_FAILURE_THRESHOLD', '1')
+    first = FakeProvider(error=RuntimeError('boom'))
+    second = FakeProvider(reply='second')
+    router = ProviderRouter([('claude', first), ('gemini', second)])
+    asyncio.run(router.generate_response('prompt'))
+
+    assert [name for name, _ in router._ranked()] == ['gemini', 'claude']
+    asyncio.run(router.generate_response('prompt'))
+    assert first.calls == 1
+
+def test_hedging_is_off_by_default(monkeypatch):
+    monkeypatch.delenv('LLM_HEDGE_ENABLED', raising=False)
+    router = ProviderRouter([('claude', FakeProvider()), ('gemini', FakeProvider())])
+    assert not router.hedge_enabled
+
+def test_slow_provider_is_hedged_and_loser_cancelled(hedging):
+    slow = FakeProvider(reply='slow', delay=1.0)
+    fast = FakeProvider(reply='fast', delay=0.01)
+    router = ProviderRouter([('claude', slow), ('gemini', fast)])
+
+    assert asyncio.run(router.generate_response('prompt')) == 'fast'
+    assert router.hedges == 1
+    assert router.hedge_wins == 1
+    assert slow.cancelled == 1
+
+def test_local_queueing_does_not_start_hedge_clock(hedging):
+    # Held by its own rate limiter longer than the hedge deadline, then answers quickly
+    queued = FakeProvider(reply='primary', queued=0.2, delay=0.01)
+    backup = FakeProvider(reply='backup')
+    router = ProviderRouter([('claude', queued), ('gemini', backup)])
+
+    assert asyncio.run(router.generate_response('prompt')) == 'primary'
+    assert router.hedges == 0
+    assert backup.calls == 0
+    # Latency is recorded from when the request was sent, not from when it queued
+    seconds, ok = router.stats['claude'].calls[-1]
+    assert ok and seconds < 0.2
+
+def test_model_names_the_configuration_not_the_answering_provider():
+    router = ProviderRouter([('claude', FakeProvider(error=RuntimeError('boom'))), ('gemini', FakeProvider())])
+    before = router.model
+    asyncio.run(router.generate_response('prompt'))
+    assert router.model == before == 'claude:fake+gemini:fake'
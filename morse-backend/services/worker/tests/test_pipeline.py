@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from pipeline import PipelineStage, StagePipeline
+
+def _stage(name, handler, workers=1, queue_size=1):
+    return PipelineStage(name, handler, workers, queue_size)
+
+async def _settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+def test_pipeline_needs_a_stage():
+    with pytest.raises(ValueError):
+        StagePipeline([])
+
+def test_jobs_run_through_every_stage_in_order():
+    async def scenario():
+        seen = []
+
+        def record(name):
+            async def handler(job):
+                seen.append((name, job['id']))
+                return True
+            return handler
+
+        pipeline = StagePipeline([_stage('a', record('a')), _stage('b', record('b'))])
+        pipeline.start()
+        finished = []
+
+        async def submit(job_id):
+            assert await pipeline.submit({'id': job_id})
+            finished.append(job_id)
+
+        await asyncio.gather(*(submit(job_id) for job_id in range(5)))
+        await pipeline.stop()
+        return seen, finished, pipeline.get_stats()
+
+    seen, finished, stats = asyncio.run(scenario())
+    assert [job_id for name, job_id in seen if name == 'a'] == list(range(5))
+    assert [job_id for name, job_id in seen if name == 'b'] == list(range(5))
+    assert finished == list(range(5))
+    assert stats['a']['processed'] == stats['b']['processed'] == 5
+
+def test_bounded_queues_hold_back_earlier_stages():
+    async def scenario():
+        release = asyncio.Event()
+        started = []
+
+        async def fast(job):
+            started.append(job['id'])
+            return True
+
+        async def slow(job):
+            await release.wait()
+            return True
+
+        pipeline = StagePipeline([_stage('fast', fast), _stage('slow', slow)])
+        pipeline.start()
+        submits = [asyncio.create_task(pipeline.submit({'id': job_id})) for job_id in range(10)]
+        await _settle()
+
+        # slow: one job in its handler and one queued; fast: one job waiting to
+        # hand over and one queued. Everything else is still waiting in submit()
+        blocked = list(started)
+        stats = pipeline.get_stats()
+        release.set()
+        results = await asyncio.gather(*submits)
+        await pipeline.stop()
+        return blocked, stats, results, started
+
+    blocked, stats, results, started = asyncio.run(scenario())
+    assert blocked == [0, 1, 2]
+    assert stats['slow']['busy'] == 1 and stats['slow']['queued'] == 1
+    assert stats['fast']['queued'] == 1
+    assert results == [True] * 10
+    assert started == list(range(10))
+
+def test_stage_errors_fail_the_job_and_reach_on_error():
+    async def scenario():
+        errors = []
+        later = []
+
+        async def explode(job):
+            if job['id'] == 1:
+                raise RuntimeError('stage blew up')
+            return job['id'] != 2
+
+        async def after(job):
+            later.append(job['id'])
+            return True
+
+        async def on_error(job, error):
+            errors.append((job['id'], str(error)))
+
+        pipeline = StagePipeline([_stage('first', explode), _stage('second', after)], on_error=on_error)
+        pipeline.start()
+        results = await asyncio.gather(*(pipeline.submit({'id': job_id}) for job_id in range(4)))
+        await pipeline.stop()
+        return results, errors, later, pipeline.get_stats()
+
+    results, errors, later, stats = asyncio.run(scenario())
+    assert results == [True, False, False, True]
+    assert errors == [(1, 'stage blew up')]
+    assert later == [0, 3]
+    assert stats['first']['failed'] == 2
+
+def test_failing_error_handler_does_not_stop_the_stage():
+    async def scenario():
+        async def explode(job):
+            raise RuntimeError('boom')
+
+        async def on_error(job, error):
+            raise RuntimeError('handler boom')
+
+        pipeline = StagePipeline([_stage('only', explode)], on_error=on_error)
+        pipeline.start()
+        results = await asyncio.gather(*(pipeline.submit({'id': job_id}) for job_id in range(3)))
+        await pipeline.stop()
+        return results
+
+    assert asyncio.run(scenario()) == [False, False, False]
+
+def test_stop_after_in_flight_jobs_drains_cleanly():
+    async def scenario():
+        async def work(job):
+            await asyncio.sleep(0.01)
+            return True
+
+        pipeline = StagePipeline([_stage('a', work, workers=2, queue_size=2), _stage('b', work)])
+        pipeline.start()
+        # The worker's shutdown order: wait for in-flight submits, then stop the stages
+        in_flight = [asyncio.create_task(pipeline.submit({'id': job_id})) for job_id in range(6)]
+        results = await asyncio.gather(*in_flight)
+        await asyncio.wait_for(pipeline.stop(), timeout=1)
+        return results, pipeline
+
+    results, pipeline = asyncio.run(scenario())
+    assert results == [True] * 6
+    assert pipeline.worker_tasks == []
+    for stats in pipeline.get_stats().values():
+        assert stats['busy'] == 0 and stats['queued'] == 0
+    assert pipeline.get_stats()['b']['processed'] == 6
@@ -0,0 +1,97 @@
+import json
+
+from session_merge import empty_state, exercise_key, finalize_session_workout, merge_recording
+
+def _strength(name, sets=None, reps=None, weight_lbs=None, order=None, **extra):
+    exercise = {'exercise_name': name, 'exercise_type': 'strength', 'muscle_groups': ['chest'],
+                'sets': sets, 'reps': reps, 'weight_lbs': weight_lbs, **extra}
+    if order is not None:
+        exercise['order_in_workout'] = order
+    return exercise
+
+def _workout(*exercises, **fields):
+    return {'exercises': list(exercises), **fields}
+
+def _by_name(workout):
+    return {exercise['exercise_name']: exercise for exercise in workout['exercises']}
+
+def test_exercise_key_matches_name_variants():
+    assert exercise_key('Bench Press') == exercise_key('bench-press') == exercise_key('bench presses')
+    assert exercise_key('Press') != exercise_key('Pres')
+
+def test_sets_line_up_across_recordings():
+    state = merge_recording(None, 'a', 1, _workout(_strength('Bench Press', sets=3, reps=[10], weight_lbs=[135])))
+    state = merge_recording(state, 'b', 2, _workout(_strength('bench press', sets=2, reps=[8, 6], weight_lbs=[155])))
+
+    bench = _by_name(finalize_session_workout(state))['Bench Press']
+    assert bench['sets'] == 5
+    assert bench['reps'] == [10, 10, 10, 8, 6]
+    assert bench['weight_lbs'] == [135, 135, 135, 155, 155]
+
+def test_missing_weights_stay_aligned_with_their_sets():
+    state = merge_recording(None, 'a', 1, _workout(_strength('Pull Up', sets=2, reps=[8, 8])))
+    state = merge_recording(state, 'b', 2, _workout(_strength('Pull Up', sets=1, reps=[5], weight_lbs=[25])))
+
+    pull_up = _by_name(finalize_session_workout(state))['Pull Up']
+    assert pull_up['reps'] == [8, 8, 5]
+    assert pull_up['weight_lbs'] == [None, None, 25]
+
+def test_repeated_exercise_in_one_recording_keeps_both_pieces():
+    state = merge_recording(None, 'a', 1, _workout(
+        _strength('Squat', sets=1, reps=[5], weight_lbs=[225]),
+        _strength('Lunge', sets=1, reps=[12]),
+        _strength('Squats', sets=1, reps=[3], weight_lbs=[245])
+    ))
+
+    workout = finalize_session_workout(state)
+    assert [exercise['exercise_name'] for exercise in workout['exercises']] == ['Squat', 'Lunge']
+    squat = _by_name(workout)['Squat']
+    assert squat['reps'] == [5, 3]
+    assert squat['weight_lbs'] == [225, 245]
+
+def test_late_recording_takes_its_place_in_order():
+    state = merge_recording(None, 'b', 2, _workout(_strength('Deadlift', sets=1, reps=[5], weight_lbs=[315]),
+                                                   _strength('row', sets=1, reps=[10])))
+    state = merge_recording(state, 'a', 1, _workout(_strength('Row', sets=1, reps=[12])))
+
+    workout = finalize_session_workout(state)
+    assert [exercise['exercise_name'] for exercise in workout['exercises']] == ['Row', 'Deadlift']
+    assert _by_name(workout)['Row']['reps'] == [12, 10]
+    assert [exercise['order_in_workout'] for exercise in workout['exercises']] == [1, 2]
+
+def test_reprocessed_recording_replaces_its_pieces():
+    state = merge_recording(None, 'a', 1, _workout(_strength('Curl', sets=2, reps=[10])))
+    state = merge_recording(state, 'b', 2, _workout(_strength('Dip', sets=1, reps=[12])))
+    state = merge_recording(state, 'a', 1, _workout(_strength('Curl', sets=1, reps=[15])))
+
+    workout = finalize_session_workout(state)
+    assert _by_name(workout)['Curl']['reps'] == [15]
+    assert workout['total_exercises'] == 2
+
+def test_finalize_from_stored_partial_state():
+    state = merge_recording(empty_state(), 'a', 1, _workout(
+        _strength('Bench Press', sets=2, reps=[10], weight_lbs=[135]),
+        {'exercise_name': 'Treadmill', 'exercise_type': 'cardio', 'duration_minutes': 10, 'distance_miles': 1.0},
+        workout_start_time='07:00', workout_duration_minutes=20, notes='felt good'
+    ))
+    state = merge_recording(state, 'b', 2, _workout(
+        {'exercise_name': 'treadmill', 'exercise_type': 'cardio', 'duration_minutes': 5, 'distance_miles': 0.5},
+        workout_duration_minutes=10, notes='felt good'
+    ))
+
+    # The partial state is stored as JSON between recordings
+    stored = json.loads(json.dumps(state))
+    workout = finalize_session_workout(stored)
+
+    assert workout == finalize_session_workout(state)
+    assert workout['workout_start_time'] == '07:00'
+    assert workout['workout_duration_minutes'] == 30
+    assert workout['notes'] == 'felt good'
+    treadmill = _by_name(workout)['Treadmill']
+    assert treadmill['duration_minutes'] == 15
+    assert treadmill['distance_miles'] == 1.5
+    assert treadmill['sets'] is None and treadmill['reps'] is None
+
+    # More recordings can still be merged into the stored state
+    stored = merge_recording(stored, 'c', 3, _workout(_strength('Bench Press', sets=1, reps=[6], weight_lbs=[155])))
+    assert _by_name(finalize_session_workout(stored))['Bench Press']['reps'] == [10, 10, 6]
@@ -0,0 +1,55 @@
+import os
+
+from transcription_cache import TranscriptionCache
+
+CONTEXT = {'engine': 'whisper', 'model': 'base', 'decoding': 'beam'}
+
+def _audio(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+def test_key_depends_on_bytes_and_settings(tmp_path):
+    cache = TranscriptionCache(str(tmp_path / 'cache'), 1 << 20, CONTEXT)
+    first = _audio(tmp_path, 'a.m4a', b'audio')
+    reupload = _audio(tmp_path, 'b.m4a', b'audio')
+    other = _audio(tmp_path, 'c.m4a', b'other audio')
+
+    assert cache.key_for(first) == cache.key_for(reupload)
+    assert cache.key_for(first) != cache.key_for(other)
+    other_model = TranscriptionCache(str(tmp_path / 'cache'), 1 << 20, dict(CONTEXT, model='small'))
+    assert other_model.key_for(first) != cache.key_for(first)
+
+def test_round_trip_and_counters(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), 1 << 20, CONTEXT)
+    assert cache.get('missing') is None
+    cache.put('key', {'success': True, 'text': 'bench 185'})
+    assert cache.get('key') == {'success': True, 'text': 'bench 185'}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    result = {'success': True, 'text': 'x' * 100}
+    cache = TranscriptionCache(str(tmp_path), 1 << 20, CONTEXT)
+    cache.put('probe', result)
+    entry_size = os.path.getsize(cache._path('probe'))
+    os.remove(cache._path('probe'))
+
+    cache = TranscriptionCache(str(tmp_path), int(entry_size * 3.5), CONTEXT)
+    for age, key in enumerate(['old', 'used', 'newer']):
+        cache.put(key, result)
+        os.utime(cache._path(key), (1000 + age, 1000 + age))
+    # A hit bumps the entry's mtime, making it the most recently used
+    cache.get('used')
+    cache.put('newest', result)
+
+    assert cache.get('old') is None
+    assert cache.get('used') is not None
+    assert cache.get('newest') is not None
+    assert cache.total_bytes <= cache.max_bytes
+
+def test_unreadable_entry_is_dropped(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), 1 << 20, CONTEXT)
+    with open(cache._path('broken'), 'w') as f:
+        f.write('{not json')
+    assert cache.get('broken') is None
+    assert not os.path.exists(cache._path('broken'))
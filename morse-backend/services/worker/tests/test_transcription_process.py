@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+def test_child_entry_points_import_no_heavy_modules():
+    # What a spawned pool process loads before the initializer runs
+    code = (
+        "import sys, transcription_process; "
+        "heavy = {'torch', 'whisper', 'asyncio', 'transcriber', 'audio_loader', 'transcription_cache'}; "
+        "print(sorted(heavy & set(sys.modules)))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=SRC, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+def test_decode_follows_the_decoding_policy():
+    from transcription_process import decode, decode_batch
+
+    class Engine:
+        def transcribe(self, samples):
+            return 'beam'
+
+        def transcribe_adaptive(self, samples):
+            return 'adaptive'
+
+        def transcribe_batch(self, batch):
+            return ['beam'] * len(batch)
+
+        def transcribe_batch_adaptive(self, batch):
+            return ['adaptive'] * len(batch)
+
+    assert decode(Engine(), None, 'beam') == 'beam'
+    assert decode(Engine(), None, 'adaptive') == 'adaptive'
+    assert decode_batch(Engine(), [None, None], 'adaptive') == ['adaptive', 'adaptive']
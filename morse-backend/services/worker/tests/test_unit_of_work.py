@@ -0,0 +1,94 @@
+import asyncio
+import contextlib
+
+import pytest
+
+pytest.importorskip('asyncpg')
+pytest.importorskip('dateutil')
+
+from database import DatabaseManager
+
+POOL_SIZE = 3
+
+class StubConnection:
+    """Answers the queries a job's unit of work makes with canned rows"""
+
+    async def fetchrow(self, query, *args):
+        if 'FROM session_audio_files' in query:
+            return {'session_id': 'session-1', 'recording_order': 1}
+        return None
+
+    async def fetchval(self, query, *args):
+        await asyncio.sleep(0)
+        return None
+
+    async def execute(self, query, *args):
+        await asyncio.sleep(0)
+        return 'UPDATE 1'
+
+    def transaction(self):
+        @contextlib.asynccontextmanager
+        async def transaction():
+            yield
+        return transaction()
+
+class StubPool:
+    """Fixed-size pool: acquire waits while every connection is checked out, like asyncpg's"""
+
+    def __init__(self, size):
+        self.free = asyncio.Queue()
+        for _ in range(size):
+            self.free.put_nowait(StubConnection())
+        self.max_in_use = 0
+        self.size = size
+
+    async def acquire(self):
+        conn = await self.free.get()
+        self.max_in_use = max(self.max_in_use, self.size - self.free.qsize())
+        return conn
+
+    async def release(self, conn):
+        self.free.put_nowait(conn)
+
+async def _job(db, index):
+    uow = db.unit_of_work(f'audio-{index}')
+    try:
+        # The job already holds its connection (the workout was just saved on it)
+        await uow._connection()
+        await asyncio.sleep(0)
+        session = await uow.merge_into_session({'exercises': [{'exercise_name': 'Bench Press', 'reps': [5]}]})
+        assert session['session_id'] == 'session-1'
+    finally:
+        await uow.release()
+
+def test_session_merge_does_not_deadlock_a_full_pool():
+    async def run():
+        db = DatabaseManager()
+        db.connection_pool = StubPool(POOL_SIZE)
+        jobs = [_job(db, index) for index in range(POOL_SIZE * 4)]
+        await asyncio.wait_for(asyncio.gather(*jobs), timeout=5)
+        return db.connection_pool
+
+    pool = asyncio.run(run())
+    assert pool.max_in_use <= POOL_SIZE
+    assert pool.free.qsize() == POOL_SIZE
+
+def test_merge_on_a_second_connection_would_deadlock():
+    # Guards the test above: the pre-fix shape (hold one connection, take another) does deadlock
+    async def run():
+        db = DatabaseManager()
+        db.connection_pool = StubPool(POOL_SIZE)
+
+        async def job(index):
+            uow = db.unit_of_work(f'audio-{index}')
+            try:
+                await uow._connection()
+                await asyncio.sleep(0)
+                await db.merge_session_recording('session-1', f'audio-{index}', 1, {'exercises': []})
+            finally:
+                await uow.release()
+
+        await asyncio.wait_for(asyncio.gather(*[job(index) for index in range(POOL_SIZE * 4)]), timeout=1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import vad
+from vad import best_voiced_audio, concatenate_segments, detect_speech, remap_timestamp
+
+SAMPLE_RATE = 16000
+
+def _tone(seconds, amplitude, frequency=220.0):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+@pytest.fixture
+def recording():
+    """10 s of -40 dBFS noise with a loud set at 2-3 s and a quiet one (~9 dB over the noise) at 6-7 s"""
+    rng = np.random.default_rng(0)
+    samples = (0.01 * rng.standard_normal(10 * SAMPLE_RATE)).astype(np.float32)
+    samples[2 * SAMPLE_RATE:3 * SAMPLE_RATE] += _tone(1.0, 0.3)
+    samples[6 * SAMPLE_RATE:7 * SAMPLE_RATE] += _tone(1.0, 0.04)
+    return samples
+
+def _covers(segments, start_seconds, end_seconds):
+    return any(start <= start_seconds * SAMPLE_RATE and end >= end_seconds * SAMPLE_RATE
+               for start, end in segments)
+
+def test_vad_is_off_by_default(monkeypatch):
+    monkeypatch.delenv('VAD_ENABLED', raising=False)
+    assert not vad.vad_enabled()
+
+def test_quiet_speech_is_kept(recording):
+    segments = detect_speech(recording, SAMPLE_RATE)
+
+    assert _covers(segments, 2.0, 3.0)
+    assert _covers(segments, 6.0, 7.0)
+    assert not _covers(segments, 4.0, 5.0)
+
+def test_best_voiced_audio_keeps_quiet_speech_in_time_order(recording):
+    segments = detect_speech(recording, SAMPLE_RATE)
+    chosen = best_voiced_audio(recording, segments, SAMPLE_RATE)
+
+    assert len(chosen) == sum(end - start for start, end in segments)
+    # The loud set comes first, as it did in the recording
+    assert np.abs(chosen[:len(chosen) // 2]).max() > 0.2
+
+def test_best_voiced_audio_prefers_the_loud_set_when_over_budget(recording):
+    segments = detect_speech(recording, SAMPLE_RATE)
+    chosen = best_voiced_audio(recording, segments, SAMPLE_RATE, max_seconds=1.0)
+
+    assert len(chosen) == SAMPLE_RATE
+    assert np.abs(chosen).max() > 0.2
+
+def test_timestamps_map_back_to_the_original_recording(recording):
+    segments = detect_speech(recording, SAMPLE_RATE)
+    joined, offsets = concatenate_segments(recording, segments, SAMPLE_RATE)
+    quiet_start, quiet_end = segments[-1]
+    quiet_in_buffer = offsets[-1][0]
+
+    assert len(joined) < len(recording)
+    assert remap_timestamp(0.0, offsets) == round(segments[0][0] / SAMPLE_RATE, 2)
+    assert remap_timestamp(quiet_in_buffer + 0.5, offsets) == round(quiet_start / SAMPLE_RATE + 0.5, 2)
+    assert quiet_start / SAMPLE_RATE < 6.0 < 7.0 < quiet_end / SAMPLE_RATE
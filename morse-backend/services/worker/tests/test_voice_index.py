@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from voice_index import VoiceProfileIndex
+
+DIM = 32
+
+def _unit_vectors(rng, count):
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _exact_top(vectors, probe):
+    probe = probe / np.linalg.norm(probe)
+    return int(np.argmax(vectors @ probe))
+
+@pytest.fixture
+def profiles():
+    rng = np.random.default_rng(1)
+    # Past BRUTE_FORCE_LIMIT, so searches go through the inverted lists
+    vectors = _unit_vectors(rng, 3 * VoiceProfileIndex.BRUTE_FORCE_LIMIT)
+    ids = [f'profile-{row}' for row in range(len(vectors))]
+    index = VoiceProfileIndex(dim=DIM)
+    index.build(ids, vectors)
+    assert index.centroids is not None
+    return index, ids, vectors, rng
+
+@pytest.fixture
+def verifier(monkeypatch):
+    speaker_verifier = pytest.importorskip('speaker_verifier')
+    monkeypatch.setattr(speaker_verifier.SpeakerVerifier, '_load_model', lambda self: None)
+    verifier = speaker_verifier.SpeakerVerifier()
+    verifier.embedding_dim = DIM
+    return verifier
+
+def test_small_index_scans_everything():
+    rng = np.random.default_rng(0)
+    vectors = _unit_vectors(rng, 100)
+    index = VoiceProfileIndex(dim=DIM)
+    index.build([str(row) for row in range(100)], vectors)
+
+    for probe in _unit_vectors(rng, 20):
+        assert index.search(probe)[0][0] == str(_exact_top(vectors, probe))
+
+def test_noisy_probe_finds_its_profile(profiles):
+    index, ids, vectors, rng = profiles
+    for row in rng.choice(len(vectors), 50, replace=False):
+        probe = vectors[row] + 0.05 * rng.standard_normal(DIM).astype(np.float32)
+        (profile_id, score), = index.search(probe)
+        assert profile_id == ids[_exact_top(vectors, probe)]
+        # Candidates are re-scored exactly, so the score is the true cosine similarity
+        assert score == pytest.approx(float(vectors[row] @ (probe / np.linalg.norm(probe))), abs=1e-5)
+
+def test_probing_every_list_matches_the_exact_scan(profiles):
+    index, ids, vectors, rng = profiles
+    for probe in _unit_vectors(rng, 20):
+        matches = index.search(probe, top_k=5, n_probe=len(index.centroids))
+        scores = vectors @ probe
+        expected = np.argsort(-scores, kind='stable')[:5]
+        assert [profile_id for profile_id, _ in matches] == [ids[row] for row in expected]
+
+def test_add_replace_and_remove(profiles):
+    index, ids, vectors, rng = profiles
+    replacement, new = _unit_vectors(rng, 2)
+    index.add([ids[0], 'new'], [replacement, new])
+    index.remove([ids[1]])
+
+    assert len(index) == len(ids)
+    assert ids[1] not in index
+    assert index.search(replacement)[0][0] == ids[0]
+    assert index.search(new)[0][0] == 'new'
+    assert index.search(vectors[1])[0][0] != ids[1]
+
+def test_save_and_load_round_trip(profiles, tmp_path):
+    index, ids, vectors, rng = profiles
+    path = str(tmp_path / 'voice_index.npz')
+    index.save(path, metadata={'user_ids': np.asarray(ids, dtype=str)})
+
+    loaded, metadata = VoiceProfileIndex.load(path)
+    assert loaded.ids == index.ids
+    assert loaded.n_probe == index.n_probe
+    assert loaded.trained_size == index.trained_size
+    np.testing.assert_array_equal(loaded.vectors, index.vectors[:len(index)])
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    assert list(metadata['user_ids']) == ids
+    for probe in _unit_vectors(rng, 10):
+        assert loaded.search(probe, top_k=3) == index.search(probe, top_k=3)
+
+def test_top_match_agrees_with_verify_speaker(profiles, verifier):
+    index, ids, vectors, rng = profiles
+    matrix = verifier.build_embedding_matrix(vectors)
+    for row in rng.choice(len(vectors), 20, replace=False):
+        probe = vectors[row] + 0.05 * rng.standard_normal(DIM).astype(np.float32)
+        exact = verifier.verify_speaker(probe, matrix)
+        indexed = verifier.verify_speaker_indexed(probe, index)
+        assert indexed['best_match_id'] == ids[exact['best_match_index']]
+        assert indexed['similarity_score'] == pytest.approx(exact['similarity_score'], abs=1e-5)
@@ -0,0 +1,51 @@
+from workout_parser import parse_workout, normalize_text
+
+FAST_PATH_THRESHOLD = 0.8
+
+def _exercise(workout, index=0):
+    exercise = workout['exercises'][index]
+    return exercise['exercise_name'], exercise['sets'], exercise['reps'], exercise['weight_lbs']
+
+def test_clean_transcript_is_confident():
+    workout, confidence = parse_workout("Bench press 185 pounds, 3 sets of 8 reps.")
+    assert confidence >= FAST_PATH_THRESHOLD
+    assert _exercise(workout) == ('Bench Press', 3, [8, 8, 8], [185])
+
+def test_spoken_numbers_are_normalized():
+    assert '225' in normalize_text("two twenty five")
+    workout, confidence = parse_workout("Did three sets of ten squats at two twenty five.")
+    assert confidence >= FAST_PATH_THRESHOLD
+    assert _exercise(workout) == ('Squats', 3, [10, 10, 10], [225])
+
+def test_weight_for_reps_pairs():
+    workout, _ = parse_workout("Squats 225 for 5, 245 for 3.")
+    assert _exercise(workout) == ('Squats', 2, [5, 3], [225, 245])
+
+def test_repeated_mentions_add_sets():
+    workout, confidence = parse_workout("bench press 185 5 reps then bench press 205 5 reps")
+    assert len(workout['exercises']) == 1
+    assert _exercise(workout) == ('Bench Press', 2, [5, 5], [185, 205])
+    assert confidence >= FAST_PATH_THRESHOLD
+
+def test_repeated_mentions_spread_weights_per_set():
+    workout, _ = parse_workout("bench press 3 sets of 5 at 185 pounds then bench 205 for 3")
+    assert _exercise(workout) == ('Bench Press', 4, [5, 5, 5, 3], [185, 185, 185, 205])
+
+def test_unmergeable_repeat_falls_through():
+    _, confidence = parse_workout("bench 5 sets then bench 4 sets")
+    assert confidence < FAST_PATH_THRESHOLD
+
+def test_free_form_speech_falls_through():
+    _, confidence = parse_workout(
+        "My shoulder was bugging me so I skipped overhead press and just did lateral raises with the 15s."
+    )
+    assert confidence < FAST_PATH_THRESHOLD
+
+def test_no_known_exercise():
+    assert parse_workout("felt great today, good pump") == (None, 0.0)
+    assert parse_workout("") == (None, 0.0)
+
+def test_exercise_order_follows_first_mention():
+    workout, _ = parse_workout("squat 225 3x5 then bench 185 3x8")
+    assert [exercise['exercise_name'] for exercise in workout['exercises']] == ['Squats', 'Bench Press']
+    assert [exercise['order_in_workout'] for exercise in workout['exercises']] == [1, 2]